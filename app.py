@@ -1,31 +1,50 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
-from pathlib import Path
-from src import DataLoader, TxtAgent, ImgAgent, VidAgent
-from src import ref_viz
-from src.retry import RETRY_BACKOFF, RETRY_DELAY, TASK_ATTEMPTS
-from src.traits import format_trait
+from flask import (Flask, Response, abort, jsonify, render_template, request,
+                   send_file, stream_with_context)
+from werkzeug.security import safe_join
+from src.admission import AdmissionControl, AdmissionRejected, BatchTooLarge
+from src.cancel import CancelToken
+from src.config import CONFIG
+from src.job_queue import POLL_INTERVAL, QUEUE_BACKEND, SQLiteJobQueue
+from src.jobs import (JOB_BUILDERS, JobRequestError, neopir, neopir_meta, outdir,
+                      sjts_data)
+from src.llm_cache import get_cache as get_llm_cache
+from src.media import SIZES, STATIC_MAX_AGE, derivative_for
+from src.metrics import MetricsStore, render as render_metrics
+from src.perf import snapshot as perf_snapshot
+from src.quiz_bank import BANK_FILES, DEFAULT_PAGE_SIZE, QuizBank
+from src.result_cache import PROMPT_SOURCES, ResultCache
+from src.retention import RETENTION_ENABLED, ArtifactGC
+from src.retry import TASK_ATTEMPTS
+from src.scheduler import DEFAULT_PRIORITY, TaskScheduler
+from src.task_events import TaskEvents
+from src.task_logs import TaskLogs, setup_logging
+from src.task_runner import TaskRunner
+from src.task_store import ACTIVE_STATUSES, TaskStore
+from src.warmup import WARMUP_COMPONENTS, WARMUP_ENABLED, Warmup
+from src.workspace import WORKSPACES_DIR, load_manifest
 from dotenv import load_dotenv
+from collections import Counter
 
+import hashlib
+import json
+import logging
+import os
+import queue
 import threading
 import time
-import traceback
 import uuid
 
 load_dotenv(override=True)
 
-app = Flask(__name__)
-
-# Initialize data loader
-data_loader = DataLoader()
+# Log records carry the task id and stage of the job that emitted them (see
+# src/task_logs.py); records emitted inside a task are also kept per task.
+setup_logging()
+logger = logging.getLogger(__name__)
 
-# Load metadata
-neopir_meta = data_loader.load_meta("NEO-PI-R")
-neopir = data_loader.load("NEO-PI-R", "zh")
-sjts_data = data_loader.load("PSJT-Mussel", "zh")
+app = Flask(__name__)
 
-# Output directory
-outdir = Path("./outputs")
-outdir.mkdir(exist_ok=True, parents=True)
+# Trait/item data, the output directory and the job builders live in
+# src/jobs.py so that worker processes build exactly the same jobs.
 
 
 # ---------------------------------------------------------------------------
@@ -33,135 +52,610 @@ outdir.mkdir(exist_ok=True, parents=True)
 #
 # Generation can take minutes. Running it inside the request means the work is
 # tied to the page: navigating away aborts the fetch and the result is lost.
-# Instead every generation runs in a daemon thread and the client polls for it,
-# so switching pages (or reloading) never kills a running job.
+# Instead every generation is queued and run by a background worker pool (one
+# bounded pool per modality, see `scheduler:` in config.yaml) and the client
+# follows it (SSE stream, polling as fallback), so switching pages (or
+# reloading) never kills a running job.
+#
+# With `queue.backend: sqlite` this process only queues: separate worker.py
+# processes claim the jobs from the shared task database and run them.
 # ---------------------------------------------------------------------------
 
-_tasks = {}
-_tasks_lock = threading.Lock()
-MAX_TASKS = 50
+LOCAL_QUEUE = QUEUE_BACKEND == 'local'
+
+# Task records live in SQLite (see `tasks:` in config.yaml) so queued, running
+# and finished jobs survive a restart. Jobs that were active when the previous
+# process died cannot be resumed (their callables are gone) and are marked
+# `interrupted` on startup. With worker processes, queued jobs simply wait for
+# a worker, and running ones are only interrupted when their worker stops
+# sending heartbeats.
+task_store = TaskStore()
+if LOCAL_QUEUE:
+    task_store.mark_interrupted()
+task_store.prune()
+
+# Cancel tokens of queued/running tasks, tripped by `DELETE /api/task/<id>`.
+# Cancellation is cooperative: pipelines check the token between steps,
+# retries and polls, so a call already in flight still runs to completion.
+_cancel_tokens = {}
+
+# Every status/attempt change is pushed to the SSE streams below.
+task_events = TaskEvents()
+SSE_KEEPALIVE = 15  # seconds between keep-alive comments on idle streams
 
 
 def _public_task(task):
-    """Serializable view of a task (drops the internal callable/params)."""
+    """Serializable view of a task record."""
     return {
         'task_id': task['task_id'],
         'kind': task['kind'],
         'label': task['label'],
         'status': task['status'],
-        'result': task['result'],
+        'result': task.get('result'),
         'error': task['error'],
         'created_at': task['created_at'],
+        'started_at': task.get('started_at'),
         'finished_at': task['finished_at'],
         'attempt': task.get('attempt', 1),
+        'pinned': bool(task.get('pinned')),
         'attempts': task.get('attempts', 1),
+        'progress': task.get('progress'),
+        'params': task.get('params'),
+        'parent_id': task.get('parent_id'),
+        'priority': task.get('priority'),
+        'queue_position': (scheduler.position(task['task_id'])
+                           if task['status'] == 'queued' else None),
+        'estimate': _estimate(task),
     }
 
 
-def _prune_tasks():
-    """Drop the oldest finished tasks once we exceed MAX_TASKS (caller holds lock)."""
-    finished = sorted(
-        (t for t in _tasks.values() if t['status'] != 'running'),
-        key=lambda t: t['created_at'],
-    )
-    while len(_tasks) > MAX_TASKS and finished:
-        del _tasks[finished.pop(0)['task_id']]
+def _task_headline(task):
+    """`_public_task` without the (possibly large) result payload."""
+    headline = _public_task(task)
+    headline.pop('result', None)
+    return headline
+
+
+def _publish_task(task_id):
+    task = task_store.get(task_id, with_result=False)
+    if task is None:
+        task_events.publish({'task_id': task_id, 'status': 'deleted'})
+    else:
+        task_events.publish(_task_headline(task))
+
+
+def _publish_queue(kind):
+    """Queue positions shift whenever a task leaves the queue; re-announce them."""
+    for task in task_store.list(['queued']):
+        if task['kind'] == kind:
+            task_events.publish(_task_headline(task))
+
+
+# Finished results keyed by request, model config and prompt versions: an
+# identical request is answered from here instead of rerunning the pipeline.
+result_cache = ResultCache(task_store, outdir)
+result_cache.invalidate(stale_only=True)
+
+# Retries, cancellation, batch aggregation and result caching (shared with worker.py).
+runner = TaskRunner(task_store, outdir, publish=_publish_task,
+                    on_start=lambda task: _publish_queue(task['kind']),
+                    cache=result_cache)
+_update_task = runner.update
+_refresh_batch = runner.refresh_batch
 
+# Retention and disk quota for generated artifacts (see `retention:` in
+# config.yaml): expired task workspaces are removed together with their
+# records. Only the web process collects; worker processes never delete files.
+artifact_gc = ArtifactGC(task_store, outdir)
+if RETENTION_ENABLED:
+    artifact_gc.start()
 
-def _run_task(task_id, fn, attempts=TASK_ATTEMPTS):
-    """跑一个生成任务；失败自动重来，全部尝试都失败才算错误。
+# Pipeline metrics are accumulated in memory and merged into the task store
+# periodically, so /metrics also covers stages run by worker processes.
+metrics_store = MetricsStore(task_store)
+metrics_store.start()
 
-    生成链路上每一步都依赖 LLM，偶发的格式/网关问题重跑一次基本就能过，
-    没必要让用户自己点第二次。
+# Per-task log ring buffers, merged into the task store the same way so that
+# /api/task/<id>/logs also returns what worker processes logged.
+task_logs = TaskLogs(task_store)
+task_logs.start()
+
+
+def _run_task(task_id, fn):
+    """Worker-pool entry point of the local backend."""
+    try:
+        runner.run(task_id, fn, _cancel_tokens.get(task_id))
+    finally:
+        _cancel_tokens.pop(task_id, None)
+
+
+def _watch_store():
+    """Relay changes made by worker processes to this process's SSE subscribers.
+
+    Also interrupts tasks whose worker stopped sending heartbeats.
     """
-    attempts = max(1, int(attempts))
-    wait = RETRY_DELAY
-    for attempt in range(1, attempts + 1):
+    since = time.time()
+    while True:
+        time.sleep(POLL_INTERVAL)
         try:
-            result = fn()
-            with _tasks_lock:
-                _tasks[task_id].update(
-                    status='done', result=result, finished_at=time.time())
-            return
-        except Exception as e:
-            traceback.print_exc()
-            if attempt == attempts:
-                with _tasks_lock:
-                    _tasks[task_id].update(
-                        status='error', error=str(e), finished_at=time.time())
-                return
-            with _tasks_lock:
-                label = _tasks.get(task_id, {}).get('label', task_id)
-                if task_id in _tasks:
-                    _tasks[task_id]['attempt'] = attempt + 1
-            print(f"[task] {label} 第 {attempt}/{attempts} 次失败：{e}；{wait:.0f}s 后重试")
-            time.sleep(wait)
-            wait *= RETRY_BACKOFF
-
-
-def submit_task(kind, label, fn):
-    """Start `fn` in the background and return its task id."""
+            for task in scheduler.reap_stale():
+                logger.warning('%s 的工作进程失联，已标记为 interrupted', task['task_id'])
+                if task['parent_id']:
+                    _refresh_batch(task['parent_id'])
+            changed = task_store.changed_since(since)
+            if not changed:
+                continue
+            since = changed[-1]['updated_at']
+            scheduler.invalidate()
+            for task in changed:
+                task_events.publish(_task_headline(task))
+            # A claimed task leaves the queue: everyone behind it moves up.
+            for kind in {t['kind'] for t in changed if t['status'] != 'queued'}:
+                _publish_queue(kind)
+        except Exception:  # noqa: BLE001 - keep relaying after a hiccup
+            logger.exception('Relaying task store changes failed')
+
+
+if LOCAL_QUEUE:
+    scheduler = TaskScheduler(_run_task)
+else:
+    scheduler = SQLiteJobQueue(task_store)
+    threading.Thread(target=_watch_store, name='sjt-store-watch', daemon=True).start()
+
+# Estimates start/finish times from recent run durations and queue depth, and
+# sheds load (429) once the backlog passes the `admission:` limits.
+admission = AdmissionControl(task_store, scheduler)
+
+# Opt-in warm-up (`warmup:` in config.yaml): preload models, fonts and prompt
+# templates in the background so the first jobs don't pay for them. Only the
+# process that runs jobs warms up; with the sqlite backend that is worker.py.
+warmup = Warmup(WARMUP_COMPONENTS if WARMUP_ENABLED and LOCAL_QUEUE else ())
+warmup.start()
+
+
+def _estimate(task):
+    """Start/finish estimate for an active task, None once it has ended."""
+    if task['status'] not in ACTIVE_STATUSES or task['kind'] == 'batch':
+        return None
+    position = scheduler.position(task['task_id']) if task['status'] == 'queued' else None
+    return admission.estimate(task['kind'], position, task.get('started_at'))
+
+
+def _rejected(e):
+    return (jsonify({'error': str(e), 'retry_after': e.retry_after}), 429,
+            {'Retry-After': str(e.retry_after)})
+
+
+def submit_task(kind, label, fn, params=None, parent_id=None, dedupe_key=None,
+                priority=DEFAULT_PRIORITY, client=None):
+    """Queue `fn(ctx)` on the `kind` worker pool and return its task id.
+
+    `params` (the normalized request) is kept on the record for reference;
+    `parent_id` ties the task to a batch; `dedupe_key` lets identical
+    requests find it while it is in flight. `priority` and `client` decide
+    its turn in the fair queue (see `src/scheduler.py`).
+    """
     task_id = uuid.uuid4().hex
-    with _tasks_lock:
-        _tasks[task_id] = {
-            'task_id': task_id,
-            'kind': kind,
-            'label': label,
-            'status': 'running',
-            'result': None,
-            'error': None,
-            'created_at': time.time(),
-            'finished_at': None,
-            'attempt': 1,
-            'attempts': TASK_ATTEMPTS,
-        }
-        _prune_tasks()
+    task_store.create({
+        'task_id': task_id,
+        'kind': kind,
+        'label': label,
+        'status': 'queued',
+        'created_at': time.time(),
+        'attempt': 1,
+        'attempts': TASK_ATTEMPTS,
+        'params': params,
+        'parent_id': parent_id,
+        'dedupe_key': dedupe_key,
+        'priority': priority,
+        'client': client,
+        'requesters': {client: True} if client else None,
+    })
+    if parent_id is None:
+        task_store.prune()
+
+    if LOCAL_QUEUE:
+        _cancel_tokens[task_id] = CancelToken()
+    scheduler.submit(kind, task_id, fn, priority=priority, client=client)
+    if parent_id is None:
+        # A higher-priority arrival can overtake queued tasks: re-announce all.
+        _publish_queue(kind)
+    else:
+        _publish_task(task_id)  # the batch route re-announces queues once at the end
+    return task_id
+
 
-    threading.Thread(target=_run_task, args=(task_id, fn), daemon=True).start()
+def record_cached(kind, label, spec, hit, parent_id=None, priority=DEFAULT_PRIORITY, client=None):
+    """Record a finished task whose result came from the result cache."""
+    task_id = uuid.uuid4().hex
+    now = time.time()
+    result = hit['result']
+    if isinstance(result, dict):
+        result = {**result, 'cache_hit': {'key': hit['key'], 'source_task_id': hit['task_id'],
+                                          'cached_at': hit['created_at']}}
+    task_store.create({
+        'task_id': task_id,
+        'kind': kind,
+        'label': label,
+        'status': 'done',
+        'result': result,
+        'created_at': now,
+        'started_at': now,
+        'finished_at': now,
+        'attempt': 1,
+        'attempts': 1,
+        'params': spec,
+        'parent_id': parent_id,
+        'priority': priority,
+        'client': client,
+    })
+    if parent_id is None:
+        task_store.prune()
+    _publish_task(task_id)
     return task_id
 
 
 @app.route('/api/task/<task_id>', methods=['GET'])
 def get_task(task_id):
     """Poll a single generation task."""
-    with _tasks_lock:
-        task = _tasks.get(task_id)
-        if task is None:
-            return jsonify({'error': 'Task not found', 'status': 'missing'}), 404
-        return jsonify(_public_task(task))
+    task = task_store.get(task_id)
+    if task is None:
+        return jsonify({'error': 'Task not found', 'status': 'missing'}), 404
+    return jsonify(_public_task(task))
+
+
+@app.route('/api/task/<task_id>/manifest', methods=['GET'])
+def get_task_manifest(task_id):
+    """The artifact manifest of a finished generation task.
+
+    Paths are relative to /outputs/. A task served from the result cache
+    reports the manifest of the task that actually produced the files.
+    """
+    task = task_store.get(task_id)
+    if task is None:
+        return jsonify({'error': 'Task not found'}), 404
+    result = task.get('result') if isinstance(task.get('result'), dict) else {}
+    workspace = result.get('workspace') or f'{WORKSPACES_DIR}/{task_id}'
+    manifest = load_manifest(outdir, workspace.rpartition('/')[2])
+    if manifest is None:
+        return jsonify({'error': 'No manifest for this task', 'status': task['status']}), 404
+    return jsonify(manifest)
+
+
+@app.route('/api/task/<task_id>/logs', methods=['GET'])
+def get_task_logs(task_id):
+    """Log records emitted while the task ran, oldest first.
+
+    `?after=<id>` returns only records newer than the last one seen (for
+    polling), `?level=WARNING` drops less severe records and `?limit=N` keeps
+    the newest N. Only the most recent `logs.max_records` records per task are
+    kept.
+    """
+    if task_store.get(task_id, with_result=False) is None:
+        return jsonify({'error': 'Task not found'}), 404
+    level = request.args.get('level', 'NOTSET').upper()
+    min_level = logging.getLevelNamesMapping().get(level)
+    if min_level is None:
+        return jsonify({'error': f'Unknown log level: {level!r}'}), 400
+    after = request.args.get('after', type=int)
+    logs = task_logs.get(task_id, after=after, min_level=min_level,
+                         limit=request.args.get('limit', type=int))
+    return jsonify({'task_id': task_id, 'logs': logs,
+                    'last_id': logs[-1]['id'] if logs else after})
+
+
+def cancel_task(task_id, reason='任务已取消', refresh_parent=True):
+    """Request cancellation of a queued/running task; False if it already ended.
+
+    A queued task is taken off its queue and marked `cancelled` right away; a
+    running one stops at its next checkpoint. Cancelling a batch cancels all
+    of its unfinished children.
+    """
+    task = task_store.get(task_id, with_result=False)
+    if task is None or task['status'] not in ACTIVE_STATUSES:
+        return False
+    if task['kind'] == 'batch':
+        for child in task_store.list(ACTIVE_STATUSES, parent_id=task_id):
+            cancel_task(child['task_id'], reason, refresh_parent=False)
+        _refresh_batch(task_id)
+        return True
+
+    # A cancelled task must not absorb new identical submissions. The request
+    # is also recorded for worker processes, which poll it with their heartbeat.
+    task_store.update(task_id, dedupe_key=None, cancel_requested=reason)
+    token = _cancel_tokens.get(task_id)
+    if token is not None:
+        token.cancel(reason)
+    if scheduler.remove(task_id):
+        _cancel_tokens.pop(task_id, None)
+        _update_task(task_id, status='cancelled', error=reason, finished_at=time.time())
+        _publish_queue(task['kind'])
+        if refresh_parent and task.get('parent_id'):
+            _refresh_batch(task['parent_id'])
+    return True
 
 
 @app.route('/api/task/<task_id>', methods=['DELETE'])
 def forget_task(task_id):
-    """Forget a finished task so it stops showing up in the running list."""
-    with _tasks_lock:
-        task = _tasks.get(task_id)
-        if task is None:
-            return jsonify({'error': 'Task not found'}), 404
-        if task['status'] == 'running':
-            return jsonify({'error': 'Task is still running'}), 409
-        del _tasks[task_id]
+    """Cancel an active task, or forget a finished one.
+
+    For a queued/running task this only requests cancellation (202); the
+    task ends as `cancelled` and stays listed until it is deleted again or
+    pruned. A task that identical submissions from several requesters were
+    coalesced into is only cancelled once the last of them withdraws; until
+    then the caller is detached and gets 409 with the number still waiting.
+    A finished task is removed from the store together with its workspace
+    (and, for a batch, its children's).
+    """
+    task = task_store.get(task_id, with_result=False)
+    if task is None:
+        return jsonify({'error': 'Task not found'}), 404
+    if task['status'] in ACTIVE_STATUSES:
+        others = task_store.withdraw(task_id, _request_client())
+        if others:
+            return jsonify({'error': 'Task is shared with other requesters and keeps running',
+                            'waiting': len(others)}), 409
+        cancel_task(task_id)
+        return jsonify({'success': True, 'status': 'cancelling'}), 202
+    if task.get('parent_id'):
+        # The batch manifest still lists the child; its workspace is left to
+        # the next GC pass.
+        task_store.delete(task_id)
+    else:
+        artifact_gc.remove(task_id)
+    _publish_task(task_id)
     return jsonify({'success': True})
 
 
+@app.route('/api/task/<task_id>/pin', methods=['PUT', 'DELETE'])
+def pin_task(task_id):
+    """Pin (PUT) or unpin (DELETE) a task.
+
+    Pinned tasks and their artifacts are exempt from retention pruning and
+    the disk quota; pinning a batch child keeps its whole batch.
+    """
+    pinned = request.method == 'PUT'
+    if not task_store.update(task_id, pinned=int(pinned)):
+        return jsonify({'error': 'Task not found'}), 404
+    return jsonify({'success': True, 'task_id': task_id, 'pinned': pinned})
+
+
+@app.route('/api/storage', methods=['GET'])
+def storage_usage():
+    """Disk usage of generated artifacts per modality, plus the last GC report."""
+    return jsonify(artifact_gc.usage())
+
+
+@app.route('/api/storage/gc', methods=['POST'])
+def storage_gc():
+    """Run a garbage-collection pass now and return its report."""
+    return jsonify(artifact_gc.collect())
+
+
 @app.route('/api/tasks', methods=['GET'])
 def list_tasks():
-    """List known tasks, newest first. `?status=running` filters to active ones."""
+    """List known tasks, newest first.
+
+    `?status=running` filters by status; several can be given comma-separated
+    (`?status=queued,running`). Batch children are left out unless
+    `?parent=<batch id>` asks for them. The list view only carries the
+    headline, not the result payload.
+    """
     wanted = request.args.get('status')
-    with _tasks_lock:
-        tasks = [_public_task(t) for t in _tasks.values()
-                 if wanted is None or t['status'] == wanted]
-    tasks.sort(key=lambda t: t['created_at'], reverse=True)
-    # The list view only needs the headline, not the payload.
+    wanted = wanted.split(',') if wanted else None
+    parent = request.args.get('parent')
+    tasks = [_public_task(t) for t in task_store.list(wanted, parent_id=parent, top_level=True)]
     for t in tasks:
         t.pop('result', None)
-    return jsonify({'tasks': tasks})
+    return jsonify({'tasks': tasks, 'workers': scheduler.stats()})
+
+
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    """Result-cache entries, hits and current prompt version per modality,
+    plus the LLM response cache (entries, size, and hit/miss/stored counts
+    across all processes) when it is enabled."""
+    llm_cache = get_llm_cache()
+    llm = {'mode': 'off'}
+    if llm_cache is not None:
+        metrics_store.flush()
+        lookups = {'hit': 0, 'miss': 0, 'stored': 0}
+        for name, labels, value in metrics_store.samples():
+            if name == 'sjt_llm_cache_total':
+                lookups[labels.get('result')] = lookups.get(labels.get('result'), 0) + value
+        llm = {**llm_cache.stats(), 'lookups': lookups}
+    return jsonify({'enabled': result_cache.enabled, 'kinds': result_cache.stats(), 'llm': llm})
+
+
+@app.route('/api/cache', methods=['DELETE'])
+def invalidate_cache():
+    """Drop result-cache entries.
+
+    `?kind=` limits it to one modality; `?stale=1` only drops entries made
+    with prompts that have since changed. `?kind=llm` clears the LLM
+    response cache instead.
+    """
+    kind = request.args.get('kind') or None
+    if kind == 'llm':
+        llm_cache = get_llm_cache()
+        return jsonify({'removed': llm_cache.clear() if llm_cache is not None else 0})
+    if kind is not None and kind not in PROMPT_SOURCES:
+        return jsonify({'error': f'Unknown kind: {kind}'}), 400
+    stale = request.args.get('stale', '').lower() in ('1', 'true', 'yes')
+    return jsonify({'removed': result_cache.invalidate(kind, stale_only=stale)})
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def _sse_response(stream):
+    return Response(
+        stream_with_context(stream),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@app.route('/api/task/<task_id>/events', methods=['GET'])
+def task_event_stream(task_id):
+    """Stream one task's changes as Server-Sent Events.
+
+    Sends the current state first, then an `task` event per change. The final
+    event carries the full record (including the result), followed by `end`.
+    """
+    if task_store.get(task_id, with_result=False) is None:
+        return jsonify({'error': 'Task not found', 'status': 'missing'}), 404
+
+    def stream():
+        with task_events.subscribe() as events:
+            # Read the state only after subscribing so no change slips between.
+            task = task_store.get(task_id)
+            while task is not None and task['status'] in ACTIVE_STATUSES:
+                yield _sse('task', _task_headline(task))
+                while True:
+                    try:
+                        event = events.get(timeout=SSE_KEEPALIVE)
+                    except queue.Empty:
+                        yield ': keepalive\n\n'
+                        continue
+                    if event['task_id'] == task_id:
+                        break
+                task = task_store.get(task_id) if event['status'] != 'deleted' else None
+            if task is not None:
+                yield _sse('task', _public_task(task))
+            yield _sse('end', {'task_id': task_id})
+
+    return _sse_response(stream())
+
+
+@app.route('/api/tasks/events', methods=['GET'])
+def tasks_event_stream():
+    """Multiplexed SSE stream of task headlines.
+
+    Opens with a `snapshot` of the matching tasks (`?status=` and `?parent=`
+    work as in `/api/tasks`), then sends a `task` event for every change to
+    any task, batch children included.
+    """
+    wanted = request.args.get('status')
+    wanted = wanted.split(',') if wanted else None
+    parent = request.args.get('parent')
+
+    def stream():
+        with task_events.subscribe() as events:
+            snapshot = [_task_headline(t)
+                        for t in task_store.list(wanted, parent_id=parent, top_level=True)]
+            yield _sse('snapshot', {'tasks': snapshot, 'workers': scheduler.stats()})
+            while True:
+                try:
+                    event = events.get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield _sse('task', event)
+
+    return _sse_response(stream())
+
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: 503 until the configured warm-up components are loaded."""
+    status = warmup.status()
+    failed = any(c['status'] == 'error' for c in status['components'].values())
+    if status['ready']:
+        return jsonify({'status': 'ready', **status})
+    return jsonify({'status': 'failed' if failed else 'warming', **status}), 503
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of task, queue, stage, retry, LLM and Hailuo metrics."""
+    metrics_store.flush()
+    samples = metrics_store.samples()
+    with task_store.transaction(immediate=False) as conn:
+        rows = conn.execute('SELECT kind, status, COUNT(*) FROM tasks GROUP BY kind, status').fetchall()
+    queued = Counter()
+    for kind, status, count in rows:
+        samples.append(('sjt_tasks', {'kind': kind, 'status': status}, count))
+        if status == 'queued':
+            queued[kind] += count
+    for kind in JOB_BUILDERS:
+        samples.append(('sjt_queue_depth', {'kind': kind}, queued[kind]))
+    return Response(render_metrics(samples), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/admin/perf')
+def admin_perf():
+    """Performance dashboard: stage timelines, throughput, retry hot spots, slow LLM templates."""
+    return render_template('admin_perf.html')
+
+
+@app.route('/api/admin/perf', methods=['GET'])
+def admin_perf_data():
+    """Data behind /admin/perf, aggregated from the task store and the metrics table."""
+    metrics_store.flush()
+    return jsonify(perf_snapshot(task_store, metrics_store.samples(), scheduler.stats()))
+
+
+# Databases and their journals, plus dot-directories (the GC's .trash, the
+# .derived thumbnail store) are never served, even if configured under outputs/.
+_PRIVATE_SUFFIXES = ('.sqlite3', '.sqlite', '.db')
+_SQLITE_SIDECARS = ('-wal', '-shm', '-journal')
+
+
+def _is_private(filename):
+    parts = filename.replace('\\', '/').split('/')
+    if any(part.startswith('.') for part in parts):
+        return True
+    name = parts[-1].lower()
+    for sidecar in _SQLITE_SIDECARS:
+        name = name.removesuffix(sidecar)
+    return name.endswith(_PRIVATE_SUFFIXES)
+
+
+def _send_media(root, filename, max_age):
+    """Serve a generated file with conditional GET, byte ranges and caching.
+
+    `?size=thumb|preview` (see `media.sizes` in config.yaml) returns a WebP
+    derivative of an image, made on first request if it does not exist yet;
+    other files and clients that don't accept WebP get the original.
+    `max_age=0` makes browsers revalidate (ETag/Last-Modified) on every use.
+    SQLite files and dot-directories answer 404 (see `_is_private`).
+    """
+    if _is_private(filename):
+        abort(404)
+    size = request.args.get('size')
+    if size is not None and size not in SIZES:
+        return jsonify({'error': f'Unknown size: {size!r} (expected one of {list(SIZES)})'}), 400
+    root = os.path.abspath(root)
+    path = safe_join(root, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    derived = None
+    if size and request.accept_mimetypes['image/webp']:
+        derived = derivative_for(root, filename, size)
+    # send_file marks every response no-cache unless it is given a positive max_age
+    if derived is not None:
+        response = send_file(derived, mimetype='image/webp', conditional=True, max_age=max_age)
+    else:
+        response = send_file(path, conditional=True, max_age=max_age)
+    if size:
+        response.vary.add('Accept')
+    return response
 
 
 @app.route('/outputs/<path:filename>')
 def serve_output_file(filename):
     """Serve files from the outputs directory"""
-    return send_from_directory(outdir, filename)
+    # Regenerating an item overwrites its files, so always revalidate.
+    return _send_media(outdir, filename, max_age=0)
 
 
 @app.route('/')
@@ -229,224 +723,306 @@ def video_sjt():
     return render_template('video_sjt.html', traits=available_traits)
 
 
+# Pre-generated item bank shown on /quiz: parsed once, re-read when the files change.
+quiz_bank = QuizBank('./generated')
+
+
 @app.route('/quiz')
 def quiz():
-    """Quiz display page for generated content"""
-    import json
-    generated_dir = Path("./generated")
-    
-    sjt_data = {}
-    for json_file in ['sjt_txt.json', 'sjt_img.json', 'sjt_vid.json']:
-        file_path = generated_dir / json_file
-        if file_path.exists():
-            with open(file_path, 'r', encoding='utf-8') as f:
-                sjt_type = json_file.replace('sjt_', '').replace('.json', '')
-                sjt_data[sjt_type] = json.load(f)
-    
-    return render_template('quiz.html', sjt_data=sjt_data)
+    """Quiz display page for generated content (items are fetched from /api/quiz)"""
+    return render_template('quiz.html', modalities=quiz_bank.modalities())
+
+
+def _bad_modality():
+    return jsonify({'error': f"Unknown modality: {request.args.get('modality')!r} "
+                             f"(expected one of {list(BANK_FILES)})"}), 400
+
+
+@app.route('/api/quiz', methods=['GET'])
+def quiz_page():
+    """One page of the generated item bank.
+
+    Query: `modality` (txt/img/vid, required), `trait` (optional), `limit`
+    (default 20, max 100) and `cursor` (the previous page's `next_cursor`).
+    """
+    modality = request.args.get('modality')
+    if modality not in BANK_FILES:
+        return _bad_modality()
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify(quiz_bank.page(modality, trait=request.args.get('trait') or None,
+                                  cursor=request.args.get('cursor') or None, limit=limit))
+
+
+@app.route('/api/quiz/traits', methods=['GET'])
+def quiz_traits():
+    """Item counts per trait for one modality of the generated bank."""
+    modality = request.args.get('modality')
+    if modality not in BANK_FILES:
+        return _bad_modality()
+    return jsonify(quiz_bank.traits(modality))
 
 
 @app.route('/generated/<path:filename>')
 def serve_generated_file(filename):
     """Serve files from the generated directory"""
-    return send_from_directory('./generated', filename)
+    # The pre-generated bank does not change: let browsers keep it.
+    return _send_media('./generated', filename, max_age=STATIC_MAX_AGE)
 
 
-@app.route('/api/generate/text', methods=['POST'])
-def generate_text():
-    """Kick off text SJT generation in the background"""
-    try:
-        data = request.json
-        trait_id = data.get('trait_id')
-        item_id = data.get('item_id')
-        situation_theme = data.get('situation_theme', '大学生活')
-        target_population = data.get('target_population', '中国大学生')
-        n_items = data.get('n_items', 1)
-
-        if not trait_id or not item_id:
-            return jsonify({'error': 'Missing trait_id or item_id'}), 400
-
-        # Get trait info
-        trait_meta = neopir_meta[trait_id]
-        item_text = neopir[trait_id]['items'][item_id]['item']
-
-        def job():
-            # Initialize agent
-            txt_agent = TxtAgent(
-                situation_theme=situation_theme,
-                target_population=target_population,
-            )
-
-            # Generate SJT
-            result = txt_agent.run(
-                trait_name=trait_meta['facet_name'],
-                trait_description=trait_meta['description'],
-                low_score=trait_meta['low_score'],
-                high_score=trait_meta['high_score'],
-                item=item_text,
-                n_item=n_items,
-                outdir=outdir,
-                out_basename=f"SJT_{trait_id}_{item_id}"
-            )
-
-            # Handle different result structures
-            if isinstance(result, dict):
-                result_data = result.get('items', result)
-            else:
-                result_data = result
+# Identical generation requests share one task: a submission whose spec
+# matches a queued/running task attaches to it instead of paying for the same
+# pipeline twice (and racing it on the same output basename). Clients may also
+# send an `Idempotency-Key` header to make retries of a submission safe.
+_submit_lock = threading.Lock()
 
-            # Ensure result_data is a list
-            if not isinstance(result_data, list):
-                result_data = [result_data] if result_data else []
 
-            return {
-                'success': True,
-                'result': result_data,
-                'output_file': f"SJT_{trait_id}_{item_id}.json"
-            }
+def _fingerprint(kind, spec):
+    payload = json.dumps([kind, spec], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
 
-        task_id = submit_task('text', f"文字题目 {trait_id}-{item_id}", job)
-        return jsonify({'success': True, 'task_id': task_id, 'status': 'running'}), 202
 
+def _request_priority():
+    """Priority class from the `X-Priority` header.
+
+    The pages send `interactive`; API callers default to
+    `scheduler.default_priority` in config.yaml.
+    """
+    priority = request.headers.get('X-Priority') or DEFAULT_PRIORITY
+    if priority not in scheduler.priorities:
+        raise JobRequestError(f'Unknown priority: {priority}')
+    return priority
+
+
+def _request_client():
+    """Submitter identity for round-robin within a priority class."""
+    return request.headers.get('X-Client-Id') or request.remote_addr or 'anonymous'
+
+
+def _accepted(task_id, **extra):
+    task = task_store.get(task_id, with_result=False)
+    return jsonify({'success': True, 'task_id': task_id, 'status': task['status'],
+                    'queue_position': scheduler.position(task_id),
+                    'estimate': _estimate(task),
+                    'events': f'/api/task/{task_id}/events', **extra}), 202
+
+
+def _cached(task_id):
+    """Response for a submission answered from the result cache."""
+    task = task_store.get(task_id)
+    return jsonify({'success': True, 'task_id': task_id, 'status': task['status'],
+                    'cached': True, 'result': task['result'],
+                    'events': f'/api/task/{task_id}/events'})
+
+
+def _submit_generate(kind):
+    """Shared body of the /api/generate/<kind> routes.
+
+    A request identical to an earlier successful one (same spec, model config
+    and prompt versions) is answered from the result cache with 200 unless
+    it sends `force: true`.
+    """
+    try:
+        data = request.json or {}
+        label, job, spec = JOB_BUILDERS[kind](data)
+        priority, client = _request_priority(), _request_client()
+        fingerprint = _fingerprint(kind, spec)
+        idem_key = request.headers.get('Idempotency-Key')
+        idem_key = f"{kind}:{idem_key}" if idem_key else None
+
+        with _submit_lock:
+            if idem_key:
+                known = task_store.lookup_key(idem_key)
+                if known is not None:
+                    task_id, known_fingerprint = known
+                    if known_fingerprint != fingerprint:
+                        return jsonify({'error': 'Idempotency-Key was already used '
+                                                 'with different parameters'}), 422
+                    return _accepted(task_id, deduplicated='idempotency_key')
+
+            hit = None if data.get('force') else result_cache.get(kind, spec)
+            if hit is not None:
+                task_id = record_cached(kind, label, spec, hit, priority=priority, client=client)
+                if idem_key:
+                    task_store.remember_key(idem_key, task_id, fingerprint)
+                return _cached(task_id)
+
+            existing = task_store.find_active(fingerprint)
+            if existing is not None:
+                task_id, deduplicated = existing['task_id'], 'in_flight'
+                task_store.attach(task_id, client)
+                # An interactive request must not wait behind the bulk job it joined.
+                if scheduler.reprioritize(task_id, priority, client):
+                    _update_task(task_id, priority=priority, client=client)
+                    _publish_queue(kind)
+            else:
+                admission.admit(kind, priority, client)
+                task_id, deduplicated = submit_task(
+                    kind, label, job, params=spec, dedupe_key=fingerprint,
+                    priority=priority, client=client), None
+            if idem_key:
+                task_store.remember_key(idem_key, task_id, fingerprint)
+
+        if deduplicated:
+            return _accepted(task_id, deduplicated=deduplicated)
+        return _accepted(task_id)
+
+    except JobRequestError as e:
+        return jsonify({'error': str(e)}), e.status
+    except AdmissionRejected as e:
+        return _rejected(e)
     except KeyError as e:
         return jsonify({'error': f'Invalid trait_id or item_id: {str(e)}'}), 400
     except Exception as e:
-        traceback.print_exc()
+        logger.exception('Submitting a %s job failed', kind)
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/generate/text', methods=['POST'])
+def generate_text():
+    """Kick off text SJT generation in the background"""
+    return _submit_generate('text')
+
+
 @app.route('/api/generate/image', methods=['POST'])
 def generate_image():
     """Kick off image SJT generation in the background"""
-    try:
-        data = request.json
-        trait_id = data.get('trait_id')
-        item_id = data.get('item_id')
-        ref_character = data.get('ref_character', 'male')
-        run_bubble = data.get('run_bubble', True)
-
-        if not trait_id or not item_id:
-            return jsonify({'error': 'Missing trait_id or item_id'}), 400
-
-        # Get trait info
-        trait_meta = neopir_meta[trait_id]
-
-        # Get SJT situation data
-        if trait_id not in sjts_data or item_id not in sjts_data[trait_id]:
-            return jsonify({'error': 'SJT situation not found for this trait/item'}), 404
-
-        basename = f"SJT_{trait_id}_{item_id}"
-
-        def job():
-            # Initialize agent
-            img_agent = ImgAgent(
-                situ=sjts_data[trait_id][item_id],
-                # 提示词以大五维度为框架，只给面名称（如「价值观」）时模型会拒答，
-                # 所以补上所属维度。
-                trait=format_trait(trait_id, trait_meta),
-                ref_viz=ref_viz.get(ref_character, ref_viz['male'])
-            )
-
-            # Generate image SJT
-            result = img_agent.run(
-                run_bubble=run_bubble,
-                outdir=str(outdir),
-                out_basename=basename
-            )
-
-            # Extract image files from result
-            image_files = []
-
-            # Get the situation image from result
-            if result and 'situation' in result:
-                situation_path = Path(result['situation'])
-                if situation_path.exists():
-                    # Extract just the filename relative to outdir
-                    image_files.append(situation_path.name)
-
-            return {
-                'success': True,
-                'result': result,
-                'output_file': basename,
-                'image_files': image_files,  # List of generated image files
-                'has_images': len(image_files) > 0
-            }
-
-        task_id = submit_task('image', f"图片题目 {trait_id}-{item_id}", job)
-        return jsonify({'success': True, 'task_id': task_id, 'status': 'running'}), 202
-
-    except KeyError as e:
-        return jsonify({'error': f'Invalid trait_id or item_id: {str(e)}'}), 400
-    except Exception as e:
-        traceback.print_exc()
-        return jsonify({'error': str(e)}), 500
+    return _submit_generate('image')
 
 
 @app.route('/api/generate/video', methods=['POST'])
 def generate_video():
     """Kick off video SJT generation in the background"""
-    try:
-        data = request.json
-        trait_id = data.get('trait_id')
-        item_id = data.get('item_id')
-
-        if not trait_id or not item_id:
-            return jsonify({'error': 'Missing trait_id or item_id'}), 400
-
-        # Get trait info
-        trait_meta = neopir_meta[trait_id]
-
-        # Get SJT situation data
-        if trait_id not in sjts_data or item_id not in sjts_data[trait_id]:
-            return jsonify({'error': 'SJT situation not found for this trait/item'}), 404
-
-        basename = f"SJT_{trait_id}_{item_id}"
-
-        def job():
-            # Initialize agent
-            vid_agent = VidAgent(
-                situ=sjts_data[trait_id][item_id],
-                # 同图像流程：反思智能体按大五维度对齐构念，需要维度信息
-                trait=format_trait(trait_id, trait_meta),
-            )
-
-            # Generate video SJT
-            result = vid_agent.run(
-                outdir=outdir,
-                out_basename=basename
-            )
-
-            # Find generated video files
-            video_files = []
-            for ext in ['.mp4', '.avi', '.mov', '.webm']:
-                vid_path = outdir / f"{basename}{ext}"
-                if vid_path.exists():
-                    video_files.append(f"{basename}{ext}")
-
-            # Also check for numbered files
-            for file in outdir.glob(f"{basename}_*.mp4"):
-                video_files.append(file.name)
-            for file in outdir.glob(f"{basename}_*.avi"):
-                video_files.append(file.name)
-            for file in outdir.glob(f"{basename}_*.mov"):
-                video_files.append(file.name)
-
-            return {
-                'success': True,
-                'result': result,
-                'output_file': basename,
-                'video_files': video_files,  # List of generated video files
-                'has_videos': len(video_files) > 0
-            }
-
-        task_id = submit_task('video', f"视频题目 {trait_id}-{item_id}", job)
-        return jsonify({'success': True, 'task_id': task_id, 'status': 'running'}), 202
+    return _submit_generate('video')
 
-    except KeyError as e:
-        return jsonify({'error': f'Invalid trait_id or item_id: {str(e)}'}), 400
-    except Exception as e:
-        traceback.print_exc()
-        return jsonify({'error': str(e)}), 500
+
+# ---------------------------------------------------------------------------
+# Batch generation
+#
+# A batch is a parent task that never occupies a worker itself: it fans out
+# one child task per (modality, trait, item) on the regular worker pools, so
+# the per-modality limits still apply. The parent's progress and result are
+# refreshed whenever a child finishes; once all are done the result becomes
+# the combined manifest (also written to outputs/batch_<id>.json).
+# ---------------------------------------------------------------------------
+
+_BATCH_CFG = CONFIG.get('batch', {}) or {}
+BATCH_MAX_CHILDREN = int(_BATCH_CFG.get('max_children', 500))
+
+
+def _available_items(kind, trait_id):
+    """Item ids a modality can generate for `trait_id` (scale items / SJT situations)."""
+    if kind == 'text':
+        return list(neopir.get(trait_id, {}).get('items', {}))
+    return list(sjts_data.get(trait_id, {}))
+
+
+@app.route('/api/generate/batch', methods=['POST'])
+def generate_batch():
+    """Queue a trait × item × modality matrix as one batch task.
+
+    Body: `trait_ids` (list), `item_ids` (list, optional — defaults to every
+    item the modality has for each trait), `modalities` (subset of
+    text/image/video, default text) and `params` (options shared by all
+    children, e.g. `situation_theme` or `ref_character`). Combinations that
+    do not exist are reported under `skipped` instead of failing the batch.
+    Children whose result is in the result cache finish immediately unless
+    the body sets `force: true`.
+    Children always run at the default (bulk) priority, round-robined with
+    other clients' work.
+    """
+    data = request.json or {}
+    client = _request_client()
+    trait_ids = data.get('trait_ids') or []
+    item_ids = data.get('item_ids')
+    modalities = data.get('modalities') or ['text']
+    shared = data.get('params') or {}
+
+    if not trait_ids:
+        return jsonify({'error': 'Missing trait_ids'}), 400
+    unknown = [m for m in modalities if m not in JOB_BUILDERS]
+    if unknown:
+        return jsonify({'error': f'Unknown modalities: {unknown}'}), 400
+
+    children, skipped = [], []
+    for kind in modalities:
+        for trait_id in trait_ids:
+            for item_id in (item_ids or _available_items(kind, trait_id)):
+                params = {**shared, 'trait_id': trait_id, 'item_id': str(item_id)}
+                try:
+                    label, job, spec = JOB_BUILDERS[kind](params)
+                except (JobRequestError, KeyError) as e:
+                    skipped.append({'modality': kind, 'trait_id': trait_id,
+                                    'item_id': str(item_id), 'error': str(e)})
+                    continue
+                children.append((kind, label, job, spec))
+
+    if not children:
+        return jsonify({'error': 'Nothing to generate', 'skipped': skipped}), 400
+    if len(children) > BATCH_MAX_CHILDREN:
+        return jsonify({'error': f'Batch too large: {len(children)} jobs '
+                                 f'(limit {BATCH_MAX_CHILDREN})'}), 400
+
+    fingerprint = _fingerprint('batch', data)
+    idem_key = request.headers.get('Idempotency-Key')
+    idem_key = f"batch:{idem_key}" if idem_key else None
+
+    with _submit_lock:
+        if idem_key:
+            known = task_store.lookup_key(idem_key)
+            if known is not None:
+                known_id, known_fingerprint = known
+                if known_fingerprint != fingerprint:
+                    return jsonify({'error': 'Idempotency-Key was already used '
+                                             'with different parameters'}), 422
+                return _accepted(known_id, deduplicated='idempotency_key')
+
+        hits = {}
+        if not data.get('force'):
+            for i, (kind, _, _, spec) in enumerate(children):
+                hit = result_cache.get(kind, spec)
+                if hit is not None:
+                    hits[i] = hit
+        try:
+            estimate = admission.admit_batch(
+                Counter(kind for i, (kind, *_) in enumerate(children) if i not in hits))
+        except AdmissionRejected as e:
+            return _rejected(e)
+        except BatchTooLarge as e:
+            return jsonify({'error': str(e)}), 400
+
+        batch_id = uuid.uuid4().hex
+        now = time.time()
+        task_store.create({
+            'task_id': batch_id,
+            'kind': 'batch',
+            'label': f"批量生成 {len(children)} 题（{'/'.join(modalities)}）",
+            'status': 'running',
+            'created_at': now,
+            'started_at': now,
+            'attempt': 1,
+            'attempts': 1,
+            'params': data,
+        })
+        if idem_key:
+            task_store.remember_key(idem_key, batch_id, fingerprint)
+    task_store.prune()
+    for i, (kind, label, job, spec) in enumerate(children):
+        if i in hits:
+            record_cached(kind, label, spec, hits[i], parent_id=batch_id, client=client)
+        else:
+            submit_task(kind, label, job, params=spec, parent_id=batch_id,
+                        priority=DEFAULT_PRIORITY, client=client)
+    for kind in modalities:
+        _publish_queue(kind)
+    _refresh_batch(batch_id)
+
+    return jsonify({'success': True, 'task_id': batch_id, 'status': 'running',
+                    'children': len(children), 'cached': len(hits), 'skipped': skipped,
+                    'estimate': estimate,
+                    'events': f'/api/task/{batch_id}/events'}), 202
 
 
 if __name__ == '__main__':
@@ -0,0 +1,81 @@
+"""冷启动导入耗时基准。
+
+每个目标在全新的解释器里导入若干次，报告墙钟时间的中位数，并用 `-X importtime`
+按顶层包汇总导入耗时，方便确认只跑文字题的路径不再连带加载图像/视频依赖::
+
+    uv run python benchmarks/import_time.py
+    uv run python benchmarks/import_time.py --repeat 10 --top 15
+    uv run python benchmarks/import_time.py --target "from src import TxtAgent"
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+TARGETS = (
+    'import app',
+    'import src',
+    'from src import TxtAgent',
+    'from src import ImgAgent',
+    'from src import VidAgent',
+)
+
+# -X importtime 的输出行：import time: self [us] | cumulative | imported package
+_IMPORTTIME = re.compile(r'^import time:\s+(\d+)\s+\|\s+\d+\s+\|\s*(\S+)')
+
+
+def _run(code, importtime=False):
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    cmd += ['-c', code]
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+    return time.perf_counter() - start, proc
+
+
+def _slowest(stderr, top):
+    """按顶层包汇总各模块自身的导入耗时，返回最慢的 `top` 个 (微秒, 包名)。"""
+    totals = {}
+    for line in stderr.splitlines():
+        m = _IMPORTTIME.match(line)
+        if m:
+            package = m.group(2).split('.')[0]
+            totals[package] = totals.get(package, 0) + int(m.group(1))
+    return sorted(((us, p) for p, us in totals.items()), reverse=True)[:top]
+
+
+def bench(code, repeat, top):
+    elapsed, proc = _run(code)
+    if proc.returncode != 0:
+        error = (proc.stderr.strip().splitlines() or ['?'])[-1]
+        print(f'{code!r}: failed ({error})')
+        return
+    times = [elapsed] + [_run(code)[0] for _ in range(repeat - 1)]
+    print(f'{code!r}: median {statistics.median(times) * 1000:.0f} ms, '
+          f'min {min(times) * 1000:.0f} ms over {repeat} runs')
+    if top > 0:
+        _, proc = _run(code, importtime=True)
+        for us, package in _slowest(proc.stderr, top):
+            print(f'    {us / 1000:8.1f} ms  {package}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure cold-start import time in fresh interpreters.')
+    parser.add_argument('--target', action='append',
+                        help='statement to time (repeatable; default: app and each src agent)')
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per target')
+    parser.add_argument('--top', type=int, default=10,
+                        help='slowest top-level packages to list per target (0 to skip)')
+    args = parser.parse_args(argv)
+    for code in args.target or TARGETS:
+        bench(code, max(1, args.repeat), args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""LLM 调用通路的吞吐基准：`asyncio.to_thread(llm.call)` 对比原生异步的 `llm.acall`。
+
+在子进程里起一个假的 OpenAI 兼容接口（`POST /v1/chat/completions`，按给定耗时分布
+睡眠后返回一段 JSON），用真实的提示词模块建 `TemplateLLM` 指过去；两条通路都跑在
+共享事件循环（src/async_runtime.py）上，每级并发持续压若干秒，报告稳定的每秒调用
+数、延迟分位数和本进程的线程数峰值。线程通路的并发上限是线程池大小
+（`async_runtime.executor_workers`），异步通路只受连接池（`async_llm:` 段）限制::
+
+    uv run python benchmarks/llm_async.py
+    uv run python benchmarks/llm_async.py --concurrency 32,128,512 --latency lognormal:1:0.5
+    uv run python benchmarks/llm_async.py --paths async --duration 20 --json llm.json
+
+假接口只说 HTTP/1.1，测的是长连接复用与并发上限的差别；HTTP/2 的多路
+复用要对着真实网关才测得到。耗时分布的写法同 load_test.py：`const:S`、
+`uniform:A:B`、`exp:MEAN`、`lognormal:MEDIAN:SIGMA`（单位秒）。
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+PATHS = ('async', 'thread')
+TEMPLATE = os.path.join(ROOT, 'src', 'txt', 'workflow', 'prompts', 'trait_polisher.py')
+
+
+def parse_distribution(spec):
+    """`lognormal:1:0.5` 这样的写法 -> 无参的采样函数。"""
+    name, *args = spec.split(':')
+    try:
+        args = [float(a) for a in args]
+        if name == 'const' and len(args) == 1:
+            return lambda: args[0]
+        if name == 'uniform' and len(args) == 2:
+            return lambda: random.uniform(*args)
+        if name == 'exp' and len(args) == 1:
+            return lambda: random.expovariate(1 / args[0])
+        if name == 'lognormal' and len(args) == 2:
+            return lambda: random.lognormvariate(math.log(args[0]), args[1])
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f'bad latency distribution: {spec!r}')
+
+
+# ---- 假接口 ----
+
+def serve(port, latency):
+    """最小的 HTTP/1.1 长连接服务（asyncio），每个请求睡够耗时后返回同一段 JSON。
+
+    不用 http.server：它每条连接一个线程，几百并发时假接口自己就先成了瓶颈。
+    """
+    sample = parse_distribution(latency)
+    body = json.dumps({
+        'id': 'chatcmpl-bench',
+        'object': 'chat.completion',
+        'created': 0,
+        'model': 'bench',
+        'choices': [{
+            'index': 0,
+            'finish_reason': 'stop',
+            'message': {'role': 'assistant', 'content': json.dumps({'low_score': '低', 'high_score': '高'})},
+        }],
+        'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2},
+    }).encode()
+    response = (b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                b'Content-Length: %d\r\n\r\n' % len(body)) + body
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = 0
+                for line in head.split(b'\r\n')[1:]:
+                    name, _, value = line.partition(b':')
+                    if name.strip().lower() == b'content-length':
+                        length = int(value)
+                await reader.readexactly(length)
+                await asyncio.sleep(max(0.0, sample()))
+                writer.write(response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def main():
+        server = await asyncio.start_server(handle, '127.0.0.1', port, backlog=1024)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_port(port, timeout=10):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f'fake API did not start on port {port}')
+
+
+# ---- 压测 ----
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def _step(call, concurrency, duration):
+    latencies, errors = [], 0
+    stop_at = time.monotonic() + duration
+    peak_threads = threading.active_count()
+
+    async def user():
+        nonlocal errors, peak_threads
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            try:
+                await call()
+            except Exception:  # noqa: BLE001
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+            peak_threads = max(peak_threads, threading.active_count())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        'concurrency': concurrency,
+        'calls': len(latencies),
+        'errors': errors,
+        'calls_per_s': len(latencies) / elapsed,
+        'p50': _percentile(latencies, 0.5),
+        'p95': _percentile(latencies, 0.95),
+        'p99': _percentile(latencies, 0.99),
+        'peak_threads': peak_threads,
+    }
+
+
+def bench(args):
+    from lmitf import TemplateLLM
+
+    from src import async_runtime
+    from src.metrics import instrument_llm
+
+    port = _free_port()
+    server = subprocess.Popen([sys.executable, __file__, '--role', 'server', '--port', str(port),
+                               '--latency', args.latency])
+    try:
+        _wait_port(port)
+        base_url = f'http://127.0.0.1:{port}/v1'
+        llm = instrument_llm(TemplateLLM(TEMPLATE, api_key='sk-bench', base_url=base_url), 'bench')
+        variables = {name: name for name in llm.variables}
+        runtime = async_runtime.get_runtime()
+        print(f'fake API: {base_url} (latency {args.latency}); '
+              f'thread pool: {runtime.executor._max_workers} workers')
+
+        calls = {
+            'thread': lambda: asyncio.to_thread(llm.call, response_format='json', model='bench', **variables),
+            'async': lambda: llm.acall(response_format='json', model='bench', **variables),
+        }
+        results = {}
+        for path in args.paths:
+            results[path] = []
+            runtime.run(_step(calls[path], min(args.concurrency), min(2.0, args.duration)))  # 预热连接池
+            for concurrency in args.concurrency:
+                row = runtime.run(_step(calls[path], concurrency, args.duration))
+                results[path].append(row)
+                print(f'{path:>6} x{concurrency:<4} {row["calls_per_s"]:8.1f} calls/s  '
+                      f'p50 {row["p50"] or 0:.3f}s  p95 {row["p95"] or 0:.3f}s  p99 {row["p99"] or 0:.3f}s  '
+                      f'errors {row["errors"]}  threads {row["peak_threads"]}')
+    finally:
+        server.terminate()
+        server.wait()
+
+    if len(args.paths) == 2:
+        for thread_row, async_row in zip(results['thread'], results['async']):
+            ratio = async_row['calls_per_s'] / thread_row['calls_per_s'] if thread_row['calls_per_s'] else math.inf
+            print(f'x{thread_row["concurrency"]:<4} async / thread: {ratio:.2f}x')
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'latency': args.latency, 'results': results}, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare LLM calls/s: to_thread(llm.call) vs native async acall.')
+    parser.add_argument('--concurrency', default='16,64,256',
+                        help='comma-separated numbers of concurrent callers, one step each')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per step')
+    parser.add_argument('--latency', default='lognormal:1:0.3', help='fake API latency distribution')
+    parser.add_argument('--paths', default=','.join(PATHS), help='which call paths to run')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--role', choices=('server',), help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    parse_distribution(args.latency)
+    if args.role == 'server':
+        serve(args.port, args.latency)
+        return
+    args.concurrency = [int(n) for n in args.concurrency.split(',') if n.strip()]
+    args.paths = [p for p in args.paths.split(',') if p.strip()]
+    unknown = set(args.paths) - set(PATHS)
+    if unknown or not args.paths or not args.concurrency:
+        parser.error(f'--paths must be a subset of {PATHS} and --concurrency non-empty')
+    bench(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,487 @@
+"""网页接口的压测：用假的生成后端测调度器与 API 能扛住多少并发。
+
+在子进程里启动 app.py（临时目录作工作目录，任务库与产物都不碰 outputs/），
+`TxtAgent`/`ImgAgent`/`VidAgent` 换成按给定耗时分布睡眠、分阶段上报进度并写一个
+产物文件的替身；再用若干个虚拟用户模拟网页的「提交 → 每秒轮询直到结束」。用户数
+可以给一串，逐级加压，看吞吐在哪一级不再增长、延迟从哪一级开始飙升::
+
+    uv run python benchmarks/load_test.py
+    uv run python benchmarks/load_test.py --users 10,50,100 --duration 30
+    uv run python benchmarks/load_test.py --latency text=lognormal:2:0.5 --latency video=const:8 \\
+        --mix text=6,image=3,video=1 --error-rate 0.05 --json load.json
+    uv run python benchmarks/load_test.py --backend sqlite --worker-procs 2
+
+每一级报告提交/轮询的吞吐与延迟分位数、HTTP 错误与 429（准入控制拒绝）次数、任务
+从提交到结束的耗时，以及服务进程（含工作进程）的线程数与常驻内存峰值（读 /proc，
+仅 Linux）。耗时分布的写法：`const:S`、`uniform:A:B`、`exp:MEAN`、
+`lognormal:MEDIAN:SIGMA`（单位秒）。
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+KINDS = ('text', 'image', 'video')
+ENV_SETTINGS = 'SJT_LOADTEST'
+TERMINAL = ('done', 'error', 'cancelled', 'interrupted')
+
+DEFAULT_LATENCY = {
+    'text': 'lognormal:1:0.5',
+    'image': 'lognormal:3:0.5',
+    'video': 'lognormal:6:0.5',
+}
+
+
+# ---- 耗时分布 ----
+
+def parse_distribution(spec):
+    """把 `lognormal:2:0.5` 这类写法变成无参的采样函数（返回秒数）。"""
+    name, *params = spec.split(':')
+    try:
+        params = [float(p) for p in params]
+        if name == 'const' and len(params) == 1:
+            value = params[0]
+            return lambda: value
+        if name == 'uniform' and len(params) == 2:
+            low, high = params
+            return lambda: random.uniform(low, high)
+        if name == 'exp' and len(params) == 1:
+            mean = params[0]
+            return lambda: random.expovariate(1 / mean) if mean > 0 else 0.0
+        if name == 'lognormal' and len(params) == 2:
+            median, sigma = params
+            return lambda: random.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+    except (ValueError, ZeroDivisionError):
+        pass
+    raise argparse.ArgumentTypeError(f'bad latency distribution: {spec!r}')
+
+
+def _parse_pairs(spec, cast):
+    out = {}
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        key, _, value = part.partition('=')
+        out[key.strip()] = cast(value)
+    return out
+
+
+# ---- 子进程：带替身后端的服务 / 工作进程 ----
+
+def _install_stubs(settings):
+    """在导入 app/worker 之前替换生成后端并改写配置。"""
+    sys.path.insert(0, ROOT)
+    import src
+    from src.cancel import sleep
+    from src.config import CONFIG
+    from src.progress import stage
+
+    latency = {kind: parse_distribution(spec) for kind, spec in settings['latency'].items()}
+    stages = max(1, settings['stages'])
+    error_rate = settings['error_rate']
+
+    class StubAgent:
+        """生成后端的替身：睡一段按分布抽取的时间（分几个阶段上报），写一个产物文件。"""
+
+        kind = None
+
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+
+        def run(self, outdir=None, out_basename='stub', on_progress=None, cancel=None, **kwargs):
+            total = latency[self.kind]()
+            for i in range(stages):
+                with stage(on_progress, f'stub {i + 1}/{stages}', i + 1, stages):
+                    sleep(total / stages, cancel)
+            if random.random() < error_rate:
+                raise RuntimeError('stub backend failure')
+            result = {'items': [{'situation': 'stub', 'options': {}}], 'stub_seconds': total}
+            if outdir is not None:
+                with open(os.path.join(str(outdir), f'{out_basename}.json'), 'w', encoding='utf-8') as f:
+                    json.dump(result, f)
+            return result
+
+    src.TxtAgent = type('TxtAgent', (StubAgent,), {'kind': 'text'})
+    src.ImgAgent = type('ImgAgent', (StubAgent,), {'kind': 'image'})
+    src.VidAgent = type('VidAgent', (StubAgent,), {'kind': 'video'})
+    src.ref_viz = {'male': None, 'female': None}
+
+    CONFIG['warmup'] = {'enabled': False}
+    CONFIG['queue'] = {**(CONFIG.get('queue') or {}), 'backend': settings['backend']}
+    if settings['workers']:
+        scheduler = CONFIG.setdefault('scheduler', {})
+        scheduler['workers'] = {**(scheduler.get('workers') or {}), **settings['workers']}
+
+
+def _serve(port):
+    settings = json.loads(os.environ[ENV_SETTINGS])
+    _install_stubs(settings)
+    from werkzeug.serving import make_server
+
+    import app
+    server = make_server('127.0.0.1', port, app.app, threaded=True)
+    print(f'serving on {port}', flush=True)
+    server.serve_forever()
+
+
+def _work():
+    settings = json.loads(os.environ[ENV_SETTINGS])
+    _install_stubs(settings)
+    import worker
+    argv = []
+    if settings['workers']:
+        argv = ['--workers', ','.join(f'{k}={v}' for k, v in settings['workers'].items())]
+    worker.main(argv)
+
+
+# ---- 进程资源 ----
+
+def _proc_status(pid):
+    """(线程数, 常驻内存字节数)；读不到（非 Linux、进程已退出）时返回 None。"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        return int(fields['Threads']), int(fields['VmRSS'].split()[0]) * 1024
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+class ResourceSampler:
+    """每隔 `interval` 秒记一次各进程线程数与内存之和。"""
+
+    def __init__(self, pids, interval=0.5):
+        self.pids = pids
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            status = [s for s in map(_proc_status, self.pids) if s is not None]
+            if status:
+                self.samples.append((sum(s[0] for s in status), sum(s[1] for s in status)))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self):
+        if not self.samples:
+            return {}
+        threads = [s[0] for s in self.samples]
+        rss = [s[1] for s in self.samples]
+        return {'threads_max': max(threads), 'threads_last': threads[-1],
+                'rss_max_mb': max(rss) / 2**20, 'rss_last_mb': rss[-1] / 2**20}
+
+
+# ---- 负载 ----
+
+class Stats:
+    """各接口的响应时间与状态码、各任务的端到端耗时；线程安全。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}                 # 接口 -> [秒]
+        self.codes = Counter()            # (接口, 状态码)
+        self.task_seconds = {}            # 模态 -> [提交到结束的秒数]
+        self.outcomes = Counter()         # (模态, 结束状态)
+
+    def request(self, endpoint, status, seconds):
+        with self._lock:
+            self.latency.setdefault(endpoint, []).append(seconds)
+            self.codes[endpoint, status] += 1
+
+    def task(self, kind, status, seconds):
+        with self._lock:
+            self.outcomes[kind, status] += 1
+            if status == 'done':
+                self.task_seconds.setdefault(kind, []).append(seconds)
+
+
+def _percentiles(values):
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def q(p):
+        return values[min(len(values) - 1, int(p * len(values)))]
+
+    return {'n': len(values), 'p50': q(0.5), 'p95': q(0.95), 'p99': q(0.99), 'max': values[-1],
+            'mean': statistics.fmean(values)}
+
+
+class VirtualUser(threading.Thread):
+    """反复「提交一题 → 每 `poll_interval` 秒查一次，直到任务结束」。"""
+
+    def __init__(self, port, pairs, mix, stats, stop, poll_interval, timeout):
+        super().__init__(daemon=True)
+        self.port = port
+        self.pairs = pairs
+        self.kinds, self.weights = zip(*mix.items())
+        self.stats = stats
+        self.stop = stop
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.conn = None
+
+    def _call(self, method, path, endpoint, body=None):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=self.timeout)
+        start = time.perf_counter()
+        try:
+            headers = {'Content-Type': 'application/json', 'X-Priority': 'interactive'} if body else {}
+            self.conn.request(method, path, body=json.dumps(body) if body else None, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            self.stats.request(endpoint, 'conn_error', time.perf_counter() - start)
+            return None, None
+        self.stats.request(endpoint, status, time.perf_counter() - start)
+        try:
+            return status, json.loads(data)
+        except ValueError:
+            return status, None
+
+    def run(self):
+        while not self.stop.is_set():
+            kind = random.choices(self.kinds, self.weights)[0]
+            trait_id, item_id = random.choice(self.pairs[kind])
+            body = {'trait_id': trait_id, 'item_id': item_id, 'force': True}
+            if kind == 'text':
+                # 文字题的 situation_theme 是自由文本，每次不同，避免与进行中的任务合并
+                body['situation_theme'] = f'压测 {random.getrandbits(48):x}'
+            submitted = time.perf_counter()
+            status, data = self._call('POST', f'/api/generate/{kind}', 'submit', body)
+            if status == 429:
+                self.stop.wait(min(float((data or {}).get('retry_after') or 1), 5))
+                continue
+            if status not in (200, 202) or not data:
+                self.stop.wait(1)
+                continue
+            task_id = data['task_id']
+            state = data.get('status')
+            while state not in TERMINAL and not self.stop.wait(self.poll_interval):
+                status, data = self._call('GET', f'/api/task/{task_id}', 'poll')
+                if status == 200 and data:
+                    state = data.get('status')
+            if state in TERMINAL:
+                self.stats.task(kind, state, time.perf_counter() - submitted)
+
+
+def _get_json(port, path):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b'null')
+    finally:
+        conn.close()
+
+
+def _request_pool(port, limit=50):
+    """能提交的 (trait_id, item_id)：文字题任意条目，图片/视频题要有对应的情境。"""
+    _, traits = _get_json(port, '/api/traits')
+    text, situated = [], []
+    for trait_id in traits:
+        status, items = _get_json(port, f'/api/items/{trait_id}')
+        if status == 200:
+            text.extend((trait_id, item_id) for item_id in items)
+        status, data = _get_json(port, f'/api/situations/{trait_id}')
+        if status == 200 and data.get('available'):
+            situated.extend((trait_id, item_id) for item_id in data['situations'])
+    random.shuffle(text)
+    random.shuffle(situated)
+    return {'text': text[:limit], 'image': situated[:limit], 'video': situated[:limit]}
+
+
+def run_step(port, users, duration, pool, mix, poll_interval, timeout, pids, drain):
+    """以 `users` 个虚拟用户压 `duration` 秒，返回这一级的统计。"""
+    stats, stop = Stats(), threading.Event()
+    crew = [VirtualUser(port, pool, mix, stats, stop, poll_interval, timeout) for _ in range(users)]
+    with ResourceSampler(pids) as sampler:
+        start = time.perf_counter()
+        for user in crew:
+            user.start()
+        stop.wait(duration)
+        stop.set()
+        elapsed = time.perf_counter() - start
+        for user in crew:
+            user.join(timeout=timeout + poll_interval)
+        _wait_idle(port, drain)
+    codes = {}
+    for (endpoint, status), n in stats.codes.items():
+        codes.setdefault(endpoint, {})[str(status)] = n
+    done = sum(n for (_, status), n in stats.outcomes.items() if status == 'done')
+    return {
+        'users': users,
+        'seconds': elapsed,
+        'requests_per_s': sum(stats.codes.values()) / elapsed,
+        'tasks_done_per_s': done / elapsed,
+        'latency': {endpoint: _percentiles(v) for endpoint, v in stats.latency.items()},
+        'status_codes': codes,
+        'task_outcomes': {f'{kind}:{status}': n for (kind, status), n in stats.outcomes.items()},
+        'task_seconds': {kind: _percentiles(v) for kind, v in stats.task_seconds.items()},
+        'resources': sampler.summary(),
+    }
+
+
+def _wait_idle(port, limit):
+    """等这一级留下的排队/运行中任务跑完（最多 `limit` 秒），免得拖进下一级。"""
+    deadline = time.monotonic() + limit
+    while time.monotonic() < deadline:
+        try:
+            status, data = _get_json(port, '/api/tasks?status=queued,running')
+        except OSError:
+            return
+        if status != 200 or not data['tasks']:
+            return
+        time.sleep(1)
+
+
+def _report(step):
+    print(f"\n== {step['users']} users, {step['seconds']:.0f}s ==")
+    print(f"  requests/s {step['requests_per_s']:.1f}   tasks done/s {step['tasks_done_per_s']:.2f}")
+    for endpoint, p in sorted(step['latency'].items()):
+        if p:
+            print(f"  {endpoint:<7} n={p['n']:<6} p50 {p['p50'] * 1000:7.1f} ms  p95 {p['p95'] * 1000:7.1f} ms"
+                  f"  p99 {p['p99'] * 1000:7.1f} ms  max {p['max'] * 1000:7.1f} ms"
+                  f"  codes {step['status_codes'].get(endpoint)}")
+    for kind, p in sorted(step['task_seconds'].items()):
+        print(f"  task {kind:<6} n={p['n']:<5} p50 {p['p50']:6.1f} s  p95 {p['p95']:6.1f} s  max {p['max']:6.1f} s")
+    if step['task_outcomes']:
+        print(f"  outcomes {step['task_outcomes']}")
+    r = step['resources']
+    if r:
+        print(f"  server threads max {r['threads_max']} (last {r['threads_last']}),"
+              f" RSS max {r['rss_max_mb']:.0f} MB (last {r['rss_last_mb']:.0f} MB)")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(port, proc, limit=120):
+    deadline = time.monotonic() + limit
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f'server exited with {proc.returncode}')
+        try:
+            if _get_json(port, '/healthz')[0] == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    sys.exit('server did not become ready')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test the web API against stub generation backends.')
+    parser.add_argument('--users', default='5,20,50',
+                        help='comma-separated virtual-user counts, one step each (default: 5,20,50)')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per step')
+    parser.add_argument('--latency', action='append', default=[], metavar='KIND=DIST',
+                        help='stub run time per modality, e.g. image=lognormal:3:0.5 (repeatable)')
+    parser.add_argument('--mix', default='text=6,image=3,video=1', help='submission weights per modality')
+    parser.add_argument('--stages', type=int, default=4, help='progress stages reported by each stub run')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of stub runs that fail')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='seconds between status polls')
+    parser.add_argument('--timeout', type=float, default=30, help='HTTP timeout per request')
+    parser.add_argument('--drain', type=float, default=60,
+                        help='max seconds to wait for leftover tasks between steps')
+    parser.add_argument('--workers', default='', help='per-modality concurrency override, e.g. text=8,image=4')
+    parser.add_argument('--backend', choices=('local', 'sqlite'), default='local', help='queue backend')
+    parser.add_argument('--worker-procs', type=int, default=1, help='worker.py processes (sqlite backend)')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--seed', type=int, help='random seed for the traffic mix')
+    parser.add_argument('--role', choices=('server', 'worker'), help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.role == 'server':
+        return _serve(args.port)
+    if args.role == 'worker':
+        return _work()
+
+    latency = dict(DEFAULT_LATENCY)
+    for spec in args.latency:
+        kind, _, dist = spec.partition('=')
+        parse_distribution(dist)
+        latency[kind.strip()] = dist
+    mix = {k: v for k, v in _parse_pairs(args.mix, float).items() if v > 0}
+    unknown = set(latency) - set(KINDS) | set(mix) - set(KINDS)
+    if unknown or not mix:
+        parser.error(f'unknown modalities: {sorted(unknown)}' if unknown else 'empty --mix')
+    if args.seed is not None:
+        random.seed(args.seed)
+    settings = {
+        'latency': latency,
+        'stages': args.stages,
+        'error_rate': args.error_rate,
+        'workers': _parse_pairs(args.workers, int),
+        'backend': args.backend,
+    }
+
+    workdir = tempfile.mkdtemp(prefix='sjt-loadtest-')
+    env = {**os.environ, ENV_SETTINGS: json.dumps(settings), 'PYTHONPATH': ROOT}
+    port = _free_port()
+    script = os.path.abspath(__file__)
+    procs = [subprocess.Popen([sys.executable, script, '--role', 'server', '--port', str(port)],
+                              cwd=workdir, env=env, stdout=subprocess.DEVNULL)]
+    try:
+        _wait_ready(port, procs[0])
+        if args.backend == 'sqlite':
+            procs += [subprocess.Popen([sys.executable, script, '--role', 'worker'],
+                                       cwd=workdir, env=env, stdout=subprocess.DEVNULL)
+                      for _ in range(max(1, args.worker_procs))]
+        pool = _request_pool(port)
+        for kind in [k for k in mix if not pool[k]]:
+            print(f'no submittable {kind} items in the data package, leaving {kind} out of the mix')
+            del mix[kind]
+        if not mix:
+            sys.exit('nothing to submit')
+        print(f'server pid {procs[0].pid} on port {port}, workdir {workdir}')
+        print(f'latency {latency}, mix {mix}, error rate {args.error_rate}, backend {args.backend}')
+        steps = []
+        for users in (int(u) for u in args.users.split(',') if u.strip()):
+            step = run_step(port, users, args.duration, pool, mix, args.poll_interval, args.timeout,
+                            [p.pid for p in procs], args.drain)
+            _report(step)
+            steps.append(step)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({'settings': {**settings, 'mix': mix, 'duration': args.duration,
+                                        'poll_interval': args.poll_interval}, 'steps': steps},
+                          f, ensure_ascii=False, indent=2)
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,40 @@
-from .txt import SJTAgent as TxtAgent
-from .img import PicSJTAgent as ImgAgent
-from .vid import VidSJTAgent as VidAgent
+"""多模态 SJT 生成：文字（txt）、图像（img）、视频（vid）三条链路。
 
-from .txt import DataLoader
-from .img import ref_viz
\ No newline at end of file
+各链路的依赖都很重（图像要 insightface/cv2/matplotlib，视频要 langgraph/moviepy），
+所以这里的公开名称都在第一次访问时才导入对应子包：网页进程启动、只跑文字题的
+进程都不用为用不到的链路付导入时间。
+"""
+from __future__ import annotations
+
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .img import PicSJTAgent as ImgAgent, ref_viz
+    from .txt import DataLoader, SJTAgent as TxtAgent
+    from .vid import VidSJTAgent as VidAgent
+
+# 公开名称 -> (子包, 属性名)
+_LAZY = {
+    'TxtAgent': ('.txt', 'SJTAgent'),
+    'ImgAgent': ('.img', 'PicSJTAgent'),
+    'VidAgent': ('.vid', 'VidSJTAgent'),
+    'DataLoader': ('.txt', 'DataLoader'),
+    'ref_viz': ('.img', 'ref_viz'),
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    try:
+        module, attr = _LAZY[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    value = getattr(importlib.import_module(module, __name__), attr)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
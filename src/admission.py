@@ -0,0 +1,184 @@
+"""生成请求的准入控制与排队时间预估。
+
+服务过去来者不拒：排队的任务越积越多，用户也看不出自己的任务是 2 分钟还是
+40 分钟后才出结果。这里按各模态最近成功任务的耗时和当前队列深度估算新任务的
+开始/完成时间，随 202 响应返回；积压超过 config.yaml 的 `admission:` 段设定的
+上限时拒绝新提交（HTTP 429 + Retry-After），而不是接下注定要等很久的任务。
+
+积压按优先级分别计数：批量任务把 bulk 队列排满时，网页上的单题生成（interactive）
+照样能提交，由调度器按权重插到前面去。
+"""
+from __future__ import annotations
+
+import math
+import statistics
+import threading
+import time
+
+from .config import CONFIG
+from .scheduler import DEFAULT_PRIORITY, TaskScheduler
+from .task_store import TaskStore
+
+_ADM_CFG = CONFIG.get('admission', {}) or {}
+
+# 各模态每个优先级的排队任务数上限；<= 0 或未列出表示不限
+MAX_QUEUED: dict[str, int] = {
+    kind: int(n) for kind, n in (_ADM_CFG.get('max_queued') or {}).items()
+}
+# 单题提交预计要等这么久才能开始时拒绝；<= 0 表示不限
+MAX_WAIT = float(_ADM_CFG.get('max_wait_minutes', 120)) * 60
+# 用最近多少个成功任务的耗时做估算
+HISTORY = int(_ADM_CFG.get('history', 50))
+# 没有历史数据时各模态的预估耗时（秒）
+DEFAULT_DURATIONS: dict[str, float] = {
+    kind: float(m) * 60
+    for kind, m in (_ADM_CFG.get('default_minutes') or {'text': 2, 'image': 6, 'video': 15}).items()
+}
+FALLBACK_DURATION = 300.0
+# 历史耗时的缓存时间（秒），免得每次提交都查库
+DURATION_TTL = 30.0
+
+
+class AdmissionRejected(Exception):
+    """积压超限，拒绝新提交；`retry_after` 为建议的重试等待秒数。"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class BatchTooLarge(Exception):
+    """批量任务某个模态的子任务数本身就超过排队上限，等多久也接不下，应拆小后再提交。"""
+
+
+class AdmissionControl:
+    """按历史耗时与队列深度估算等待时间，并决定是否接收新任务。
+
+    Parameters
+    ----------
+    store : TaskStore
+        任务记录，用于读取历史耗时。
+    scheduler : TaskScheduler
+        调度器，用于读取队列深度、并发上限与预计排队位置。
+    max_queued : dict
+        模态 -> 每个优先级的排队任务数上限。
+    max_wait : float
+        单题预计等待开始的秒数上限。
+    """
+
+    def __init__(
+        self,
+        store: TaskStore,
+        scheduler: TaskScheduler,
+        max_queued: dict[str, int] | None = None,
+        max_wait: float = MAX_WAIT,
+        history: int = HISTORY,
+    ):
+        self._store = store
+        self._scheduler = scheduler
+        self._max_queued = dict(MAX_QUEUED if max_queued is None else max_queued)
+        self._max_wait = max_wait
+        self._history = history
+        self._lock = threading.Lock()
+        self._durations: dict[str, tuple[float, dict]] = {}
+
+    def typical_duration(self, kind: str) -> dict:
+        """`kind` 任务的典型耗时：`{'seconds', 'samples', 'basis'}`，取最近成功任务的中位数。"""
+        now = time.time()
+        with self._lock:
+            cached = self._durations.get(kind)
+            if cached is not None and now - cached[0] < DURATION_TTL:
+                return cached[1]
+        samples = self._store.recent_durations(kind, self._history)
+        if samples:
+            info = {'seconds': statistics.median(samples), 'samples': len(samples), 'basis': 'history'}
+        else:
+            info = {'seconds': DEFAULT_DURATIONS.get(kind, FALLBACK_DURATION),
+                    'samples': 0, 'basis': 'default'}
+        with self._lock:
+            self._durations[kind] = (now, info)
+        return info
+
+    def _load(self, kind: str) -> tuple[int, int, int]:
+        """(排队数, 运行数, 并发上限)。"""
+        stats = self._scheduler.stats().get(kind, {})
+        return (stats.get('queued', 0), stats.get('running', 0),
+                stats.get('limit', self._scheduler.limit(kind)))
+
+    def _queued(self, kind: str, priority: str) -> int:
+        """`kind` 队列里优先级为 `priority` 的排队数。"""
+        stats = self._scheduler.stats().get(kind, {})
+        return (stats.get('queued_by_priority') or {}).get(priority, 0)
+
+    def estimate(self, kind: str, position: int | None, started_at: float | None = None) -> dict:
+        """估算排在第 `position` 位（None 表示已在运行）的任务何时开始、何时完成。
+
+        把工作线程看成以「并发数 / 典型耗时」的速率腾出空位：前面的任务先占满
+        当前空闲的线程，剩下的按这个速率依次开始。
+        """
+        now = time.time()
+        typical = self.typical_duration(kind)
+        duration = typical['seconds']
+        if position is None:
+            start_at = started_at or now
+            start_in = max(0.0, start_at - now)
+        else:
+            _, running, limit = self._load(kind)
+            free = max(0, limit - running)
+            need = max(0, position - free)
+            start_in = need * duration / max(1, limit)
+            start_at = now + start_in
+        finish_at = max(now, start_at + duration)
+        return {
+            'start_in': round(start_in),
+            'finish_in': round(finish_at - now),
+            'start_at': start_at,
+            'finish_at': finish_at,
+            'typical_duration': round(duration),
+            'basis': typical['basis'],
+            'samples': typical['samples'],
+        }
+
+    def _check_backlog(self, kind: str, priority: str, n: int = 1) -> None:
+        """再往 `priority` 这一档加 `n` 个 `kind` 任务会超出上限时抛出 `AdmissionRejected`。"""
+        limit = self._max_queued.get(kind, 0)
+        if limit <= 0:
+            return
+        queued = self._queued(kind, priority)
+        if queued + n > limit:
+            _, _, workers = self._load(kind)
+            duration = self.typical_duration(kind)['seconds']
+            raise AdmissionRejected(
+                f'{kind} 任务积压过多（{priority} 排队 {queued} 个，本次提交 {n} 个，上限 {limit}），请稍后再试',
+                (queued + n - limit) * duration / max(1, workers),
+            )
+
+    def admit(self, kind: str, priority: str = DEFAULT_PRIORITY, client: str | None = None) -> dict:
+        """检查能否接收一个新的单题任务，能则返回预估，否则抛出 `AdmissionRejected`。"""
+        self._check_backlog(kind, priority)
+        estimate = self.estimate(kind, self._scheduler.preview(kind, priority, client))
+        if self._max_wait > 0 and estimate['start_in'] > self._max_wait:
+            raise AdmissionRejected(
+                f"{kind} 任务预计要等 {estimate['start_in'] // 60} 分钟才能开始，请稍后再试",
+                estimate['start_in'] - self._max_wait,
+            )
+        return estimate
+
+    def admit_batch(self, counts: dict[str, int], priority: str = DEFAULT_PRIORITY) -> dict[str, dict]:
+        """检查能否接收一个批量任务（`counts` 为模态 -> 子任务数），返回各模态全部完成的预估。
+
+        整批子任务都要放得进 `priority` 这一档的积压上限，放不下时抛出
+        `AdmissionRejected`；某个模态的子任务数本身就超过上限时抛出 `BatchTooLarge`。
+        批量任务不按等待时长拒绝——大批量本来就要跑很久。
+        """
+        for kind, n in counts.items():
+            limit = self._max_queued.get(kind, 0)
+            if 0 < limit < n:
+                raise BatchTooLarge(f'批量任务的 {kind} 子任务有 {n} 个，超过排队上限 {limit}，请拆分后提交')
+        for kind, n in counts.items():
+            self._check_backlog(kind, priority, n)
+        estimates = {}
+        for kind, n in counts.items():
+            queued, _, _ = self._load(kind)
+            estimates[kind] = self.estimate(kind, queued + n)
+        return estimates
@@ -0,0 +1,153 @@
+"""原生异步的 LLM 调用。
+
+文字链路过去用 `asyncio.to_thread(llm.call, ...)` 把 lmitf 的阻塞调用丢进线程池：
+一次调用占一个线程，并发上限就是线程池大小（config.yaml 的
+`async_runtime.executor_workers`），每个线程还各自从同步客户端的连接池里取连接。
+这里给同样的 `TemplateLLM`/`BaseLLM` 对象配一条异步通路：
+
+- 每个事件循环、每组 (api_key, base_url) 共用一个 `AsyncOpenAI` 客户端，底层是
+  一个保持长连接的 httpx 连接池；装了 `h2` 时走 HTTP/2，多个请求复用同一条连接。
+  连接池大小见 config.yaml 的 `async_llm:` 段。
+- 模板填充、JSON 校验与解析、请求参数、`call_history` 都直接复用 lmitf 对象自己的
+  方法（`_fill`、`_validate_json_request`、`_build_request_params`、
+  `_parse_json_response`），提示词模块不用改，返回值与同步的 `.call` 一致。
+- 每次请求的超时取自任务时限（`deadline.call_timeout()`）。
+
+一般不直接用这里：经 `metrics.instrument_llm` 包装过的 LLM 有一个 `acall`，
+`await llm.acall(...)` 即可，并同样计入 LLM 指标。
+"""
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import threading
+from typing import Any
+
+from . import deadline, llm_cache
+from .config import CONFIG
+
+_ASYNC_LLM_CFG = CONFIG.get('async_llm', {}) or {}
+
+# 每个客户端的最大连接数（HTTP/2 下一条连接上可以同时跑多个请求）
+MAX_CONNECTIONS = int(_ASYNC_LLM_CFG.get('max_connections', 256))
+# 保留的空闲长连接数（小于并发数时连接会反复断开重连），以及空闲多久（秒）后关闭
+MAX_KEEPALIVE = int(_ASYNC_LLM_CFG.get('max_keepalive', 256))
+KEEPALIVE_EXPIRY = float(_ASYNC_LLM_CFG.get('keepalive_expiry', 60))
+# 是否尝试 HTTP/2（需要安装 h2：pip install 'httpx[http2]'；没装时退回 HTTP/1.1）
+HTTP2 = bool(_ASYNC_LLM_CFG.get('http2', True)) and importlib.util.find_spec('h2') is not None
+
+# (api_key, base_url) -> [(事件循环, AsyncOpenAI)]；httpx 的异步连接池不能跨事件循环使用
+_clients: dict[tuple[str | None, str | None], list[tuple[asyncio.AbstractEventLoop, Any]]] = {}
+_clients_lock = threading.Lock()
+
+
+def _credentials(llm) -> tuple[str | None, str | None, int | None]:
+    client = deadline.unbound_client(llm.client)
+    base_url = getattr(client, 'base_url', None)
+    return getattr(client, 'api_key', None), str(base_url) if base_url else None, getattr(client, 'max_retries', None)
+
+
+def get_client(llm):
+    """与 `llm` 同一账号、同一接口地址的 `AsyncOpenAI` 客户端（当前事件循环内共享）。
+
+    一般都跑在共享事件循环（src/async_runtime.py）上；`asyncio.run` 这类临时循环
+    关掉之后，它们的客户端在下次新建客户端时丢弃。
+    """
+    import httpx
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+    api_key, base_url, max_retries = _credentials(llm)
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        entries = _clients.setdefault((api_key, base_url), [])
+        for client_loop, client in entries:
+            if client_loop is loop:
+                return client
+        entries[:] = [(client_loop, client) for client_loop, client in entries if not client_loop.is_closed()]
+        http_client = DefaultAsyncHttpxClient(
+            http2=HTTP2,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+        )
+        kwargs = {} if max_retries is None else {'max_retries': max_retries}
+        client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, **kwargs)
+        entries.append((loop, client))
+        return client
+
+
+async def aclose() -> None:
+    """关闭当前事件循环上的客户端与连接池。"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = [client for entries in _clients.values() for client_loop, client in entries if client_loop is loop]
+        for entries in _clients.values():
+            entries[:] = [(client_loop, client) for client_loop, client in entries if client_loop is not loop]
+    for client in clients:
+        await client.close()
+
+
+async def call(llm, messages=None, model: str = 'gpt-4o', response_format: str = 'json', **kwargs):
+    """`llm.call(...)` 的异步版本，参数与返回值相同。
+
+    Parameters
+    ----------
+    llm : TemplateLLM or BaseLLM
+        lmitf 的 LLM 对象；`TemplateLLM` 的模板变量照常按关键字传入。
+    messages : str or list of dict, optional
+        直接给出的消息（`BaseLLM`）；模板 LLM 不用传。
+    model, response_format
+        同 `BaseLLM.call`。
+    **kwargs
+        模板变量，以及 `temperature`、`seed`、`max_tokens` 等采样参数。
+    """
+    import httpx
+
+    if response_format not in ('text', 'json'):
+        raise ValueError("response_format must be 'text' or 'json'")
+    variables = getattr(llm, 'variables', None)
+    if variables is not None and messages is None:
+        if not llm.prompt_template:
+            raise ValueError('Prompt template is not defined.')
+        messages = llm._fill(**{k: v for k, v in kwargs.items() if k in variables})
+        kwargs = {k: v for k, v in kwargs.items() if k not in variables}
+    if isinstance(messages, str):
+        messages = [{'role': 'user', 'content': messages}]
+    if response_format == 'json':
+        llm._validate_json_request(messages)
+
+    params = llm._build_request_params(model=model, messages=messages, response_format=response_format, **kwargs)
+    # 与同步通路共用 LLM 响应缓存的条目（见 src/llm_cache.py）
+    cache = llm_cache.get_cache()
+    template = llm_cache.template_of(llm.client)
+    key, data = (await asyncio.to_thread(cache.lookup, 'chat.completions', params, template)
+                 if cache else (None, None))
+    hit = data is not None
+    if not hit:
+        # 参数已是接口要的 JSON 结构，绕过 SDK 按 TypedDict 的逐层转换和 pydantic 的响应模型
+        # （两者占了一次调用的大半 CPU），错误处理与自动重试照旧由 SDK 负责
+        response = await get_client(llm).post(
+            '/chat/completions', cast_to=httpx.Response, body=params,
+            options={'timeout': deadline.call_timeout()},
+        )
+        data = response.json()
+    try:
+        content = data['choices'][0]['message']['content'].strip()
+        if response_format == 'json':
+            content = llm._parse_json_response(content)
+    except Exception:
+        # 解析失败的响应不写入缓存；命中的坏条目删掉，重试时改问上游
+        if cache and hit:
+            await asyncio.to_thread(cache.discard, key)
+        raise
+    if cache and not hit:
+        await asyncio.to_thread(cache.store, key, 'chat.completions', data, template, model)
+
+    if not llm.call_history:
+        llm.call_history = messages.copy()
+    else:
+        llm.call_history.append({'role': 'user', 'content': messages[-1]['content']})
+    llm.call_history.append({'role': 'assistant', 'content': content})
+    return content
@@ -0,0 +1,112 @@
+"""进程内共享的 asyncio 运行时。
+
+文字链路是异步写的（并发派发各条线索的 LLM 调用），但同步入口过去每次都
+`asyncio.run` 一遍——每个任务都要新建、再拆掉一个事件循环和一个默认线程池；
+在已有事件循环的环境（Jupyter）里则改用 `nest_asyncio` 给循环打补丁。这里改成
+整个进程只有一个事件循环，跑在专门的线程里，`asyncio.to_thread` 等用到的默认
+线程池也只有一个：各任务的协程都调度到这个循环上，连接、线程池得以复用，
+线程池大小（config.yaml 的 `async_runtime.executor_workers`）也就成了全进程
+阻塞调用的并发上限。
+
+同步代码用 `run(coro)` 等待结果，或用 `submit(coro)` 拿到
+`concurrent.futures.Future`；两者都是线程安全的。
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+from typing import Any, Coroutine
+
+from .config import CONFIG
+
+_ASYNC_CFG = CONFIG.get('async_runtime', {}) or {}
+
+# 共享线程池的大小，即全进程同时在跑的阻塞调用（LLM 请求等）上限
+EXECUTOR_WORKERS = int(_ASYNC_CFG.get('executor_workers', 64))
+
+
+class AsyncRuntime:
+    """在后台线程里一直运行的事件循环。
+
+    Parameters
+    ----------
+    executor_workers : int
+        事件循环默认线程池的大小。
+    name : str
+        后台线程名。
+    """
+
+    def __init__(self, executor_workers: int = EXECUTOR_WORKERS, name: str = 'sjt-async'):
+        self.loop = asyncio.new_event_loop()
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, executor_workers), thread_name_prefix=f'{name}-pool')
+        self.loop.set_default_executor(self.executor)
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._started.set)
+        self.loop.run_forever()
+
+    @property
+    def alive(self) -> bool:
+        return self._thread.is_alive() and not self.loop.is_closed()
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """把协程调度到事件循环上，立即返回 Future。"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine, timeout: float | None = None) -> Any:
+        """把协程调度到事件循环上并等待结果（异常原样抛出）。
+
+        不能在运行时自己的线程里调用（会自己等自己）；调用方被中断（如
+        KeyboardInterrupt）或等待超时时，协程随之取消。
+        """
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError('AsyncRuntime.run() 不能在运行时自己的事件循环里调用，请直接 await')
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def close(self) -> None:
+        """停止事件循环并关闭线程池（一般不需要：后台线程随进程退出）。"""
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_runtime: AsyncRuntime | None = None
+_runtime_pid: int | None = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime() -> AsyncRuntime:
+    """进程内共享的运行时，第一次调用时启动；fork 出的子进程里会重新启动一个。"""
+    global _runtime, _runtime_pid
+    with _runtime_lock:
+        if _runtime is None or _runtime_pid != os.getpid() or not _runtime.alive:
+            _runtime = AsyncRuntime()
+            _runtime_pid = os.getpid()
+        return _runtime
+
+
+def submit(coro: Coroutine) -> concurrent.futures.Future:
+    """`get_runtime().submit(coro)`。"""
+    return get_runtime().submit(coro)
+
+
+def run(coro: Coroutine, timeout: float | None = None) -> Any:
+    """`get_runtime().run(coro)`：在同步代码里（包括已有事件循环的线程里）跑完一个协程。"""
+    return get_runtime().run(coro, timeout)
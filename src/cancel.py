@@ -0,0 +1,118 @@
+"""生成任务的协作式取消。
+
+一个跑偏的任务在所有重试用完之前会一直消耗 LLM、出图和出片额度，线程又没法
+从外部强行终止。这里提供一个取消令牌：调用方 `cancel()` 之后，流水线在每个
+检查点（重试之间、步骤之间、轮询之间、asyncio 任务上）尽快停下并抛出
+`TaskCancelled`。正在进行中的单次阻塞调用（一次 HTTP 请求）仍会跑完，取消的是
+之后的工作。
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable
+
+
+class TaskCancelled(BaseException):
+    """任务被取消。
+
+    与 `asyncio.CancelledError` 一样继承 BaseException，流水线里大量的
+    `except Exception` 兜底不会把它吞掉或当成可重试的失败。
+    """
+
+
+class CancelToken:
+    """线程安全的取消令牌。"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: list[Callable[[], None]] = []
+        self.reason: str | None = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = '任务已取消') -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception:  # noqa: BLE001 - 回调失败不影响取消本身
+                pass
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise TaskCancelled(self.reason)
+
+    def sleep(self, seconds: float) -> None:
+        """可被取消打断的 `time.sleep`；被取消时抛出 `TaskCancelled`。"""
+        if self._event.wait(max(0.0, seconds)):
+            raise TaskCancelled(self.reason)
+
+    def add_callback(self, fn: Callable[[], None]) -> Callable[[], None]:
+        """注册取消时执行的回调（已取消则立即执行），返回注销函数。"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return lambda: self._discard(fn)
+        fn()
+        return lambda: None
+
+    def _discard(self, fn: Callable[[], None]) -> None:
+        with self._lock:
+            if fn in self._callbacks:
+                self._callbacks.remove(fn)
+
+
+def check(cancel: CancelToken | None) -> None:
+    """`cancel` 为 None 时什么也不做，否则在已取消时抛出 `TaskCancelled`。"""
+    if cancel is not None:
+        cancel.raise_if_cancelled()
+
+
+def sleep(seconds: float, cancel: CancelToken | None = None) -> None:
+    """`time.sleep` 的可取消版本。"""
+    if cancel is None:
+        time.sleep(seconds)
+    else:
+        cancel.sleep(seconds)
+
+
+@asynccontextmanager
+async def cancel_scope(cancel: CancelToken | None) -> AsyncIterator[None]:
+    """在协程里使用：令牌被取消时取消当前 asyncio 任务，并转成 `TaskCancelled`。
+
+    `to_thread` 里已经开始的阻塞调用停不下来，但之后的 await 会立刻结束。
+    """
+    if cancel is None:
+        yield
+        return
+    cancel.raise_if_cancelled()
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+
+    def _cancel_task():
+        try:
+            loop.call_soon_threadsafe(task.cancel)
+        except RuntimeError:  # 事件循环已关闭
+            pass
+
+    unregister = cancel.add_callback(_cancel_task)
+    try:
+        yield
+    except asyncio.CancelledError:
+        if not cancel.cancelled:
+            raise
+        task.uncancel()
+        raise TaskCancelled(cancel.reason) from None
+    finally:
+        unregister()
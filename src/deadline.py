@@ -0,0 +1,112 @@
+"""任务时限与外部调用超时。
+
+外部调用（出片与配音的 HTTP 请求、各处的 LLM 调用）过去都没有超时，一个挂住的
+连接就能让工作线程永远卡在那里。现在每个任务有一个总时限（config.yaml 的
+`deadlines.task_minutes`，按模态配置），由 `TaskRunner` 用 `scope` 记进上下文
+变量；任务里的每次外部调用都用 `call_timeout()` 取超时：不超过
+`deadlines.call_timeout`，也不超过任务剩下的时间。时限已过时 `call_timeout()`
+直接抛 `DeadlineExceeded`；`retry_call` 与整题重试在剩余时间不够再试一次
+（`deadlines.min_attempt`）时不再重试。
+
+上下文变量会随 `asyncio.to_thread`、共享事件循环上的协程一起传递；不在任何任务
+里（命令行脚本等）时没有总时限，只有单次调用的超时上限。
+"""
+from __future__ import annotations
+
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from .config import CONFIG
+
+_DEADLINES_CFG = CONFIG.get('deadlines', {}) or {}
+
+# 各模态任务的总时限（秒），含整题重试；<=0 或不写表示不限
+TASK_BUDGETS: dict[str, float] = {
+    kind: float(minutes) * 60
+    for kind, minutes in (_DEADLINES_CFG.get('task_minutes') or {'text': 15, 'image': 45, 'video': 90}).items()
+}
+# 单次外部调用（一次 HTTP 请求、一次 LLM 调用）的超时上限（秒）
+CALL_TIMEOUT = float(_DEADLINES_CFG.get('call_timeout', 180))
+# 剩余时间少于这么多秒时不再发起新的尝试
+MIN_ATTEMPT = float(_DEADLINES_CFG.get('min_attempt', 10))
+
+
+class DeadlineExceeded(TimeoutError):
+    """任务已超过时限；不会被 `retry_call` 重试。"""
+
+
+# time.monotonic() 上的截止时刻
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar('sjt_deadline', default=None)
+
+
+@contextmanager
+def scope(seconds: float | None) -> Iterator[None]:
+    """这段代码（及其派生的协程/`to_thread` 调用）须在 `seconds` 秒内完成。
+
+    嵌套时取更早的截止时刻；`seconds` 为 None 或 <=0 时不加限制。
+    """
+    if not seconds or seconds <= 0:
+        yield
+        return
+    end = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(end if outer is None else min(outer, end))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """距截止还有多少秒（可能为负）；没有时限时返回 None。"""
+    end = _deadline.get()
+    return None if end is None else end - time.monotonic()
+
+
+def check() -> None:
+    """时限已过时抛出 `DeadlineExceeded`。"""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f'任务超过时限（已超出 {-left:.0f}s）')
+
+
+def call_timeout(limit: float = CALL_TIMEOUT) -> float:
+    """下一次外部调用的超时（秒）：`limit` 与剩余时间中较小的那个。
+
+    时限已过时抛出 `DeadlineExceeded`，不再发起调用。
+    """
+    check()
+    left = remaining()
+    return limit if left is None else min(limit, left)
+
+
+def can_retry(wait: float = 0) -> bool:
+    """等 `wait` 秒之后是否还来得及再试一次。"""
+    left = remaining()
+    return left is None or left - wait >= MIN_ATTEMPT
+
+
+class _DeadlineClient:
+    """OpenAI 客户端的代理：每次取 `chat`/`responses`/`images` 等资源时，都换成按
+    当前剩余时间设了超时的副本（`with_options` 共享底层连接池，开销很小）。"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client.with_options(timeout=call_timeout()), name)
+
+
+def bound_client(client):
+    """让 OpenAI 客户端的每个请求都遵守任务时限；lmitf 的 `TemplateLLM`、
+    `AgentLLM`、`BaseLVM` 都把客户端放在 `.client` 上，替换掉即可。"""
+    if client is None or isinstance(client, _DeadlineClient):
+        return client
+    return _DeadlineClient(client)
+
+
+def unbound_client(client):
+    """`bound_client` 包装之前的原始客户端（读 `api_key`、`base_url` 等属性用）。"""
+    return client._client if isinstance(client, _DeadlineClient) else client
@@ -1,22 +1,35 @@
 from __future__ import annotations
 
-from .datasets import DataManager
-from .viz import draw_G, draw_Gs
-from .pipeline import PicSJTAgent
-from .make_ins import make_ins, combine_ins, combine_situ_ins
+import importlib
+from typing import TYPE_CHECKING
+
 from dotenv import load_dotenv
 from pathlib import Path
-from PIL import Image
+
+if TYPE_CHECKING:
+    from .datasets import DataManager
+    from .viz import draw_G, draw_Gs
+    from .pipeline import PicSJTAgent
+    from .make_ins import make_ins, combine_ins, combine_situ_ins
+
 load_dotenv()
 base_path = Path(__file__).resolve().parent
 ref_viz_paths = {
     'male': base_path / 'resources/ref_character/male.png',
     'female': base_path / 'resources/ref_character/female.png',
 }
-ref_viz = {
-    gender: Image.open(path)
-    for gender, path in ref_viz_paths.items()
+
+# 公开名称 -> 所在子模块；首次访问时才导入（pipeline 会拉起 insightface，viz 会拉起 matplotlib）
+_LAZY = {
+    'DataManager': '.datasets',
+    'draw_G': '.viz',
+    'draw_Gs': '.viz',
+    'PicSJTAgent': '.pipeline',
+    'make_ins': '.make_ins',
+    'combine_ins': '.make_ins',
+    'combine_situ_ins': '.make_ins',
 }
+
 __all__ = [
     "DataManager",
     "draw_G",
@@ -25,4 +38,27 @@ __all__ = [
     "make_ins",
     "combine_ins",
     "combine_situ_ins",
-]
\ No newline at end of file
+]
+
+
+def _load_ref_viz():
+    from PIL import Image
+    return {
+        gender: Image.open(path)
+        for gender, path in ref_viz_paths.items()
+    }
+
+
+def __getattr__(name):
+    if name == 'ref_viz':
+        value = _load_ref_viz()
+    elif name in _LAZY:
+        value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY) | {'ref_viz'})
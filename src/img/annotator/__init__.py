@@ -1,3 +1,25 @@
-from .annotator import Annotator, standalone_bubble_it
-from .bubble_it import BubbleIt
-from .face_labeler import FaceLabeler
\ No newline at end of file
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .annotator import Annotator, standalone_bubble_it
+    from .bubble_it import BubbleIt
+    from .face_labeler import FaceLabeler
+
+# face_labeler 会导入 insightface/onnxruntime/cv2，按需加载
+_LAZY = {
+    'Annotator': '.annotator',
+    'standalone_bubble_it': '.annotator',
+    'BubbleIt': '.bubble_it',
+    'FaceLabeler': '.face_labeler',
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
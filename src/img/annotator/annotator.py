@@ -1,5 +1,4 @@
 from .annotator_llm import AnnotatorLLM
-from .face_labeler import FaceLabeler
 from ..viz import make_sequence
 from .bubble_it import BubbleIt
 from PIL import Image
@@ -29,6 +28,8 @@ class Annotator:
             model=model,
         )
         self.annotator_llm.initialize()
+        # insightface/cv2 很重，真正要标人脸时才导入
+        from .face_labeler import FaceLabeler
         self.labeler = FaceLabeler()
 
     def face_it(self):
@@ -14,6 +14,8 @@ from tqdm.auto import tqdm
 from lmitf.agent_llm import AgentLLM
 from lmitf.base_llm import extract_json
 
+from ...metrics import instrument_llm
+
 if __name__ == "__main__":
     from utils import number_images
 else:
@@ -223,7 +225,7 @@ class AnnotatorLLM:
         ref_img: Image.Image | None = None,
         model: str = "gpt-5-nano",
     ) -> None:
-        self.agent = AgentLLM(model=model)
+        self.agent = instrument_llm(AgentLLM(model=model), 'annotator')
         self.ref_name = ref_name
         self.ref_img = ref_img
 
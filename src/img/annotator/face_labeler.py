@@ -6,6 +6,12 @@ from PIL import Image
 import insightface
 import contextlib
 import io
+import threading
+
+# Prepared detectors keyed by load arguments, shared by every labeler in the process
+# so that buffalo_l is read from disk and prepared only once.
+_MODELS: Dict[tuple, object] = {}
+_MODELS_LOCK = threading.Lock()
 
 
 def _pil_to_bgr(image: Image.Image) -> np.ndarray:
@@ -21,26 +27,25 @@ def _bgr_to_pil(bgr: np.ndarray) -> Image.Image:
     return Image.fromarray(rgb)
 
 
-class FaceLabeler:
-    """Detect faces, assign incremental labels, and store annotations."""
+def load_model(
+    model_name: str = "buffalo_l",
+    provider: Optional[List[str]] = None,
+    det_size: Tuple[int, int] = (640, 640),
+    root: Optional[str] = None,
+):
+    """Return a prepared ``FaceAnalysis`` app, loading it once per process."""
+    key = (model_name, tuple(provider) if provider else None, tuple(det_size), root)
+    with _MODELS_LOCK:
+        if key in _MODELS:
+            return _MODELS[key]
 
-    def __init__(
-        self,
-        model_name: str = "buffalo_l",
-        provider: Optional[List[str]] = None,
-        det_size: Tuple[int, int] = (640, 640),
-        root: Optional[str] = None,
-        text_font_scale: float = 0.8,
-        text_thickness: int = 2,
-        score_threshold: float = 0.5,
-    ) -> None:
         import onnxruntime as ort
         available = ort.get_available_providers()
         if "CUDAExecutionProvider" in available:
             providers = ["CUDAExecutionProvider", "CPUExecutionProvider"]
         else:
             providers = ["CPUExecutionProvider"]
-            
+
         kwargs: Dict[str, object] = {
             "name": model_name,
             "allowed_modules": ["detection"],
@@ -53,8 +58,26 @@ class FaceLabeler:
 
         # Redirect stdout to suppress non-error prints
         with contextlib.redirect_stdout(io.StringIO()):
-            self.app = insightface.app.FaceAnalysis(**kwargs)
-            self.app.prepare(ctx_id=0, det_size=det_size)
+            app = insightface.app.FaceAnalysis(**kwargs)
+            app.prepare(ctx_id=0, det_size=det_size)
+        _MODELS[key] = app
+        return app
+
+
+class FaceLabeler:
+    """Detect faces, assign incremental labels, and store annotations."""
+
+    def __init__(
+        self,
+        model_name: str = "buffalo_l",
+        provider: Optional[List[str]] = None,
+        det_size: Tuple[int, int] = (640, 640),
+        root: Optional[str] = None,
+        text_font_scale: float = 0.8,
+        text_thickness: int = 2,
+        score_threshold: float = 0.5,
+    ) -> None:
+        self.app = load_model(model_name, provider, det_size, root)
 
         self.text_font_scale = float(text_font_scale)
         self.text_thickness = int(text_thickness)
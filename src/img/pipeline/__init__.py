@@ -1,7 +1,21 @@
 from __future__ import annotations
 
-from .main import PicSJTAgent
+import importlib
+from typing import TYPE_CHECKING
+
 from .utils import *
 
 from dotenv import load_dotenv
 load_dotenv()
+
+if TYPE_CHECKING:
+    from .main import PicSJTAgent
+
+
+def __getattr__(name):
+    # main 会拉起 networkx/pandas/lmitf 和标注器，等到真正用 PicSJTAgent 时再导入
+    if name != 'PicSJTAgent':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = importlib.import_module('.main', __name__).PicSJTAgent
+    globals()[name] = value
+    return value
@@ -1,79 +1,91 @@
 from __future__ import annotations
 
+import asyncio
+
 from lmitf import TemplateLLM
 from .utils import find_key_in_result
-from ...retry import STEP_ATTEMPTS, retry_call
+from ... import async_runtime
+from ...metrics import instrument_llm
+from ...retry import STEP_ATTEMPTS, retry_async
 from dotenv import load_dotenv
 load_dotenv()
 import os.path as op
 prompt_dir = op.join(op.dirname(__file__), '..', 'prompts', 'cues_enrich')
 
-emo_llm = TemplateLLM(op.join(prompt_dir, 'emotion_analysis.py'))
-exp_llm = TemplateLLM(op.join(prompt_dir, 'emotion_to_expression.py'))
-se_llm = TemplateLLM(op.join(prompt_dir, 'scene_enrich.py'))
-oe_llm = TemplateLLM(op.join(prompt_dir, 'object_enrich.py'))
+emo_llm = instrument_llm(TemplateLLM(op.join(prompt_dir, 'emotion_analysis.py')), 'emotion_analysis')
+exp_llm = instrument_llm(TemplateLLM(op.join(prompt_dir, 'emotion_to_expression.py')), 'emotion_to_expression')
+se_llm = instrument_llm(TemplateLLM(op.join(prompt_dir, 'scene_enrich.py')), 'scene_enrich')
+oe_llm = instrument_llm(TemplateLLM(op.join(prompt_dir, 'object_enrich.py')), 'object_enrich')
 
-def make_expression(situation, trait, ana_character, act_character):
+async def make_expression(situation, trait, ana_character, act_character):
     # 1. Emotion Analysis
-    def _emotion():
-        res = emo_llm.call(
+    async def _emotion():
+        res = await emo_llm.acall(
             passage=situation, trait=trait,
             analyze_character=ana_character,
             activate_character=act_character,
         )
         return find_key_in_result(res, 'emotion')['emotion']
 
-    emotion = retry_call(_emotion, attempts=STEP_ATTEMPTS, label=f'emotion({ana_character})')
+    emotion = await retry_async(_emotion, attempts=STEP_ATTEMPTS, label=f'emotion({ana_character})')
 
     # 2. Emotion to Expression
-    def _expression():
-        res = exp_llm.call(passage=situation, emotion=emotion, character=ana_character)
+    async def _expression():
+        res = await exp_llm.acall(passage=situation, emotion=emotion, character=ana_character)
         return find_key_in_result(res, 'expression')['expression']
 
-    return retry_call(_expression, attempts=STEP_ATTEMPTS, label=f'expression({ana_character})')
+    return await retry_async(_expression, attempts=STEP_ATTEMPTS, label=f'expression({ana_character})')
 
-def make_scene(situation, character, trait, scene):
+async def make_scene(situation, character, trait, scene):
     """Generate the observable description of scene in situation to activate character's trait."""
-    def _scene():
-        res = se_llm.call(
+    async def _scene():
+        res = await se_llm.acall(
             passage=situation, character=character,
             trait=trait, scene=scene,
         )
         return find_key_in_result(res, 'scene')['scene']
 
-    return retry_call(_scene, attempts=STEP_ATTEMPTS, label=f'scene({scene})')
+    return await retry_async(_scene, attempts=STEP_ATTEMPTS, label=f'scene({scene})')
 
-def make_object(situation, character, trait, object_):
+async def make_object(situation, character, trait, object_):
     """Generate the observable description of object in situation to activate character's trait."""
-    def _object_desc():
-        res = oe_llm.call(
+    async def _object_desc():
+        res = await oe_llm.acall(
             passage=situation, character=character,
             trait=trait, object=object_,
         )
         return find_key_in_result(res, 'object')['object']
 
-    return retry_call(_object_desc, attempts=STEP_ATTEMPTS, label=f'object({object_})')
+    return await retry_async(_object_desc, attempts=STEP_ATTEMPTS, label=f'object({object_})')
+
+def _gather(coros: dict):
+    """Run the coroutines concurrently on the shared event loop; returns {key: result}."""
+    async def _all():
+        results = await asyncio.gather(*coros.values())
+        return dict(zip(coros, results))
+
+    return async_runtime.run(_all())
 
 def enrich_characters(situation, trait, ana_characters, act_character):
     """"""
-    expressions = {
+    expressions = _gather({
         ana_character: make_expression(situation, trait, ana_character, act_character)
         for ana_character in ana_characters
-    }
+    })
     return expressions
 
 def enrich_scenes(situation, trait, scenes, act_character):
     """"""
-    expressions = {
+    expressions = _gather({
         scene: make_scene(situation, act_character, trait, scene)
         for scene in scenes
-    }
+    })
     return expressions
 
 def enrich_objects(situation, trait, objects, act_character):
     """"""
-    expressions = {
+    expressions = _gather({
         object_: make_object(situation, act_character, trait, object_)
         for object_ in objects
-    }
+    })
     return expressions
@@ -29,6 +29,10 @@ from .utils import (
 
 from ..annotator import Annotator
 from ..config import IMG_MODEL, LLM_MODEL
+from ...cancel import CancelToken
+from ...deadline import bound_client
+from ...metrics import instrument_llm, llm_call
+from ...progress import ProgressCallback, stage
 from ...retry import STEP_ATTEMPTS, retry_call
 import os.path as op
 from PIL import Image
@@ -68,7 +72,7 @@ class PicSJTAgent:
             If True, runs in debug mode with simplified outputs (default is False).
         """
         assert isinstance(ref_viz, (str, Image.Image)), "ref_viz should be a string or PIL.Image.Image"
-        self.llms = {
+        llms = {
             'sg': TemplateLLM(op.join(prompt_dir, 'graph_utils', 'sg_generation.py')),
             'cls_node': TemplateLLM(op.join(prompt_dir, 'graph_utils', 'classfy_node.py')),
             'G2str': TemplateLLM(op.join(prompt_dir, 'graph_utils', 'graph2prompt.py')),
@@ -78,6 +82,7 @@ class PicSJTAgent:
             
             'vng_polisher': TemplateLLM(op.join(prompt_dir, 'vng', 'vng_polisher.py')),
         }
+        self.llms = {name: instrument_llm(llm, name) for name, llm in llms.items()}
         self.cue_types = ['att|obj', 'obj-obj', 'att|obj-obj', 'obj-att|obj', 'att|obj-att|obj']
         self.debug = debug
         self.ref_name = ref_name
@@ -222,8 +227,11 @@ class PicSJTAgent:
             description=ref_viz if isinstance(ref_viz, str) else None,
             ref_img=ref_viz if isinstance(ref_viz, Image.Image) else None,
         )
-        res = self.sb.create(
-            list(self.Gs_prompt_polished.values()), 
+        self.sb.lvm.client = bound_client(self.sb.lvm.client)
+        res = llm_call(
+            'storyboard',
+            self.sb.create,
+            list(self.Gs_prompt_polished.values()),
             model=IMG_MODEL,
             verbose=verbose,
             desc='T2I',
@@ -262,6 +270,8 @@ class PicSJTAgent:
         run_bubble:bool=True,
         return_details:bool=False,
         step_attempts:int=STEP_ATTEMPTS,
+        on_progress: ProgressCallback | None = None,
+        cancel: CancelToken | None = None,
         ):
         """Fit the model to the situation and trait.
         如果run_bubble为True, 则会调用本地计算资源进行对话气泡的生成（高并行的异步处理中容易崩溃）, 
@@ -285,6 +295,10 @@ class PicSJTAgent:
             Whether to run bubble generation (default True)
         step_attempts: int
             单步失败（多为 LLM 未按结构输出）时的最大尝试次数，默认取 config.yaml 的 retry.step_attempts
+        on_progress: callable, optional
+            阶段进度回调，每一步开始/结束时调用，协议见 src/progress.py
+        cancel: CancelToken, optional
+            取消令牌；每一步（及每次重试）开始前检查，被取消时抛出 TaskCancelled
         """
         steps = [
             ('Generating situation graph', self.situ_graph),
@@ -299,10 +313,11 @@ class PicSJTAgent:
         ]
 
         pbar = tqdm(steps, disable=not verbose, leave=verbose_leave)
-        for desc, step_func in pbar:
+        for idx, (desc, step_func) in enumerate(pbar):
             pbar.set_postfix_str(f'{desc}')
             # 每一步都直接依赖 LLM，偶发的“不按格式输出”重跑一次通常就好了。
-            retry_call(step_func, attempts=step_attempts, label=desc)
+            with stage(on_progress, desc, idx, len(steps)):
+                retry_call(step_func, attempts=step_attempts, label=desc, cancel=cancel)
         if out_basename is not None:
             self.output_fname = out_basename
         if save:
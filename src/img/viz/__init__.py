@@ -1,4 +1,20 @@
 from __future__ import annotations
 
-from .sg import *
+import importlib
+from typing import TYPE_CHECKING
+
 from .vng import make_sequence, load_vng_pics
+
+if TYPE_CHECKING:
+    from .sg import draw_G, draw_Gs, draw_G_cue_highlight
+
+# sg 导入时就会加载 matplotlib 并改全局 rcParams，只在真要画场景图时才导入
+_SG_NAMES = ('draw_G', 'draw_Gs', 'draw_G_cue_highlight')
+
+
+def __getattr__(name):
+    if name not in _SG_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module('.sg', __name__), name)
+    globals()[name] = value
+    return value
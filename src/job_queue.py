@@ -0,0 +1,293 @@
+"""跨进程的共享任务队列（config.yaml 里 `queue.backend: sqlite`）。
+
+默认（`local`）生成任务在网页进程内的线程池里跑，一个解释器扛下所有流水线、
+GIL 和 ONNX 会话。改成 `sqlite` 后网页进程只负责把任务写进 SQLite 任务库，
+由一个或多个 `worker.py` 进程认领执行——任务记录本身就是队列（`status='queued'`），
+认领在 BEGIN IMMEDIATE 事务里完成，多个进程不会抢到同一个任务。
+
+`SQLiteJobQueue` 对网页进程暴露与 `TaskScheduler` 相同的接口（submit / position /
+stats / remove / ...），出队顺序同样按 `FairQueue` 的加权公平规则，轮转进度存在
+`queue_state` 表里，所以换后端不影响优先级与排队位置的语义。
+
+工作进程定期心跳：刷新正在跑的任务的 `heartbeat_at`、登记自己的并发能力，
+并取回网页端发来的取消请求；心跳超时的任务由网页进程标记为 interrupted。
+"""
+from __future__ import annotations
+
+import json
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+from .config import CONFIG
+from .scheduler import DEFAULT_PRIORITY, PRIORITY_WEIGHTS, FairQueue
+from .task_store import TaskStore
+
+_QUEUE_CFG = CONFIG.get('queue', {}) or {}
+
+QUEUE_BACKEND = _QUEUE_CFG.get('backend', 'local')
+# 工作进程没认领到任务时的轮询间隔、心跳间隔与判定失联的超时（秒）
+POLL_INTERVAL = float(_QUEUE_CFG.get('poll_interval', 1.0))
+HEARTBEAT_INTERVAL = float(_QUEUE_CFG.get('heartbeat_interval', 5.0))
+STALE_AFTER = float(_QUEUE_CFG.get('stale_after', 60.0))
+# 网页进程缓存队列快照的时间（秒）；列表接口会为每个排队任务算一次位置
+SNAPSHOT_TTL = 1.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue_state (
+    kind     TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    pass     REAL NOT NULL,
+    PRIMARY KEY (kind, priority)
+);
+CREATE TABLE IF NOT EXISTS queue_clock (
+    kind  TEXT PRIMARY KEY,
+    vtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id    TEXT PRIMARY KEY,
+    host         TEXT,
+    pid          INTEGER,
+    capacity     TEXT NOT NULL,
+    started_at   REAL NOT NULL,
+    heartbeat_at REAL NOT NULL
+);
+"""
+
+
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{os.urandom(3).hex()}"
+
+
+class SQLiteJobQueue:
+    """以 SQLite 任务库为队列；网页进程用它排队，worker.py 用它认领。
+
+    Parameters
+    ----------
+    store : TaskStore
+        共享的任务库（所有进程必须指向同一个文件）。
+    weights : dict
+        优先级 -> 权重，默认取 config.yaml 的 `scheduler.priorities`。
+    stale_after : float
+        工作进程超过这么久没有心跳即视为失联。
+    """
+
+    def __init__(
+        self,
+        store: TaskStore,
+        weights: dict[str, float] | None = None,
+        stale_after: float = STALE_AFTER,
+    ):
+        self._store = store
+        self._weights = dict(PRIORITY_WEIGHTS if weights is None else weights)
+        self._stale_after = stale_after
+        self._lock = threading.RLock()
+        self._snapshot: tuple[float, dict[str, FairQueue]] | None = None
+        with store.transaction() as conn:
+            for statement in _SCHEMA.split(';'):
+                if statement.strip():
+                    conn.execute(statement)
+
+    @property
+    def priorities(self) -> tuple[str, ...]:
+        return tuple(self._weights)
+
+    # -- building the fair queue from the database --------------------------
+
+    def _build(self, conn, kinds=None) -> dict[str, FairQueue]:
+        """按库里的排队任务和轮转进度重建各类型的 FairQueue。"""
+        sql = "SELECT task_id, kind, priority, client FROM tasks WHERE status = 'queued'"
+        params: list = []
+        if kinds is not None:
+            sql += f" AND kind IN ({', '.join('?' for _ in kinds)})"
+            params.extend(kinds)
+        rows = conn.execute(sql + ' ORDER BY created_at', params).fetchall()
+        if not rows:
+            return {}
+        # 同一优先级内按提交方上次被服务的时间轮转，从没被服务过的排最前
+        served = {
+            (r[0], r[1], r[2]): r[3] for r in conn.execute(
+                'SELECT kind, priority, client, MAX(started_at) FROM tasks'
+                ' WHERE started_at IS NOT NULL GROUP BY kind, priority, client')
+        }
+        passes: dict[str, dict[str, float]] = {}
+        for kind, priority, value in conn.execute('SELECT kind, priority, pass FROM queue_state'):
+            passes.setdefault(kind, {})[priority] = value
+        clocks = dict(conn.execute('SELECT kind, vtime FROM queue_clock').fetchall())
+
+        lanes: dict[str, OrderedDict] = {}
+        for task_id, kind, priority, client in rows:
+            key = (priority or DEFAULT_PRIORITY, client or '')
+            lanes.setdefault(kind, OrderedDict()).setdefault(key, []).append(task_id)
+        queues = {}
+        for kind, by_lane in lanes.items():
+            queue = FairQueue(self._weights)
+            queue.restore(passes.get(kind, {}), clocks.get(kind, 0.0))
+            order = sorted(by_lane, key=lambda k: served.get((kind, *k)) or 0.0)
+            for priority, client in order:
+                for task_id in by_lane[(priority, client)]:
+                    queue.push((task_id, None), priority, client)
+            queues[kind] = queue
+        return queues
+
+    def _queues(self) -> dict[str, FairQueue]:
+        with self._lock:
+            now = time.time()
+            if self._snapshot is None or now - self._snapshot[0] > SNAPSHOT_TTL:
+                with self._store.transaction(immediate=False) as conn:
+                    self._snapshot = (now, self._build(conn))
+            return self._snapshot[1]
+
+    def invalidate(self) -> None:
+        """丢弃缓存的队列快照（本进程改动了队列，或看到别的进程认领了任务）。"""
+        with self._lock:
+            self._snapshot = None
+
+    # -- TaskScheduler interface (web process) ------------------------------
+
+    def live_workers(self) -> list[dict]:
+        cutoff = time.time() - self._stale_after
+        with self._store.transaction(immediate=False) as conn:
+            rows = conn.execute(
+                'SELECT worker_id, host, pid, capacity, started_at, heartbeat_at FROM workers'
+                ' WHERE heartbeat_at >= ?', (cutoff,)).fetchall()
+        return [
+            {'worker_id': r[0], 'host': r[1], 'pid': r[2], 'capacity': json.loads(r[3]),
+             'started_at': r[4], 'heartbeat_at': r[5]}
+            for r in rows
+        ]
+
+    def limit(self, kind: str) -> int:
+        """在线工作进程为 `kind` 提供的并发数之和。"""
+        return sum(w['capacity'].get(kind, 0) for w in self.live_workers())
+
+    def submit(self, kind, task_id, fn=None, priority=DEFAULT_PRIORITY, client=None) -> int:
+        """任务记录已经以 `queued` 状态写入库，工作进程会来认领；`fn` 不用。"""
+        self.invalidate()
+        return self.position(task_id)
+
+    def position(self, task_id: str) -> int | None:
+        with self._lock:
+            for queue in self._queues().values():
+                pos = queue.position(task_id)
+                if pos is not None:
+                    return pos
+        return None
+
+    def preview(self, kind: str, priority: str = DEFAULT_PRIORITY, client: str | None = None) -> int:
+        probe = object()
+        with self._lock:
+            queue = self._queues().get(kind)
+            if queue is None:
+                return 1
+            queue.push((probe, None), priority, client)
+            try:
+                return queue.position(probe)
+            finally:
+                queue.remove(probe)
+
+    def remove(self, task_id: str) -> bool:
+        """把仍在排队的任务直接标记为 cancelled（原子操作，不会与认领冲突）。"""
+        removed = self._store.update(task_id, when_status=('queued',), status='cancelled')
+        self.invalidate()
+        return removed
+
+    def reprioritize(self, task_id: str, priority: str, client: str | None = None) -> bool:
+        task = self._store.get(task_id, with_result=False)
+        if task is None or task['status'] != 'queued':
+            return False
+        old = task.get('priority') or DEFAULT_PRIORITY
+        if self._weights.get(priority, 1.0) <= self._weights.get(old, 1.0):
+            return False
+        updated = self._store.update(task_id, when_status=('queued',), priority=priority, client=client)
+        self.invalidate()
+        return updated
+
+    def stats(self) -> dict[str, dict]:
+        with self._lock:
+            queues = {kind: (len(q), q.counts()) for kind, q in self._queues().items()}
+        with self._store.transaction(immediate=False) as conn:
+            running = dict(conn.execute(
+                "SELECT kind, COUNT(*) FROM tasks WHERE status = 'running' AND kind != 'batch'"
+                " GROUP BY kind").fetchall())
+        capacity: dict[str, int] = {}
+        for worker in self.live_workers():
+            for kind, n in worker['capacity'].items():
+                capacity[kind] = capacity.get(kind, 0) + n
+        return {
+            kind: {
+                'queued': queues.get(kind, (0, {}))[0],
+                'queued_by_priority': queues.get(kind, (0, {}))[1],
+                'running': running.get(kind, 0),
+                'limit': capacity.get(kind, 0),
+            }
+            for kind in sorted(set(queues) | set(running) | set(capacity))
+        }
+
+    def reap_stale(self, reason: str = '工作进程失联，任务被中断') -> list[dict]:
+        """把心跳超时的运行中任务标记为 interrupted，返回这些任务。"""
+        now = time.time()
+        cutoff = now - self._stale_after
+        with self._store.transaction() as conn:
+            rows = conn.execute(
+                "SELECT task_id, kind, parent_id FROM tasks WHERE status = 'running'"
+                " AND kind != 'batch' AND COALESCE(heartbeat_at, started_at, created_at) < ?",
+                (cutoff,)).fetchall()
+            if rows:
+                conn.execute(
+                    f"UPDATE tasks SET status = 'interrupted', error = ?, finished_at = ?,"
+                    f" updated_at = ? WHERE task_id IN ({', '.join('?' for _ in rows)})",
+                    (reason, now, now, *(r[0] for r in rows)))
+            conn.execute('DELETE FROM workers WHERE heartbeat_at < ?', (cutoff - self._stale_after,))
+        return [{'task_id': r[0], 'kind': r[1], 'parent_id': r[2]} for r in rows]
+
+    # -- worker side ---------------------------------------------------------
+
+    def claim(self, kind: str, worker_id: str) -> dict | None:
+        """认领 `kind` 队列里下一个该出队的任务并标记为 running；队列为空时返回 None。"""
+        now = time.time()
+        with self._store.transaction() as conn:
+            queue = self._build(conn, [kind]).get(kind)
+            if queue is None:
+                return None
+            task_id, _ = queue.pop()
+            passes, vtime = queue.state()
+            conn.executemany(
+                'INSERT INTO queue_state (kind, priority, pass) VALUES (?, ?, ?)'
+                ' ON CONFLICT (kind, priority) DO UPDATE SET pass = excluded.pass',
+                [(kind, p, v) for p, v in passes.items()])
+            conn.execute(
+                'INSERT INTO queue_clock (kind, vtime) VALUES (?, ?)'
+                ' ON CONFLICT (kind) DO UPDATE SET vtime = excluded.vtime', (kind, vtime))
+            conn.execute(
+                "UPDATE tasks SET status = 'running', started_at = ?, worker = ?,"
+                " heartbeat_at = ?, updated_at = ? WHERE task_id = ? AND status = 'queued'",
+                (now, worker_id, now, now, task_id))
+        return self._store.get(task_id, with_result=False)
+
+    def heartbeat(self, worker_id: str, capacity: dict[str, int], task_ids) -> dict[str, str]:
+        """登记工作进程、刷新其任务的心跳，返回这些任务里被请求取消的 `{task_id: 原因}`。"""
+        now = time.time()
+        task_ids = list(task_ids)
+        with self._store.transaction() as conn:
+            conn.execute(
+                'INSERT INTO workers (worker_id, host, pid, capacity, started_at, heartbeat_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (worker_id) DO UPDATE SET'
+                ' capacity = excluded.capacity, heartbeat_at = excluded.heartbeat_at',
+                (worker_id, socket.gethostname(), os.getpid(), json.dumps(capacity), now, now))
+            if not task_ids:
+                return {}
+            marks = ', '.join('?' for _ in task_ids)
+            conn.execute(f'UPDATE tasks SET heartbeat_at = ? WHERE task_id IN ({marks})',
+                         (now, *task_ids))
+            rows = conn.execute(
+                f'SELECT task_id, cancel_requested FROM tasks'
+                f' WHERE task_id IN ({marks}) AND cancel_requested IS NOT NULL',
+                task_ids).fetchall()
+        return {task_id: reason for task_id, reason in rows}
+
+    def unregister(self, worker_id: str) -> None:
+        with self._store.transaction() as conn:
+            conn.execute('DELETE FROM workers WHERE worker_id = ?', (worker_id,))
@@ -0,0 +1,250 @@
+"""生成任务的定义：把一个生成请求变成可以在任何进程里执行的 `job(ctx)`。
+
+网页进程里的调度器和独立的工作进程（worker.py）都从这里构造任务：请求先被规范化
+成 `spec`（补齐默认值），任务记录里只存 `spec`，工作进程拿它重新构造出同一个 `job`。
+每个任务写进自己的工作区 `ctx.workspace`（`outputs/tasks/<task_id>/`），结果里的
+文件列表取自工作区的 `manifest.json`，路径都相对 `outputs/`。
+"""
+from __future__ import annotations
+
+from pathlib import Path
+
+from . import DataLoader
+from . import media
+from .workspace import artifact_paths
+from .traits import format_trait
+
+# Initialize data loader
+data_loader = DataLoader()
+
+# Load metadata
+neopir_meta = data_loader.load_meta("NEO-PI-R")
+neopir = data_loader.load("NEO-PI-R", "zh")
+sjts_data = data_loader.load("PSJT-Mussel", "zh")
+
+# Output directory (task workspaces live under outdir/tasks/)
+outdir = Path("./outputs")
+outdir.mkdir(exist_ok=True, parents=True)
+
+
+class JobRequestError(Exception):
+    """A generation request that cannot be turned into a job (HTTP status attached)."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _require_ids(data):
+    trait_id = data.get('trait_id')
+    item_id = data.get('item_id')
+    if not trait_id or not item_id:
+        raise JobRequestError('Missing trait_id or item_id')
+    return trait_id, item_id
+
+
+def _require_situation(trait_id, item_id):
+    if trait_id not in sjts_data or item_id not in sjts_data[trait_id]:
+        raise JobRequestError('SJT situation not found for this trait/item', 404)
+
+
+def _manifest_fields(manifest):
+    """Result fields shared by every job: where its files are and what they are."""
+    return {
+        'workspace': manifest['workspace'],
+        'manifest_file': f"{manifest['workspace']}/manifest.json",
+        'artifacts': manifest['artifacts'],
+    }
+
+
+def _text_job(data):
+    """Validate a text request and return `(label, job, spec)`.
+
+    `spec` is the request with defaults filled in: two requests with equal
+    specs produce the same item.
+    """
+    trait_id, item_id = _require_ids(data)
+    situation_theme = data.get('situation_theme', '大学生活')
+    target_population = data.get('target_population', '中国大学生')
+    n_items = data.get('n_items', 1)
+
+    # Get trait info
+    trait_meta = neopir_meta[trait_id]
+    item_text = neopir[trait_id]['items'][item_id]['item']
+
+    def job(ctx):
+        # 各链路在第一次跑对应任务时才导入（见 src/__init__.py）
+        from . import TxtAgent
+
+        # Initialize agent
+        txt_agent = TxtAgent(
+            situation_theme=situation_theme,
+            target_population=target_population,
+        )
+
+        # Generate SJT
+        result = txt_agent.run(
+            trait_name=trait_meta['facet_name'],
+            trait_description=trait_meta['description'],
+            low_score=trait_meta['low_score'],
+            high_score=trait_meta['high_score'],
+            item=item_text,
+            n_item=n_items,
+            outdir=ctx.workspace.path,
+            out_basename=f"SJT_{trait_id}_{item_id}",
+            on_progress=ctx.on_progress,
+            cancel=ctx.cancel,
+        )
+
+        # Handle different result structures
+        if isinstance(result, dict):
+            result_data = result.get('items', result)
+        else:
+            result_data = result
+
+        # Ensure result_data is a list
+        if not isinstance(result_data, list):
+            result_data = [result_data] if result_data else []
+
+        manifest = ctx.workspace.write_manifest(kind='text', spec=spec)
+        return {
+            'success': True,
+            'result': result_data,
+            'output_file': ctx.workspace.rel(f"SJT_{trait_id}_{item_id}.json"),
+            **_manifest_fields(manifest),
+        }
+
+    spec = {
+        'trait_id': trait_id,
+        'item_id': item_id,
+        'situation_theme': situation_theme,
+        'target_population': target_population,
+        'n_items': n_items,
+    }
+    return f"文字题目 {trait_id}-{item_id}", job, spec
+
+
+def _image_job(data):
+    """Validate an image request and return `(label, job, spec)`."""
+    trait_id, item_id = _require_ids(data)
+    ref_character = data.get('ref_character', 'male')
+    run_bubble = data.get('run_bubble', True)
+
+    # Get trait info
+    trait_meta = neopir_meta[trait_id]
+
+    # Get SJT situation data
+    _require_situation(trait_id, item_id)
+
+    basename = f"SJT_{trait_id}_{item_id}"
+
+    def job(ctx):
+        from . import ImgAgent, ref_viz
+
+        # Initialize agent
+        img_agent = ImgAgent(
+            situ=sjts_data[trait_id][item_id],
+            # 提示词以大五维度为框架，只给面名称（如「价值观」）时模型会拒答，
+            # 所以补上所属维度。
+            trait=format_trait(trait_id, trait_meta),
+            ref_viz=ref_viz.get(ref_character, ref_viz['male'])
+        )
+
+        # Generate image SJT
+        result = img_agent.run(
+            run_bubble=run_bubble,
+            outdir=str(ctx.workspace.path),
+            out_basename=basename,
+            on_progress=ctx.on_progress,
+            cancel=ctx.cancel,
+        )
+
+        manifest = ctx.workspace.write_manifest(kind='image', spec=spec)
+        images = artifact_paths(manifest, 'image')
+
+        # The situation sequence is what the page shows; single panels stay in the manifest
+        image_files = []
+        if result and 'situation' in result:
+            situation = ctx.workspace.rel(Path(result['situation']).name)
+            if situation in images:
+                image_files.append(situation)
+
+        # WebP thumbnails/previews for the sequence and the single panels
+        media.make_for_files(outdir, images)
+
+        return {
+            'success': True,
+            'result': result,
+            'output_file': ctx.workspace.rel(basename),
+            'image_files': image_files,  # List of generated image files
+            'has_images': len(image_files) > 0,
+            **_manifest_fields(manifest),
+        }
+
+    spec = {
+        'trait_id': trait_id,
+        'item_id': item_id,
+        'ref_character': ref_character,
+        'run_bubble': run_bubble,
+    }
+    return f"图片题目 {trait_id}-{item_id}", job, spec
+
+
+def _video_job(data):
+    """Validate a video request and return `(label, job, spec)`."""
+    trait_id, item_id = _require_ids(data)
+
+    # Get trait info
+    trait_meta = neopir_meta[trait_id]
+
+    # Get SJT situation data
+    _require_situation(trait_id, item_id)
+
+    basename = f"SJT_{trait_id}_{item_id}"
+
+    def job(ctx):
+        from . import VidAgent
+
+        # Initialize agent
+        vid_agent = VidAgent(
+            situ=sjts_data[trait_id][item_id],
+            # 同图像流程：反思智能体按大五维度对齐构念，需要维度信息
+            trait=format_trait(trait_id, trait_meta),
+        )
+
+        # Generate video SJT
+        result = vid_agent.run(
+            outdir=ctx.workspace.path,
+            out_basename=basename,
+            on_progress=ctx.on_progress,
+            cancel=ctx.cancel,
+        )
+
+        manifest = ctx.workspace.write_manifest(kind='video', spec=spec)
+        video_files = artifact_paths(manifest, 'video')
+
+        return {
+            'success': True,
+            'result': result,
+            'output_file': ctx.workspace.rel(basename),
+            'video_files': video_files,  # List of generated video files
+            'has_videos': len(video_files) > 0,
+            **_manifest_fields(manifest),
+        }
+
+    spec = {'trait_id': trait_id, 'item_id': item_id}
+    return f"视频题目 {trait_id}-{item_id}", job, spec
+
+
+JOB_BUILDERS = {
+    'text': _text_job,
+    'image': _image_job,
+    'video': _video_job,
+}
+
+
+def build_job(kind, data):
+    """`JOB_BUILDERS[kind](data)`，未知类型抛出 `JobRequestError`。"""
+    if kind not in JOB_BUILDERS:
+        raise JobRequestError(f'Unknown job kind: {kind}')
+    return JOB_BUILDERS[kind](data)
@@ -0,0 +1,397 @@
+"""LLM 响应缓存（默认关闭）。
+
+步骤重试、整题重试（`retry.task_attempts`）和本地反复调试（比如改 `BubbleIt`）
+都会把完全相同的提示词再发一遍上游：同一情境的 `sg_generation`、同一个维度的
+`trait_decoder`……这里在 OpenAI 客户端这一层按「接口 + 渲染好的消息 + 模型 +
+采样参数」的哈希缓存响应，存在本地的 SQLite 文件里（config.yaml 的
+`llm_cache.path`），多个进程共用：
+
+- lmitf 的 `TemplateLLM`/`BaseLLM`（`chat.completions`，同步与 `acall` 共用条目）和
+  `AgentLLM`（`responses`）经 `metrics.instrument_llm` 换上带缓存的客户端；视频
+  智能体工具里的 LangChain `ChatOpenAI` 用 `cached_chat_model` 包一层。
+- 模式（`llm_cache.mode`）：`off` 不缓存；`read_through` 命中直接返回、未命中调用
+  后写入；`record` 总是调用上游并写入（覆盖旧条目）；`replay` 只读缓存，未命中
+  抛 `LLMCacheMiss`，不会发出任何请求。
+- 条目超过 `ttl_hours` 视为过期；文件里的响应总量超过 `max_mb` 时淘汰最久没用过的。
+- 每次查找按提示词模板计入 `sjt_llm_cache_total` 指标（hit / miss / stored）。
+
+缓存的是上游的原始响应，模板渲染、JSON 解析、`call_history` 照常在 lmitf 里做。
+响应要等 lmitf 解析成功（`deferred_store` 块正常结束）才写入；解析失败的命中条目
+随即删掉，截断、格式不对的响应不会在步骤重试和整题重试里被反复回放。
+温度不为 0 的调用也会被缓存——打开缓存就是要复现上次的输出。
+"""
+from __future__ import annotations
+
+import contextvars
+import functools
+import hashlib
+import json
+import os
+import os.path as op
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+from .config import CONFIG
+
+_LLM_CACHE_CFG = CONFIG.get('llm_cache', {}) or {}
+
+MODES = ('off', 'read_through', 'record', 'replay')
+# YAML 里不加引号的 off 会读成 False
+MODE = str(_LLM_CACHE_CFG.get('mode') or 'off').lower()
+if MODE not in MODES:
+    raise ValueError(f'llm_cache.mode must be one of {MODES}, got {MODE!r}')
+CACHE_PATH = str(_LLM_CACHE_CFG.get('path', 'data/llm_cache.sqlite3'))
+# 条目的有效期（秒）；<= 0 表示不过期
+TTL = float(_LLM_CACHE_CFG.get('ttl_hours', 168)) * 3600
+# 响应总量上限（字节）；<= 0 表示不限
+MAX_BYTES = int(float(_LLM_CACHE_CFG.get('max_mb', 256)) * 1024 * 1024)
+# 两次淘汰之间至少间隔多少秒（淘汰在写入时顺带做）
+EVICT_INTERVAL = 60
+
+# 不影响响应内容、不参与键的请求参数
+_VOLATILE_PARAMS = ('timeout', 'extra_headers')
+
+
+# `deferred_store` 块里攒下的 (key, endpoint, 响应, template, model)；响应为 None 的是命中
+_pending: contextvars.ContextVar[list | None] = contextvars.ContextVar('sjt_llm_cache_pending', default=None)
+
+
+class LLMCacheMiss(LookupError):
+    """`replay` 模式下缓存里没有这个请求。"""
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key         TEXT PRIMARY KEY,
+    endpoint    TEXT NOT NULL,
+    template    TEXT,
+    model       TEXT,
+    response    TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    created_at  REAL NOT NULL,
+    hits        INTEGER NOT NULL DEFAULT 0,
+    last_hit_at REAL
+);
+CREATE INDEX IF NOT EXISTS llm_cache_used ON llm_cache (COALESCE(last_hit_at, created_at))
+"""
+
+
+def _count(template: str | None, result: str) -> None:
+    from . import metrics
+
+    metrics.inc('sjt_llm_cache_total', template=template or '', result=result)
+
+
+class LLMCache:
+    """LLM 响应缓存的存储；所有方法线程安全。
+
+    Parameters
+    ----------
+    path : str
+        SQLite 文件路径，父目录不存在时自动创建。
+    mode : str
+        `MODES` 之一。
+    ttl : float
+        条目有效期（秒），<= 0 不过期。
+    max_bytes : int
+        响应总量上限（字节），<= 0 不限。
+    """
+
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        mode: str = MODE,
+        ttl: float = TTL,
+        max_bytes: int = MAX_BYTES,
+    ):
+        self.path = op.abspath(path)
+        self.mode = mode
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(op.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._transaction() as conn:
+            for statement in _SCHEMA.split(';'):
+                conn.execute(statement)
+        self._last_evict = 0.0
+
+    @contextmanager
+    def _transaction(self, immediate: bool = True) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    @staticmethod
+    def key(endpoint: str, request: dict) -> str:
+        """请求的缓存键：接口名加上去掉超时等无关项后的全部参数。"""
+        payload = {'endpoint': endpoint,
+                   'request': {k: v for k, v in request.items() if k not in _VOLATILE_PARAMS}}
+        data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Any | None:
+        """取出响应；没有或已过期时返回 None（过期的顺手删掉）。"""
+        with self._transaction() as conn:
+            row = conn.execute('SELECT response, created_at FROM llm_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl > 0 and row['created_at'] < time.time() - self.ttl:
+                conn.execute('DELETE FROM llm_cache WHERE key = ?', (key,))
+                return None
+            conn.execute('UPDATE llm_cache SET hits = hits + 1, last_hit_at = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row['response'])
+
+    def put(self, key: str, endpoint: str, response, template: str | None = None, model: str | None = None) -> None:
+        """写入（覆盖）一条响应，必要时顺带淘汰。"""
+        data = json.dumps(response, ensure_ascii=False, default=str)
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO llm_cache (key, endpoint, template, model, response, size, created_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, endpoint, template, model, data, len(data.encode('utf-8')), time.time()),
+            )
+        if time.monotonic() - self._last_evict >= EVICT_INTERVAL:
+            self.evict()
+
+    def evict(self) -> int:
+        """删掉过期条目，再按最近使用时间从旧到新删到总量不超过上限；返回删除的条数。"""
+        self._last_evict = time.monotonic()
+        removed = 0
+        with self._transaction() as conn:
+            if self.ttl > 0:
+                removed += conn.execute('DELETE FROM llm_cache WHERE created_at < ?',
+                                        (time.time() - self.ttl,)).rowcount
+            if self.max_bytes > 0:
+                removed += conn.execute(
+                    'DELETE FROM llm_cache WHERE key IN (SELECT key FROM ('
+                    '  SELECT key, SUM(size) OVER (ORDER BY COALESCE(last_hit_at, created_at) DESC, key)'
+                    '  AS running FROM llm_cache) WHERE running > ?)', (self.max_bytes,)).rowcount
+        return removed
+
+    def delete(self, key: str) -> bool:
+        """删掉一条响应，返回它原先是否存在。"""
+        with self._transaction() as conn:
+            return conn.execute('DELETE FROM llm_cache WHERE key = ?', (key,)).rowcount > 0
+
+    def clear(self) -> int:
+        """清空缓存，返回删除的条数。"""
+        with self._transaction() as conn:
+            return conn.execute('DELETE FROM llm_cache').rowcount
+
+    def stats(self) -> dict:
+        """条目数、响应总字节数、累计命中数，以及按提示词模板的细分。"""
+        with self._transaction(immediate=False) as conn:
+            rows = conn.execute(
+                'SELECT template, COUNT(*) AS entries, SUM(size) AS bytes, SUM(hits) AS hits'
+                ' FROM llm_cache GROUP BY template').fetchall()
+        templates = {row['template'] or '': {'entries': row['entries'], 'bytes': row['bytes'], 'hits': row['hits']}
+                     for row in rows}
+        return {
+            'mode': self.mode,
+            'path': self.path,
+            'entries': sum(t['entries'] for t in templates.values()),
+            'bytes': sum(t['bytes'] for t in templates.values()),
+            'hits': sum(t['hits'] for t in templates.values()),
+            'templates': templates,
+        }
+
+    # ---- 按模式查找与写入 ----
+
+    def lookup(self, endpoint: str, request: dict, template: str | None = None) -> tuple[str, Any | None]:
+        """按模式查缓存，返回 `(key, 命中的响应或 None)`。
+
+        `replay` 模式下未命中时抛 `LLMCacheMiss`；`record` 模式不读缓存。
+        """
+        key = self.key(endpoint, request)
+        if self.mode == 'record':
+            return key, None
+        hit = self.get(key)
+        _count(template, 'hit' if hit is not None else 'miss')
+        if hit is None and self.mode == 'replay':
+            raise LLMCacheMiss(f'{template or endpoint}: 缓存里没有这个请求（llm_cache.mode = replay）')
+        return key, hit
+
+    def store(self, key: str, endpoint: str, response, template: str | None = None,
+              model: str | None = None) -> None:
+        """调用方解析成功之后记下响应（`replay` 模式下不会走到这里）。"""
+        self.put(key, endpoint, response, template=template, model=model)
+        _count(template, 'stored')
+
+    def discard(self, key: str) -> None:
+        """命中的响应解析失败时删掉它，下次改问上游；`replay` 模式下保留录制的内容。"""
+        if self.mode != 'replay':
+            self.delete(key)
+
+
+_cache: LLMCache | None = None
+_cache_pid: int | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> LLMCache | None:
+    """进程内共享的缓存；`llm_cache.mode` 为 off 时返回 None。fork 出的子进程会重新打开文件。"""
+    global _cache, _cache_pid
+    if MODE == 'off':
+        return None
+    with _cache_lock:
+        if _cache is None or _cache_pid != os.getpid():
+            _cache = LLMCache()
+            _cache_pid = os.getpid()
+        return _cache
+
+
+@contextmanager
+def deferred_store() -> Iterator[None]:
+    """块内经缓存客户端拿到的上游响应，等块正常结束（lmitf 已解析、校验通过）才写入；
+    块内抛出异常时一条也不写，块内命中的条目也删掉。`metrics.instrument_llm` 用它包住
+    每次 `.call`。"""
+    pending: list = []
+    token = _pending.set(pending)
+    try:
+        yield
+    except BaseException:
+        cache = get_cache()
+        if cache is not None:
+            for key, _, response, _, _ in pending:
+                if response is None:
+                    cache.discard(key)
+        raise
+    else:
+        cache = get_cache()
+        if cache is not None:
+            for key, endpoint, response, template, model in pending:
+                if response is not None:
+                    cache.store(key, endpoint, response, template, model)
+    finally:
+        _pending.reset(token)
+
+
+# ---- OpenAI 客户端 ----
+
+def _decode(endpoint: str, data: dict):
+    if endpoint == 'responses':
+        from openai.types.responses import Response
+
+        return Response.model_validate(data)
+    from openai.types.chat import ChatCompletion
+
+    return ChatCompletion.model_validate(data)
+
+
+def _cached_create(create: Callable, endpoint: str, template: str | None, **params):
+    cache = get_cache()
+    if cache is None or params.get('stream'):
+        return create(**params)
+    key, hit = cache.lookup(endpoint, params, template)
+    pending = _pending.get()
+    if hit is not None:
+        if pending is not None:
+            pending.append((key, endpoint, None, template, params.get('model')))
+        return _decode(endpoint, hit)
+    response = create(**params)
+    entry = (key, endpoint, response.model_dump(mode='json'), template, params.get('model'))
+    if pending is not None:
+        pending.append(entry)
+    else:
+        cache.store(*entry)
+    return response
+
+
+class _Override:
+    """转发到 `target` 的代理，只换掉给定的几个属性。"""
+
+    def __init__(self, target, **overrides):
+        self._target = target
+        self.__dict__.update(overrides)
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+
+class _CachedClient:
+    """OpenAI 客户端的代理：`chat.completions.create` 与 `responses.create` 先查缓存，
+    其余属性原样转发。`with_options` 返回的副本同样带缓存，可以再套 `deadline.bound_client`。"""
+
+    def __init__(self, client, template: str | None = None):
+        self._client = client
+        self.cache_template = template
+
+    @property
+    def chat(self):
+        completions = self._client.chat.completions
+        return _Override(self._client.chat, completions=_Override(
+            completions, create=functools.partial(_cached_create, completions.create, 'chat.completions',
+                                                  self.cache_template)))
+
+    @property
+    def responses(self):
+        responses = self._client.responses
+        return _Override(responses, create=functools.partial(
+            _cached_create, responses.create, 'responses', self.cache_template))
+
+    def with_options(self, **kwargs):
+        return _CachedClient(self._client.with_options(**kwargs), self.cache_template)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def cached_client(client, template: str | None = None):
+    """给 OpenAI 客户端套上响应缓存；缓存关闭时原样返回。"""
+    if client is None or MODE == 'off' or isinstance(client, _CachedClient):
+        return client
+    return _CachedClient(client, template)
+
+
+# ---- LangChain 聊天模型 ----
+
+class _CachedChatModel(_Override):
+    def invoke(self, messages, **kwargs):
+        from langchain_core.messages import convert_to_messages, messages_from_dict, messages_to_dict
+
+        cache = get_cache()
+        if cache is None:
+            return self._target.invoke(messages, **kwargs)
+        request = {
+            # 模型名、温度等，LangChain 自己的缓存键也用它
+            'model': self._target._get_invocation_params(),
+            'messages': messages_to_dict(convert_to_messages(messages)),
+            **kwargs,
+        }
+        template = self.template
+        key, hit = cache.lookup('langchain', request, template)
+        if hit is not None:
+            return messages_from_dict([hit])[0]
+        response = self._target.invoke(messages, **kwargs)
+        # 工具把空响应当作失败处理，不缓存
+        if getattr(response, 'content', None):
+            cache.store(key, 'langchain', messages_to_dict([response])[0], template=template,
+                        model=getattr(self._target, 'model_name', None))
+        return response
+
+
+def cached_chat_model(model, template: str | None = None):
+    """给 LangChain 聊天模型（如 `ChatOpenAI`）的 `invoke` 套上响应缓存；缓存关闭时原样返回。"""
+    if MODE == 'off':
+        return model
+    return _CachedChatModel(model, template=template)
+
+
+def template_of(client) -> str | None:
+    """`cached_client` 包过的客户端记下的提示词模板名（供异步通路计数用）。"""
+    from .deadline import unbound_client
+
+    client = unbound_client(client)
+    return client.cache_template if isinstance(client, _CachedClient) else None
@@ -0,0 +1,134 @@
+"""生成图片的缩略图/预览图，以及媒体文件的缓存策略。
+
+图像题的情境序列是 4 格 1024px 的 RGBA 长图，每格还单独存一张；结果页和 /quiz
+过去直接加载原图，一页就是几十 MB。这里为每张图生成 WebP 缩略图与预览图
+（尺寸见 config.yaml 的 `media.sizes`），放在同目录树下的 `.derived/` 里：
+图像任务保存结果时就生成，没生成过的（比如下载来的 generated/ 题库）在第一次
+被请求时补上，也可以提前批量生成::
+
+    uv run python -m src.media generated outputs
+"""
+from __future__ import annotations
+
+import logging
+import os
+import sys
+import threading
+from pathlib import Path
+
+from .config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+_MEDIA_CFG = CONFIG.get('media', {}) or {}
+
+# 派生图规格名 -> 最大宽度（像素）
+SIZES: dict[str, int] = {
+    name: int(width)
+    for name, width in (_MEDIA_CFG.get('sizes') or {'thumb': 320, 'preview': 1280}).items()
+}
+WEBP_QUALITY = int(_MEDIA_CFG.get('webp_quality', 80))
+# generated/ 下的成品题库不会变，浏览器可以缓存这么久（秒）；outputs/ 下的文件重新生成时
+# 会被同名覆盖，总是先用 ETag 向服务器确认
+STATIC_MAX_AGE = int(_MEDIA_CFG.get('static_max_age', 7 * 86400))
+
+DERIVED_DIR = '.derived'
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.webp')
+
+_locks: dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(path: Path) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(str(path), threading.Lock())
+
+
+def is_image(name) -> bool:
+    return str(name).lower().endswith(IMAGE_SUFFIXES)
+
+
+def derivative_path(root, rel: str, size: str) -> Path:
+    """`root/rel` 的 `size` 规格派生图路径（不保证存在）。"""
+    return Path(root) / DERIVED_DIR / f'{rel}.{size}.webp'
+
+
+def _fresh(source: Path, derived: Path) -> bool:
+    try:
+        return derived.stat().st_mtime_ns >= source.stat().st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def make_derivatives(root, rel: str, sizes=None) -> dict[str, Path]:
+    """为 `root/rel` 生成各规格的 WebP 派生图，返回 `{规格: 路径}`；已是最新的不重做。
+
+    原图比目标宽度还窄时按原尺寸转成 WebP。
+    """
+    from PIL import Image
+
+    source = Path(root) / rel
+    out = {}
+    with Image.open(source) as image:
+        image.load()
+        for size in (SIZES if sizes is None else sizes):
+            derived = derivative_path(root, rel, size)
+            with _lock_for(derived):
+                if not _fresh(source, derived):
+                    width = SIZES[size]
+                    variant = image
+                    if image.width > width:
+                        height = max(1, round(image.height * width / image.width))
+                        variant = image.resize((width, height), Image.Resampling.LANCZOS)
+                    derived.parent.mkdir(parents=True, exist_ok=True)
+                    tmp = derived.with_name(f'{derived.name}.{os.getpid()}.tmp')
+                    variant.save(tmp, 'WEBP', quality=WEBP_QUALITY, method=4)
+                    os.replace(tmp, derived)
+            out[size] = derived
+    return out
+
+
+def derivative_for(root, rel: str, size: str) -> Path | None:
+    """`root/rel` 的 `size` 规格派生图，过期或不存在就现做；做不了（不是图片、
+    文件损坏等）时返回 None，由调用方回退到原图。
+    """
+    source = Path(root) / rel
+    if size not in SIZES or not is_image(rel) or not source.is_file():
+        return None
+    derived = derivative_path(root, rel, size)
+    if _fresh(source, derived):
+        return derived
+    try:
+        return make_derivatives(root, rel, [size])[size]
+    except Exception:  # noqa: BLE001 - 派生图只是优化，失败就给原图
+        logger.exception('生成 %s 的派生图失败', rel)
+        return None
+
+
+def make_for_files(root, names) -> None:
+    """图像任务保存结果后调用：为 `names`（相对 `root`）里的图片生成全部派生图。"""
+    for name in names:
+        if not is_image(name) or not (Path(root) / name).is_file():
+            continue
+        try:
+            make_derivatives(root, name)
+        except Exception:  # noqa: BLE001 - 不影响任务本身，请求时还会再补
+            logger.exception('生成 %s 的派生图失败', name)
+
+
+def backfill(root) -> int:
+    """为 `root` 下所有图片补齐派生图，返回处理的图片数。"""
+    root = Path(root)
+    count = 0
+    for path in sorted(root.rglob('*')):
+        rel = path.relative_to(root)
+        if DERIVED_DIR in rel.parts or not path.is_file() or not is_image(path):
+            continue
+        make_for_files(root, [rel.as_posix()])
+        count += 1
+    return count
+
+
+if __name__ == '__main__':
+    for directory in sys.argv[1:] or ['outputs']:
+        print(f'{directory}: {backfill(directory)} images')
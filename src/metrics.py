@@ -0,0 +1,298 @@
+"""Prometheus 文本格式的运行指标。
+
+回答「图像流水线的 p95 是多少」「哪一步重试最多」「队列有多深」这类问题。
+各处埋点只往进程内的计数器里累加（`inc` / `observe`，都是 O(1) 的字典操作），
+`MetricsStore` 定期把增量合并进任务库的 `metrics` 表：网页进程和各个工作进程
+（worker.py）的指标因此汇总在一起，`/metrics` 读表即可，进程重启也不会让计数器
+归零。任务数与队列深度这类当前值在抓取时直接从任务表统计。
+
+指标一览见 `METRICS`；直方图按 Prometheus 的约定展开成 `_bucket`/`_sum`/`_count`。
+"""
+from __future__ import annotations
+
+import functools
+import json
+import logging
+import math
+import threading
+import time
+from typing import Any, Callable, Iterable
+
+from . import async_llm, deadline, llm_cache
+from .config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+_METRICS_CFG = CONFIG.get('metrics', {}) or {}
+
+# 各进程把进程内增量写进任务库的间隔（秒）
+FLUSH_INTERVAL = float(_METRICS_CFG.get('flush_interval', 10))
+# 耗时直方图的桶（秒）：单次 LLM 调用在秒级，出片要十几分钟
+DURATION_BUCKETS: tuple[float, ...] = tuple(float(b) for b in _METRICS_CFG.get(
+    'buckets', (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 2400)))
+
+# 指标名 -> (类型, 说明)
+METRICS = {
+    'sjt_tasks': ('gauge', 'Tasks in the task store by kind and status.'),
+    'sjt_queue_depth': ('gauge', 'Queued tasks by kind.'),
+    'sjt_task_duration_seconds': ('histogram', 'Run time of finished generation tasks.'),
+    'sjt_stage_duration_seconds': ('histogram', 'Run time of pipeline stages (one sample per attempt).'),
+    'sjt_retry_attempts_total': ('counter', 'retry_call attempts by label and result.'),
+    'sjt_llm_calls_total': ('counter', 'LLM calls by prompt template and result.'),
+    'sjt_llm_call_duration_seconds': ('histogram', 'LLM call latency by prompt template.'),
+    'sjt_llm_request_bytes_total': ('counter', 'Serialized size of LLM call arguments by prompt template.'),
+    'sjt_llm_response_bytes_total': ('counter', 'Serialized size of LLM responses by prompt template.'),
+    'sjt_llm_cache_total': ('counter', 'LLM response cache lookups by prompt template and result (hit, miss, stored).'),
+    'sjt_hailuo_polls_total': ('counter', 'Hailuo video task status polls by remote status.'),
+}
+
+_Key = tuple[str, tuple[tuple[str, str], ...]]
+
+
+def _labels(labels: dict) -> tuple[tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Metrics:
+    """进程内尚未写入任务库的指标增量；线程安全。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: dict[_Key, float] = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: Iterable[float] = DURATION_BUCKETS,
+                **labels) -> None:
+        """记一个直方图样本。"""
+        base = _labels(labels)
+        with self._lock:
+            for le in (*buckets, math.inf):
+                if value <= le:
+                    key = (f'{name}_bucket', tuple(sorted((*base, ('le', _format_value(le))))))
+                    self._pending[key] = self._pending.get(key, 0) + 1
+            for suffix, delta in (('_sum', value), ('_count', 1)):
+                key = (name + suffix, base)
+                self._pending[key] = self._pending.get(key, 0) + delta
+
+    def drain(self) -> dict[_Key, float]:
+        """取走全部增量。"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def restore(self, pending: dict[_Key, float]) -> None:
+        """写库失败时把取走的增量放回去，下次再写。"""
+        with self._lock:
+            for key, value in pending.items():
+                self._pending[key] = self._pending.get(key, 0) + value
+
+
+REGISTRY = Metrics()
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+
+
+def label_of(label: str) -> str:
+    """把带参数的步骤名（如 `emotion(小王)`）归一成指标标签 `emotion`，避免标签无限增长。"""
+    return label.split('(', 1)[0].strip() or 'unlabelled'
+
+
+# ---- LLM 调用 ----
+
+def _size(value: Any) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    content = getattr(value, 'content', None)  # langchain 的消息对象
+    if isinstance(content, str):
+        return len(content.encode('utf-8'))
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+    except (TypeError, ValueError):
+        return len(str(value).encode('utf-8'))
+
+
+def _llm_request(template: str, args, kwargs) -> float:
+    inc('sjt_llm_request_bytes_total', sum(map(_size, args)) + sum(
+        _size(v) for k, v in kwargs.items() if k not in ('model', 'response_format', 'timeout')), template=template)
+    return time.perf_counter()
+
+
+def _llm_done(template: str, start: float, result: str) -> None:
+    inc('sjt_llm_calls_total', template=template, result=result)
+    observe('sjt_llm_call_duration_seconds', time.perf_counter() - start, template=template)
+
+
+def llm_call(template: str, fn: Callable, *args, **kwargs):
+    """调用 `fn(*args, **kwargs)` 并按提示词模板 `template` 记下次数、耗时和收发字节数。"""
+    start = _llm_request(template, args, kwargs)
+    try:
+        result = fn(*args, **kwargs)
+    except BaseException:
+        _llm_done(template, start, 'error')
+        raise
+    _llm_done(template, start, 'ok')
+    inc('sjt_llm_response_bytes_total', _size(result), template=template)
+    return result
+
+
+async def llm_acall(template: str, fn: Callable, *args, **kwargs):
+    """`llm_call` 的异步版本：`await fn(*args, **kwargs)`，计量方式相同。"""
+    start = _llm_request(template, args, kwargs)
+    try:
+        result = await fn(*args, **kwargs)
+    except BaseException:
+        _llm_done(template, start, 'error')
+        raise
+    _llm_done(template, start, 'ok')
+    inc('sjt_llm_response_bytes_total', _size(result), template=template)
+    return result
+
+
+def instrument_llm(llm, template: str):
+    """让模板 LLM（lmitf 的 `TemplateLLM` 等带 `.call` 的对象）的每次 `.call` 都经过
+    `llm_call` 计量，并让它的客户端遵守任务时限（`deadline.bound_client`）、按
+    config.yaml 的 `llm_cache` 缓存响应（`llm_cache.cached_client`，`.call` 解析成功
+    才写入），返回原对象。
+
+    带 `_build_request_params` 的（`TemplateLLM`/`BaseLLM`）另外加一个协程方法
+    `acall`，参数与 `.call` 相同，走 src/async_llm.py 的异步客户端，同样计量。
+    """
+    call = llm.call
+    if hasattr(llm, 'client'):
+        llm.client = deadline.bound_client(llm_cache.cached_client(llm.client, template))
+
+    def metered_call(*args, **kwargs):
+        with llm_cache.deferred_store():
+            return llm_call(template, call, *args, **kwargs)
+
+    llm.call = metered_call
+    if hasattr(llm, '_build_request_params'):
+        acall = functools.partial(async_llm.call, llm)
+
+        async def metered_acall(*args, **kwargs):
+            return await llm_acall(template, acall, *args, **kwargs)
+
+        llm.acall = metered_acall
+    return llm
+
+
+# ---- 汇总与输出 ----
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics (
+    name   TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    value  REAL NOT NULL,
+    PRIMARY KEY (name, labels)
+)
+"""
+
+
+class MetricsStore:
+    """把各进程的指标增量汇总进任务库的 `metrics` 表。
+
+    Parameters
+    ----------
+    store : TaskStore
+        任务库。
+    metrics : Metrics
+        本进程的指标增量，默认为全局的 `REGISTRY`。
+    """
+
+    def __init__(self, store, metrics: Metrics = REGISTRY):
+        self._store = store
+        self._metrics = metrics
+        self._stop = threading.Event()
+        with store.transaction() as conn:
+            conn.execute(_SCHEMA)
+
+    def flush(self) -> None:
+        """把本进程的增量加进表里。"""
+        pending = self._metrics.drain()
+        if not pending:
+            return
+        try:
+            with self._store.transaction() as conn:
+                conn.executemany(
+                    'INSERT INTO metrics (name, labels, value) VALUES (?, ?, ?)'
+                    ' ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value',
+                    [(name, json.dumps(labels), value) for (name, labels), value in pending.items()],
+                )
+        except BaseException:
+            self._metrics.restore(pending)
+            raise
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        """表里的全部样本 `(名称, 标签, 值)`。"""
+        with self._store.transaction(immediate=False) as conn:
+            rows = conn.execute('SELECT name, labels, value FROM metrics').fetchall()
+        return [(row[0], dict(json.loads(row[1])), row[2]) for row in rows]
+
+    def _loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except Exception:  # noqa: BLE001 - 下次再写
+                logger.exception('指标写入任务库失败')
+
+    def start(self, interval: float = FLUSH_INTERVAL) -> None:
+        """在后台线程里每隔 `interval` 秒写一次。"""
+        threading.Thread(target=self._loop, args=(interval,), name='sjt-metrics', daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.flush()
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(float(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _family(name: str) -> str:
+    """样本名所属的指标（直方图的 `_bucket`/`_sum`/`_count` 归到直方图名下）。"""
+    for suffix in ('_bucket', '_sum', '_count'):
+        base = name[:-len(suffix)]
+        if name.endswith(suffix) and METRICS.get(base, ('',))[0] == 'histogram':
+            return base
+    return name
+
+
+def render(samples: Iterable[tuple[str, dict, float]]) -> str:
+    """把样本排成 Prometheus 文本格式（text/plain; version=0.0.4）。"""
+    families: dict[str, list[tuple[str, dict, float]]] = {}
+    for name, labels, value in samples:
+        families.setdefault(_family(name), []).append((name, labels, value))
+
+    def sort_key(sample):
+        name, labels, _ = sample
+        le = labels.get('le')
+        rest = sorted((k, v) for k, v in labels.items() if k != 'le')
+        return (rest, name, math.inf if le == '+Inf' else float(le) if le is not None else 0)
+
+    lines = []
+    for family in sorted(families):
+        kind, help_text = METRICS.get(family, ('untyped', ''))
+        if help_text:
+            lines.append(f'# HELP {family} {help_text}')
+        lines.append(f'# TYPE {family} {kind}')
+        for name, labels, value in sorted(families[family], key=sort_key):
+            label_text = ','.join(f'{k}="{_escape(str(v))}"' for k, v in sorted(labels.items()))
+            lines.append(f'{name}{{{label_text}}} {_format_value(value)}' if label_text
+                         else f'{name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,179 @@
+"""性能面板（/admin/perf）的数据汇总。
+
+数据全部来自进程内已有的埋点，不依赖外部服务：任务库里每个任务的阶段记录
+（`progress.stages`，见 src/progress.py）画成甘特图，按结束时间统计各模态的
+吞吐，`metrics` 表（见 src/metrics.py）给出重试热点和最慢的提示词模板，调度器
+的 `stats()` 给出当前各模态的并发占用。
+"""
+from __future__ import annotations
+
+import json
+import math
+import time
+
+from .config import CONFIG
+
+_PERF_CFG = CONFIG.get('perf_dashboard', {}) or {}
+
+# 甘特图展示最近多少个任务
+RECENT_TASKS = int(_PERF_CFG.get('recent_tasks', 30))
+# 吞吐曲线的时间窗口与分桶（秒）
+THROUGHPUT_WINDOW = float(_PERF_CFG.get('window_hours', 24)) * 3600
+THROUGHPUT_BUCKET = float(_PERF_CFG.get('bucket_minutes', 60)) * 60
+# 重试热点、慢模板各列出多少条
+TOP_N = int(_PERF_CFG.get('top_n', 10))
+
+
+def histogram_quantile(buckets: list[tuple[float, float]], q: float) -> float | None:
+    """按 Prometheus `histogram_quantile` 的做法从累计桶 `[(le, count), ...]` 估算分位数。
+
+    落在 `+Inf` 桶里时返回最大的有限上界；没有样本时返回 None。
+    """
+    buckets = sorted(buckets)
+    if not buckets or buckets[-1][1] <= 0:
+        return None
+    rank = q * buckets[-1][1]
+    lower, below = 0.0, 0.0
+    for le, count in buckets:
+        if count >= rank:
+            if le == math.inf:
+                return lower
+            if count == below:
+                return le
+            return lower + (le - lower) * (rank - below) / (count - below)
+        lower, below = le, count
+    return lower
+
+
+def _group(samples, name: str, key: str) -> dict[str, list[tuple[dict, float]]]:
+    groups: dict[str, list[tuple[dict, float]]] = {}
+    for sample_name, labels, value in samples:
+        if sample_name == name:
+            groups.setdefault(labels.get(key, ''), []).append((labels, value))
+    return groups
+
+
+def timelines(store, limit: int = RECENT_TASKS) -> list[dict]:
+    """最近开始的 `limit` 个任务（不含批量任务本身）及其各阶段的起止时间，按开始时间倒序。"""
+    with store.transaction(immediate=False) as conn:
+        rows = conn.execute(
+            "SELECT task_id, kind, label, status, started_at, finished_at, attempt, progress FROM tasks"
+            " WHERE kind != 'batch' AND started_at IS NOT NULL ORDER BY started_at DESC LIMIT ?",
+            (limit,)).fetchall()
+    tasks = []
+    for task_id, kind, label, status, started_at, finished_at, attempt, progress in rows:
+        stages = (json.loads(progress) if progress else {}).get('stages') or []
+        tasks.append({
+            'task_id': task_id,
+            'kind': kind,
+            'label': label,
+            'status': status,
+            'started_at': started_at,
+            'finished_at': finished_at,
+            'attempt': attempt,
+            'stages': [
+                {k: s.get(k) for k in ('name', 'attempt', 'status', 'started_at', 'ended_at')}
+                for s in stages if s.get('started_at') is not None
+            ],
+        })
+    return tasks
+
+
+def throughput(store, window: float = THROUGHPUT_WINDOW, bucket: float = THROUGHPUT_BUCKET,
+               now: float | None = None) -> dict:
+    """最近 `window` 秒内各模态每 `bucket` 秒结束的任务数（按结束状态分开）。
+
+    Returns
+    -------
+    dict
+        `{'start', 'bucket', 'series': {kind: {status: [每个桶的任务数, ...]}}}`，
+        第 i 个桶覆盖 `[start + i*bucket, start + (i+1)*bucket)`。
+    """
+    now = time.time() if now is None else now
+    slots = max(1, math.ceil(window / bucket))
+    start = now - slots * bucket
+    with store.transaction(immediate=False) as conn:
+        rows = conn.execute(
+            "SELECT kind, status, CAST((finished_at - ?) / ? AS INTEGER) AS slot, COUNT(*) FROM tasks"
+            " WHERE kind != 'batch' AND finished_at >= ? GROUP BY kind, status, slot",
+            (start, bucket, start)).fetchall()
+    series: dict[str, dict[str, list[int]]] = {}
+    for kind, status, slot, count in rows:
+        counts = series.setdefault(kind, {}).setdefault(status, [0] * slots)
+        counts[min(slot, slots - 1)] += count
+    return {'start': start, 'bucket': bucket, 'series': series}
+
+
+def retry_hotspots(samples, limit: int = TOP_N) -> list[dict]:
+    """`retry_call` 失败次数最多的步骤：`[{'label', 'failed', 'ok', 'failure_rate'}, ...]`。"""
+    rows = []
+    for label, entries in _group(samples, 'sjt_retry_attempts_total', 'label').items():
+        by_result = {labels.get('result'): value for labels, value in entries}
+        failed, ok = by_result.get('failed', 0), by_result.get('ok', 0)
+        rows.append({
+            'label': label,
+            'failed': failed,
+            'ok': ok,
+            'failure_rate': failed / (failed + ok) if failed + ok else 0.0,
+        })
+    rows.sort(key=lambda r: (r['failed'], r['failure_rate']), reverse=True)
+    return [r for r in rows if r['failed']][:limit]
+
+
+def slow_templates(samples, limit: int = TOP_N) -> list[dict]:
+    """按 p95 耗时排序的提示词模板：`[{'template', 'calls', 'errors', 'mean', 'p50', 'p95', ...}]`。"""
+    buckets = _group(samples, 'sjt_llm_call_duration_seconds_bucket', 'template')
+    sums = {t: e[0][1] for t, e in _group(samples, 'sjt_llm_call_duration_seconds_sum', 'template').items()}
+    counts = {t: e[0][1] for t, e in _group(samples, 'sjt_llm_call_duration_seconds_count', 'template').items()}
+    calls = _group(samples, 'sjt_llm_calls_total', 'template')
+    sent = _group(samples, 'sjt_llm_request_bytes_total', 'template')
+    received = _group(samples, 'sjt_llm_response_bytes_total', 'template')
+    rows = []
+    for template, count in counts.items():
+        if not count:
+            continue
+        cumulative = [(math.inf if labels['le'] == '+Inf' else float(labels['le']), value)
+                      for labels, value in buckets.get(template, [])]
+        errors = sum(v for labels, v in calls.get(template, []) if labels.get('result') == 'error')
+        rows.append({
+            'template': template,
+            'calls': count,
+            'errors': errors,
+            'mean': sums.get(template, 0) / count,
+            'p50': histogram_quantile(cumulative, 0.5),
+            'p95': histogram_quantile(cumulative, 0.95),
+            'request_bytes': sum(v for _, v in sent.get(template, [])),
+            'response_bytes': sum(v for _, v in received.get(template, [])),
+        })
+    rows.sort(key=lambda r: (r['p95'] or 0, r['mean']), reverse=True)
+    return rows[:limit]
+
+
+def utilization(stats: dict[str, dict]) -> dict[str, dict]:
+    """在调度器的 `stats()` 上补一个占用率 `running / limit`（没有并发上限时为 None）。"""
+    return {
+        kind: {**s, 'utilization': s['running'] / s['limit'] if s.get('limit') else None}
+        for kind, s in stats.items()
+    }
+
+
+def snapshot(store, samples, stats: dict[str, dict]) -> dict:
+    """面板需要的全部数据。
+
+    Parameters
+    ----------
+    store : TaskStore
+        任务库。
+    samples : list of (str, dict, float)
+        `MetricsStore.samples()` 的结果。
+    stats : dict
+        调度器（`TaskScheduler` 或 `SQLiteJobQueue`）的 `stats()`。
+    """
+    return {
+        'generated_at': time.time(),
+        'timelines': timelines(store),
+        'throughput': throughput(store),
+        'retry_hotspots': retry_hotspots(samples),
+        'slow_templates': slow_templates(samples),
+        'workers': utilization(stats),
+    }
@@ -0,0 +1,200 @@
+"""流水线阶段进度回报。
+
+三条生成流水线都有明确的阶段（图像的情境图 → … → 标注，文本的 td/tp/sb/ba，
+视频的多智能体 → 出片 → 配音 → 合成），但以前任务只报告 `running`，看不出
+时间花在哪里。这里约定一个最小的回调协议，流水线在阶段开始/结束以及阶段内
+有进度时调用 `on_progress(event)`：
+
+    {'stage': 'Polishing the prompt', 'index': 6, 'total': 9,
+     'status': 'start' | 'end' | 'error' | 'progress',
+     'time': 1700000000.0, 'percent': 42.0}
+
+`index`/`total`/`percent` 可缺省；`status='progress'` 且不给 `stage` 时视为当前
+阶段的进度更新。回调只用于观测，抛出的异常会被吞掉，不影响生成本身。
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[dict], None]
+
+
+def emit(
+    on_progress: ProgressCallback | None,
+    stage: str | None = None,
+    *,
+    status: str = 'progress',
+    index: int | None = None,
+    total: int | None = None,
+    percent: float | None = None,
+    **extra: Any,
+) -> None:
+    """发出一条进度事件；`on_progress` 为 None 时什么也不做。"""
+    if on_progress is None:
+        return
+    event = {'stage': stage, 'status': status, 'time': time.time()}
+    if index is not None:
+        event['index'] = index
+    if total is not None:
+        event['total'] = total
+    if percent is not None:
+        event['percent'] = round(float(percent), 1)
+    event.update(extra)
+    try:
+        on_progress(event)
+    except Exception:  # noqa: BLE001 - 观测失败不能拖垮生成
+        logger.exception('进度回调出错')
+
+
+@contextmanager
+def stage(
+    on_progress: ProgressCallback | None,
+    name: str,
+    index: int | None = None,
+    total: int | None = None,
+) -> Iterator[None]:
+    """把一段代码包成一个阶段：进入时发 `start`，正常退出发 `end`，异常时发 `error`。"""
+    emit(on_progress, name, status='start', index=index, total=total)
+    try:
+        yield
+    except BaseException as e:
+        emit(on_progress, name, status='error', index=index, total=total, error=str(e))
+        raise
+    emit(on_progress, name, status='end', index=index, total=total)
+
+
+def parse_percent(value: Any) -> float | None:
+    """把接口返回的进度（`42`、`0.42`、`"42%"`）统一成 0–100 的数值。"""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        pct = float(str(value).strip().rstrip('%'))
+    except ValueError:
+        return None
+    if 0 < pct <= 1 and not str(value).strip().endswith('%'):
+        pct *= 100
+    return max(0.0, min(100.0, pct))
+
+
+class StageRecorder:
+    """把进度事件累积成任务记录里的 `progress` 字段。
+
+    每收到一条事件就调用一次 `on_change(progress)`，`progress` 形如::
+
+        {'stage': 当前阶段名, 'index': 2, 'total': 9, 'percent': 42.0,
+         'stages': [{'name', 'index', 'total', 'attempt', 'status',
+                     'started_at', 'ended_at', 'percent'}, ...]}
+
+    `stages` 按开始顺序排列；整题重试时新一轮的阶段以新的 `attempt` 追加，
+    旧的记录保留，方便看出失败的那一轮耗在了哪里。给了 `kind` 时，每个结束的
+    阶段的耗时还会记进 `sjt_stage_duration_seconds` 指标（见 src/metrics.py）。
+
+    文字链路的阶段事件发生在共享事件循环的线程上，而 `on_change` 要写任务库
+    （多进程争写锁时可能等上好几秒）、推送 SSE；这时改交给事件循环的线程池去写，
+    同一任务同时只有一次写在跑，其间到来的快照只留最新的一份。
+    """
+
+    def __init__(self, on_change: Callable[[dict], None] | None = None, kind: str | None = None):
+        self._on_change = on_change
+        self.kind = kind
+        self._lock = threading.Lock()
+        self.attempt = 1
+        self.stages: list[dict] = []
+        self.current: dict | None = None
+        self._pending: dict | None = None
+        self._flushing = False
+
+    def _find(self, name: str | None) -> dict | None:
+        if name is None:
+            return self.current
+        for entry in reversed(self.stages):
+            if entry['name'] == name and entry['attempt'] == self.attempt:
+                return entry
+        return None
+
+    def __call__(self, event: dict) -> None:
+        status = event.get('status', 'progress')
+        now = event.get('time', time.time())
+        finished = None
+        with self._lock:
+            entry = self._find(event.get('stage'))
+            if status == 'start' or entry is None:
+                if event.get('stage') is None:
+                    return
+                entry = {
+                    'name': event['stage'],
+                    'index': event.get('index'),
+                    'total': event.get('total'),
+                    'attempt': self.attempt,
+                    'status': 'running',
+                    'started_at': now,
+                    'ended_at': None,
+                    'percent': None,
+                }
+                self.stages.append(entry)
+            if status in ('end', 'error'):
+                entry['status'] = 'done' if status == 'end' else 'error'
+                entry['ended_at'] = now
+                if status == 'end':
+                    entry['percent'] = 100.0
+                finished = dict(entry)
+            if 'percent' in event:
+                entry['percent'] = event['percent']
+            for key, value in event.items():
+                if key not in ('stage', 'status', 'time', 'index', 'total', 'percent'):
+                    entry[key] = value
+            self.current = entry
+            snapshot = self.snapshot()
+        if finished is not None and self.kind is not None:
+            metrics.observe('sjt_stage_duration_seconds', finished['ended_at'] - finished['started_at'],
+                            kind=self.kind, stage=finished['name'], status=finished['status'])
+        if self._on_change is not None:
+            self._deliver(snapshot)
+
+    def _deliver(self, snapshot: dict) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        with self._lock:
+            if loop is not None or self._flushing:
+                # 后台还有没写完的快照时同步调用也排进去，免得旧快照后写、盖掉新的
+                self._pending = snapshot
+                if self._flushing:
+                    return
+                self._flushing = True
+        if loop is None:
+            self._on_change(snapshot)
+        else:
+            loop.run_in_executor(None, self._flush)
+
+    def _flush(self) -> None:
+        while True:
+            with self._lock:
+                snapshot, self._pending = self._pending, None
+                if snapshot is None:
+                    self._flushing = False
+                    return
+            try:
+                self._on_change(snapshot)
+            except Exception:  # noqa: BLE001 - 观测失败不能拖垮生成
+                logger.exception('进度回调出错')
+
+    def snapshot(self) -> dict:
+        current = self.current or {}
+        return {
+            'stage': current.get('name'),
+            'index': current.get('index'),
+            'total': current.get('total'),
+            'percent': current.get('percent'),
+            'stages': [dict(s) for s in self.stages],
+        }
@@ -0,0 +1,138 @@
+"""`/quiz` 页面的成品题库：按需解析、按修改时间失效，并支持分页读取。
+
+过去每次打开 `/quiz` 都要重新 `json.load` generated/ 下的三个题库文件，再把全部
+内容内联进页面；完整题库很大，页面渲染和传输都很慢。这里把解析结果缓存在内存里
+（文件的修改时间或大小变了才重新解析），页面再通过 `/api/quiz` 按模态、特质
+分页取题。
+"""
+from __future__ import annotations
+
+import bisect
+import json
+import threading
+from pathlib import Path
+
+# 模态 -> 题库文件名
+BANK_FILES = {
+    'txt': 'sjt_txt.json',
+    'img': 'sjt_img.json',
+    'vid': 'sjt_vid.json',
+}
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def _sort_key(key: str) -> tuple:
+    """题目键（如 `O_12`）的排序键：先按特质，再按题号数值。"""
+    trait, _, number = key.partition('_')
+    return (trait, int(number) if number.isdigit() else float('inf'), key)
+
+
+class _Bank:
+    """一个题库文件解析后的内容，题目按 `_sort_key` 排好序。"""
+
+    def __init__(self, stamp: tuple, data: dict):
+        self.stamp = stamp
+        self.data = data
+        self.keys = sorted(data, key=_sort_key)
+        self.sort_keys = [_sort_key(k) for k in self.keys]
+        self.traits: dict[str, int] = {}
+        for key in self.keys:
+            trait = _sort_key(key)[0]
+            self.traits[trait] = self.traits.get(trait, 0) + 1
+
+
+class QuizBank:
+    """按模态读取 generated/ 下的题库文件。
+
+    Parameters
+    ----------
+    root : str or Path
+        题库文件所在目录。
+    """
+
+    def __init__(self, root='generated'):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._banks: dict[str, _Bank] = {}
+
+    def _stamp(self, modality: str) -> tuple | None:
+        try:
+            st = (self.root / BANK_FILES[modality]).stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load(self, modality: str) -> _Bank | None:
+        """取解析好的题库；文件变了就重新解析，文件不存在时返回 None。"""
+        stamp = self._stamp(modality)
+        if stamp is None:
+            return None
+        with self._lock:
+            bank = self._banks.get(modality)
+            if bank is not None and bank.stamp == stamp:
+                return bank
+        # 解析放在锁外，避免大文件解析期间其他模态的请求也被卡住
+        with open(self.root / BANK_FILES[modality], encoding='utf-8') as f:
+            bank = _Bank(stamp, json.load(f))
+        with self._lock:
+            self._banks[modality] = bank
+        return bank
+
+    def modalities(self) -> list[str]:
+        """有题库文件的模态（只看文件是否存在，不解析）。"""
+        return [m for m in BANK_FILES if self._stamp(m) is not None]
+
+    def traits(self, modality: str) -> dict:
+        """`modality` 的题目总数与各特质的题目数：`{'total', 'traits': {特质: 题数}}`。"""
+        if modality not in BANK_FILES:
+            raise KeyError(modality)
+        bank = self._load(modality)
+        if bank is None:
+            return {'total': 0, 'traits': {}}
+        return {'total': len(bank.keys), 'traits': dict(bank.traits)}
+
+    def page(
+        self,
+        modality: str,
+        trait: str | None = None,
+        cursor: str | None = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+    ) -> dict:
+        """取一页题目。
+
+        Parameters
+        ----------
+        modality : str
+            `txt` / `img` / `vid`。
+        trait : str, optional
+            只取该特质的题目。
+        cursor : str, optional
+            上一页返回的 `next_cursor`；从这道题之后开始取。题库在两次请求之间
+            被替换也能接着翻，不会重复或跳过仍然存在的题目。
+        limit : int
+            每页题数，上限 `MAX_PAGE_SIZE`。
+        """
+        if modality not in BANK_FILES:
+            raise KeyError(modality)
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        bank = self._load(modality)
+        if bank is None:
+            return {'items': [], 'next_cursor': None, 'total': 0}
+
+        if trait:
+            lo = bisect.bisect_left(bank.sort_keys, (trait,))
+            hi = bisect.bisect_left(bank.sort_keys, (trait + '\0',))
+        else:
+            lo, hi = 0, len(bank.keys)
+        start = lo
+        if cursor:
+            start = max(lo, bisect.bisect_right(bank.sort_keys, _sort_key(cursor)))
+        keys = bank.keys[start:min(start + limit, hi)]
+        items = [{'key': key, 'trait': _sort_key(key)[0], **bank.data[key]} for key in keys]
+        more = start + len(keys) < hi
+        return {
+            'items': items,
+            'next_cursor': keys[-1] if keys and more else None,
+            'total': hi - lo,
+        }
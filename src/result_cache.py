@@ -0,0 +1,257 @@
+"""按内容寻址的生成结果缓存。
+
+同一个 trait/item、同样的参数、同样的模型配置再生成一次，过去会把整条流水线
+（LLM、出图、出片）重跑一遍，而上次的产物还在 outputs/ 里。这里以
+「模态 + 规范化后的请求 + 相关的 config.yaml 配置 + 参考图内容 + 提示词模板版本」
+的哈希为键，把成功任务的结果记进任务库；再次提交时直接返回，不再排队。
+
+- 提示词模板（及内联提示词的源文件）的内容参与哈希，改了提示词旧条目自然失效；
+  也可以调 `invalidate()`（`DELETE /api/cache`）手动清空，或改 `cache.version`。
+- 结果引用的产物文件记下大小与修改时间，文件被删或被覆盖（同名输出）时条目作废。
+- 请求带 `force: true` 时跳过缓存重新生成，新结果会覆盖旧条目。
+"""
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+
+from .config import CONFIG
+from .task_store import TaskStore
+
+_CACHE_CFG = CONFIG.get('cache', {}) or {}
+
+CACHE_ENABLED = bool(_CACHE_CFG.get('enabled', True))
+# 最多保留的条目数，超出时淘汰最久没用过的；<= 0 表示不限
+CACHE_MAX_ENTRIES = int(_CACHE_CFG.get('max_entries', 2000))
+# 手动失效用的盐：改一下这个值，所有旧条目都不再命中
+CACHE_VERSION = str(_CACHE_CFG.get('version', '1'))
+
+_SRC_DIR = Path(__file__).resolve().parent
+
+# 各模态的结果受哪些 config.yaml 段影响
+CONFIG_SECTIONS = {
+    'text': ('text',),
+    'image': ('image',),
+    'video': ('video', 'tts'),
+}
+# 各模态的提示词来源（相对 src/ 的文件或目录），内容变了就换一个版本号
+PROMPT_SOURCES = {
+    'text': ('txt/workflow/prompts',),
+    'image': ('img/prompts', 'img/annotator/annotator_llm.py'),
+    'video': ('vid/agents/prompts.py', 'vid/agents/Tools.py'),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS result_cache (
+    key            TEXT PRIMARY KEY,
+    kind           TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    spec           TEXT,
+    result         TEXT NOT NULL,
+    artifacts      TEXT NOT NULL,
+    task_id        TEXT,
+    created_at     REAL NOT NULL,
+    hits           INTEGER NOT NULL DEFAULT 0,
+    last_hit_at    REAL
+);
+CREATE INDEX IF NOT EXISTS result_cache_kind ON result_cache (kind, prompt_version)
+"""
+
+_versions: dict[str, str] = {}
+_versions_lock = threading.Lock()
+
+
+def _hash(payload) -> str:
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _file_digest(path) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+@functools.lru_cache(maxsize=32)
+def _cached_digest(path: str, size: int, mtime_ns: int) -> str:
+    return _file_digest(path)
+
+
+def _ref_digest(path) -> str:
+    """参考图的内容哈希；文件没变时不重复读（批量提交要算几百次键）。"""
+    st = Path(path).stat()
+    return _cached_digest(str(path), st.st_size, st.st_mtime_ns)
+
+
+def prompt_version(kind: str) -> str:
+    """`kind` 所用提示词的内容哈希；进程内只算一次（提示词随部署更新，进程会重启）。"""
+    with _versions_lock:
+        if kind not in _versions:
+            digests = []
+            for source in PROMPT_SOURCES.get(kind, ()):
+                path = _SRC_DIR / source
+                files = sorted(path.rglob('*.py')) if path.is_dir() else [path]
+                digests += [(str(f.relative_to(_SRC_DIR)), _file_digest(f))
+                            for f in files if f.is_file() and '__pycache__' not in f.parts]
+            _versions[kind] = _hash(digests)[:16]
+        return _versions[kind]
+
+
+def _inputs(kind: str, spec: dict) -> dict:
+    """除请求本身外，影响结果的其他输入。"""
+    inputs = {section: CONFIG.get(section) for section in CONFIG_SECTIONS.get(kind, ())}
+    if kind == 'image':
+        from .img import ref_viz_paths
+
+        ref = ref_viz_paths.get(spec.get('ref_character'), ref_viz_paths['male'])
+        inputs['ref_image'] = _ref_digest(ref)
+    return inputs
+
+
+def _artifact_state(outdir: Path, name: str) -> list | None:
+    path = outdir / name
+    if not path.is_file():
+        return None
+    st = path.stat()
+    return [name, st.st_size, st.st_mtime_ns]
+
+
+def _artifact_names(result: dict) -> list[str]:
+    if result.get('artifacts'):
+        # 任务工作区的产物清单（src/workspace.py）
+        return [a['path'] for a in result['artifacts']]
+    names = list(result.get('image_files') or []) + list(result.get('video_files') or [])
+    if result.get('output_file'):
+        names.append(result['output_file'])
+    return names
+
+
+class ResultCache:
+    """生成结果缓存，存在任务库（TaskStore）的 `result_cache` 表里，多进程共享。
+
+    Parameters
+    ----------
+    store : TaskStore
+        任务库。
+    outdir : str or Path
+        产物所在的输出目录。
+    max_entries : int
+        最多保留的条目数。
+    enabled : bool
+        为 False 时 `get` 总是未命中、`put` 不写入。
+    """
+
+    def __init__(
+        self,
+        store: TaskStore,
+        outdir='outputs',
+        max_entries: int = CACHE_MAX_ENTRIES,
+        enabled: bool = CACHE_ENABLED,
+    ):
+        self._store = store
+        self._outdir = Path(outdir)
+        self._max_entries = max_entries
+        self.enabled = enabled
+        with store.transaction() as conn:
+            for statement in _SCHEMA.split(';'):
+                conn.execute(statement)
+
+    def key(self, kind: str, spec: dict) -> str:
+        return _hash({
+            'version': CACHE_VERSION,
+            'kind': kind,
+            'spec': spec,
+            'inputs': _inputs(kind, spec),
+            'prompts': prompt_version(kind),
+        })
+
+    def get(self, kind: str, spec: dict) -> dict | None:
+        """查缓存；命中时返回 `{'key', 'result', 'task_id', 'created_at', 'hits'}`。
+
+        产物文件缺失或已被改写的条目视为失效并删除。
+        """
+        if not self.enabled or kind not in CONFIG_SECTIONS:
+            return None
+        key = self.key(kind, spec)
+        with self._store.transaction() as conn:
+            row = conn.execute(
+                'SELECT result, artifacts, task_id, created_at, hits FROM result_cache WHERE key = ?',
+                (key,)).fetchone()
+            if row is None:
+                return None
+            artifacts = json.loads(row['artifacts'])
+            if any(_artifact_state(self._outdir, name) != [name, *state]
+                   for name, *state in artifacts):
+                conn.execute('DELETE FROM result_cache WHERE key = ?', (key,))
+                return None
+            conn.execute('UPDATE result_cache SET hits = hits + 1, last_hit_at = ? WHERE key = ?',
+                         (time.time(), key))
+        return {
+            'key': key,
+            'result': json.loads(row['result']),
+            'task_id': row['task_id'],
+            'created_at': row['created_at'],
+            'hits': row['hits'] + 1,
+        }
+
+    def put(self, kind: str, spec: dict, result, task_id: str | None = None) -> str | None:
+        """记下一个成功任务的结果，返回键；结果不可缓存时返回 None。"""
+        if not self.enabled or kind not in CONFIG_SECTIONS or not isinstance(result, dict):
+            return None
+        artifacts = [s for s in (_artifact_state(self._outdir, n) for n in _artifact_names(result))
+                     if s is not None]
+        key = self.key(kind, spec)
+        with self._store.transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO result_cache'
+                ' (key, kind, prompt_version, spec, result, artifacts, task_id, created_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, kind, prompt_version(kind), json.dumps(spec, ensure_ascii=False, default=str),
+                 json.dumps(result, ensure_ascii=False, default=str), json.dumps(artifacts),
+                 task_id, time.time()),
+            )
+            if self._max_entries > 0:
+                conn.execute(
+                    'DELETE FROM result_cache WHERE key IN ('
+                    '  SELECT key FROM result_cache'
+                    '  ORDER BY COALESCE(last_hit_at, created_at) DESC LIMIT -1 OFFSET ?)',
+                    (self._max_entries,),
+                )
+        return key
+
+    def invalidate(self, kind: str | None = None, stale_only: bool = False) -> int:
+        """删除条目，返回条数。
+
+        `kind` 为空时删除所有模态；`stale_only=True` 时只删提示词版本已过时的条目。
+        """
+        where, params = [], []
+        if kind is not None:
+            where.append('kind = ?')
+            params.append(kind)
+        if stale_only:
+            current = [(k, prompt_version(k)) for k in PROMPT_SOURCES if kind in (None, k)]
+            if not current:
+                return 0
+            where.append('NOT (' + ' OR '.join('(kind = ? AND prompt_version = ?)' for _ in current) + ')')
+            params += [v for pair in current for v in pair]
+        sql = 'DELETE FROM result_cache'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        with self._store.transaction() as conn:
+            return conn.execute(sql, params).rowcount
+
+    def stats(self) -> dict[str, dict]:
+        """各模态的条目数、累计命中数与当前提示词版本。"""
+        with self._store.transaction(immediate=False) as conn:
+            rows = conn.execute(
+                'SELECT kind, COUNT(*) AS entries, COALESCE(SUM(hits), 0) AS hits'
+                ' FROM result_cache GROUP BY kind').fetchall()
+        stats = {kind: {'entries': 0, 'hits': 0} for kind in CONFIG_SECTIONS}
+        for row in rows:
+            stats[row['kind']] = {'entries': row['entries'], 'hits': row['hits']}
+        for kind, info in stats.items():
+            info['prompt_version'] = prompt_version(kind) if kind in PROMPT_SOURCES else None
+        return stats
@@ -0,0 +1,390 @@
+"""生成产物的保留策略与磁盘配额回收（GC）。
+
+`outputs/` 下的任务工作区（其中 `PicSJTAgent.save` 写的 `_details.pkl` 带着整套
+PIL 分镜，动辄几十 MB）、缩略图，以及视频链路在
+`src/vid/agents/results/CIBOL_Video_SJT/<Trait>/envN` 下的中间目录过去只增不减。
+后台 GC 按 config.yaml 的 `retention:` 段定期回收：
+
+- 超过 `max_age_days` 的已结束任务：工作区与任务记录（连同子任务、结果缓存条目）
+  一起删除；
+- 产物总量超过 `max_bytes` 时，从最旧的已结束任务开始删，直到回到配额以内；
+- 置顶（pinned）的任务不受以上两条影响；
+- 任务记录已不存在的工作区（如被 `tasks.max_finished` 清掉的）、源文件已不存在的
+  缩略图、平铺在 `outputs/` 根目录下的旧版产物（任务库与 LLM 响应缓存的 SQLite
+  文件除外），以及超过 `scratch_max_age_hours` 的视频中间目录。
+
+删除一个任务时先把它的工作区原子地挪进 `outputs/.trash/`，再在一个事务里删掉
+记录；事务失败就挪回来，因此不会出现「记录还在、文件没了」的任务。
+"""
+from __future__ import annotations
+
+import os
+import shutil
+import threading
+import logging
+import time
+import uuid
+from pathlib import Path
+
+from . import llm_cache
+from .config import CONFIG
+from .media import DERIVED_DIR, SIZES
+from .task_store import ACTIVE_STATUSES, TaskStore
+from .workspace import MANIFEST_NAME, WORKSPACES_DIR, load_manifest, workspace_dir
+
+logger = logging.getLogger(__name__)
+
+_RETENTION_CFG = CONFIG.get('retention', {}) or {}
+
+_UNITS = {'KB': 1 << 10, 'MB': 1 << 20, 'GB': 1 << 30, 'TB': 1 << 40}
+
+
+def parse_bytes(value) -> int:
+    """`20GB`、`512MB` 或字节数 -> 字节数。"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip().upper()
+    for unit, factor in _UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(float(text.rstrip('B') or 0))
+
+
+RETENTION_ENABLED = bool(_RETENTION_CFG.get('enabled', True))
+# 两次 GC 之间的间隔（秒）
+GC_INTERVAL = float(_RETENTION_CFG.get('interval', 3600))
+# 已结束任务的产物保留天数；<= 0 表示不按时间清理
+ARTIFACT_MAX_AGE_DAYS = float(_RETENTION_CFG.get('max_age_days', 30))
+# outputs/ 产物总量上限；<= 0 表示不限
+ARTIFACT_MAX_BYTES = parse_bytes(_RETENTION_CFG.get('max_bytes', 0))
+# 中间目录、孤立工作区在这么久没动过之后才回收（秒），避免碰到正在写的目录
+SCRATCH_MAX_AGE = float(_RETENTION_CFG.get('scratch_max_age_hours', 24)) * 3600
+# 视频链路的中间目录（相对项目根目录的 glob）
+SCRATCH_GLOBS: list[str] = list(
+    _RETENTION_CFG.get('scratch_globs') or ['src/vid/agents/results/CIBOL_Video_SJT/*/env*'])
+
+TRASH_DIR = '.trash'
+# SQLite 库文件及其日志（WAL / 回滚日志、共享内存）的后缀
+_SQLITE_SUFFIXES = ('', '-wal', '-shm', '-journal')
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _tree_bytes(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def _size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return time.time()
+
+
+class ArtifactGC:
+    """按保留策略回收生成产物，并统计各模态的磁盘占用。
+
+    Parameters
+    ----------
+    store : TaskStore
+        任务库。
+    outdir : str or Path
+        输出根目录（任务工作区在其 `tasks/` 下）。
+    max_age_days : float
+        已结束任务的产物保留天数。
+    max_bytes : int
+        产物总量上限（字节）。
+    scratch_max_age : float
+        中间目录与孤立工作区的回收宽限（秒）。
+    scratch_globs : list of str
+        中间目录的 glob，相对项目根目录。
+    """
+
+    def __init__(
+        self,
+        store: TaskStore,
+        outdir='outputs',
+        max_age_days: float = ARTIFACT_MAX_AGE_DAYS,
+        max_bytes: int = ARTIFACT_MAX_BYTES,
+        scratch_max_age: float = SCRATCH_MAX_AGE,
+        scratch_globs=None,
+    ):
+        self._store = store
+        self._outdir = Path(outdir)
+        self.max_age_days = max_age_days
+        self.max_bytes = max_bytes
+        self.scratch_max_age = scratch_max_age
+        self.scratch_globs = list(SCRATCH_GLOBS if scratch_globs is None else scratch_globs)
+        # 可能放在 outputs/ 根目录下、不能当旧版产物删掉的数据库：任务库与 LLM 响应缓存
+        self._databases = {
+            Path(db + suffix).resolve()
+            for db in (str(store.path), llm_cache.CACHE_PATH) for suffix in _SQLITE_SUFFIXES
+        }
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.last_report: dict | None = None
+
+    # ---- 占用统计 ----
+
+    def _workspace_bytes(self, task_id: str) -> int:
+        """工作区大小：有清单时按清单累加，不用逐个 stat。"""
+        path = workspace_dir(self._outdir, task_id)
+        manifest = load_manifest(self._outdir, task_id)
+        if manifest is None:
+            return _tree_bytes(path) if path.is_dir() else 0
+        return sum(a['size'] for a in manifest['artifacts']) + _size(path / MANIFEST_NAME)
+
+    def _tasks(self) -> list[dict]:
+        with self._store.transaction(immediate=False) as conn:
+            rows = conn.execute(
+                'SELECT task_id, kind, status, parent_id, created_at, pinned FROM tasks').fetchall()
+        return [dict(r) for r in rows]
+
+    def _legacy_entries(self, known: set[str]) -> list[Path]:
+        """`outputs/` 根目录下不归任何工作区的旧版平铺产物，以及记录已删除的批量清单。
+
+        `known` 为现存任务的 ID。
+        """
+        keep = {WORKSPACES_DIR, DERIVED_DIR, TRASH_DIR}
+        entries = []
+        for path in self._outdir.iterdir():
+            if path.name in keep or path.name.startswith('.') or path.resolve() in self._databases:
+                continue
+            if path.name.startswith('batch_') and path.stem[len('batch_'):] in known:
+                continue
+            entries.append(path)
+        return entries
+
+    def usage(self) -> dict:
+        """各模态的任务数与占用字节数，以及缩略图、旧版产物、中间目录的占用。"""
+        modalities: dict[str, dict] = {}
+        pinned = 0
+        tasks = self._tasks()
+        for task in tasks:
+            size = self._workspace_bytes(task['task_id'])
+            info = modalities.setdefault(task['kind'], {'tasks': 0, 'bytes': 0})
+            info['tasks'] += 1
+            info['bytes'] += size
+            if task['pinned']:
+                pinned += size
+        other = {
+            'derived': _tree_bytes(self._outdir / DERIVED_DIR),
+            'legacy': sum(_tree_bytes(p) for p in self._legacy_entries({t['task_id'] for t in tasks})),
+            'scratch': sum(_tree_bytes(p) for p in self._scratch_dirs()),
+        }
+        total = sum(m['bytes'] for m in modalities.values()) + sum(other.values())
+        return {
+            'modalities': modalities,
+            **{k: {'bytes': v} for k, v in other.items()},
+            'pinned_bytes': pinned,
+            'total_bytes': total,
+            'max_bytes': self.max_bytes if self.max_bytes > 0 else None,
+            'last_gc': self.last_report,
+        }
+
+    # ---- 删除 ----
+
+    def _stash(self, trash: Path, path: Path, moved: list) -> None:
+        if path.exists():
+            trash.mkdir(parents=True, exist_ok=True)
+            target = trash / f'{len(moved)}_{path.name}'
+            os.replace(path, target)
+            moved.append((path, target))
+
+    def _remove_group(self, task_ids: list[str]) -> int:
+        """原子地删除一组任务的工作区与记录，返回释放的字节数。调用方持有 `_lock`。"""
+        trash = self._outdir / TRASH_DIR / uuid.uuid4().hex
+        moved: list[tuple[Path, Path]] = []
+        try:
+            for task_id in task_ids:
+                self._stash(trash, workspace_dir(self._outdir, task_id), moved)
+                self._stash(trash, self._outdir / DERIVED_DIR / WORKSPACES_DIR / task_id, moved)
+                self._stash(trash, self._outdir / f'batch_{task_id}.json', moved)
+            marks = ', '.join('?' for _ in task_ids)
+            with self._store.transaction() as conn:
+                conn.execute(f'DELETE FROM tasks WHERE task_id IN ({marks})', task_ids)
+                conn.execute(f'DELETE FROM idempotency_keys WHERE task_id IN ({marks})', task_ids)
+                has_cache = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'result_cache'"
+                ).fetchone()
+                if has_cache:
+                    conn.execute(f'DELETE FROM result_cache WHERE task_id IN ({marks})', task_ids)
+        except BaseException:
+            for original, target in reversed(moved):
+                os.replace(target, original)
+            shutil.rmtree(trash, ignore_errors=True)
+            raise
+        freed = _tree_bytes(trash) if trash.exists() else 0
+        shutil.rmtree(trash, ignore_errors=True)
+        return freed
+
+    def _group(self, task_id: str) -> list[str] | None:
+        """顶层任务及其子任务的 ID；任务不存在、仍在进行或不是顶层任务时返回 None。"""
+        task = self._store.get(task_id, with_result=False)
+        if task is None or task['status'] in ACTIVE_STATUSES or task.get('parent_id'):
+            return None
+        return [task_id] + [c['task_id'] for c in self._store.list(parent_id=task_id)]
+
+    def remove(self, task_id: str) -> bool:
+        """立即删除一个已结束的顶层任务（连同子任务）的记录与产物。"""
+        with self._lock:
+            ids = self._group(task_id)
+            if ids is None:
+                return False
+            self._remove_group(ids)
+        return True
+
+    def _scratch_dirs(self) -> list[Path]:
+        dirs = []
+        for pattern in self.scratch_globs:
+            dirs += [p for p in _PROJECT_ROOT.glob(pattern) if p.is_dir()]
+        return dirs
+
+    def _sweep_derived(self) -> int:
+        """删除源文件已不存在的缩略图，返回释放的字节数。"""
+        root = self._outdir / DERIVED_DIR
+        if not root.is_dir():
+            return 0
+        freed = 0
+        suffixes = tuple(f'.{size}.webp' for size in SIZES)
+        for path in list(root.rglob('*.webp')):
+            name = path.relative_to(root).as_posix()
+            source = next((name[:-len(s)] for s in suffixes if name.endswith(s)), None)
+            if source is None or not (self._outdir / source).exists():
+                freed += path.stat().st_size
+                path.unlink(missing_ok=True)
+        for path in sorted(root.rglob('*'), reverse=True):
+            if path.is_dir() and not any(path.iterdir()):
+                path.rmdir()
+        return freed
+
+    def collect(self) -> dict:
+        """跑一轮 GC，返回报告（删除的任务数、释放的字节数等）。"""
+        start = time.time()
+        report = {'removed_tasks': 0, 'freed_bytes': 0, 'orphans': 0, 'legacy': 0, 'scratch': 0}
+        with self._lock:
+            # 上次中途退出时留下的
+            shutil.rmtree(self._outdir / TRASH_DIR, ignore_errors=True)
+
+            tasks = self._tasks()
+            children: dict[str, list[str]] = {}
+            for t in tasks:
+                if t['parent_id']:
+                    children.setdefault(t['parent_id'], []).append(t['task_id'])
+            # 子任务被置顶时整个批量任务都保留
+            pinned = {t['task_id'] for t in tasks if t['pinned']}
+            pinned |= {t['parent_id'] for t in tasks if t['pinned'] and t['parent_id']}
+            groups = sorted(
+                (t for t in tasks if not t['parent_id'] and t['status'] not in ACTIVE_STATUSES
+                 and t['task_id'] not in pinned),
+                key=lambda t: t['created_at'])
+
+            def members(task):
+                return [task['task_id'], *children.get(task['task_id'], [])]
+
+            # 1. 过期任务
+            expired = []
+            if self.max_age_days > 0:
+                cutoff = start - self.max_age_days * 86400
+                expired = [t for t in groups if t['created_at'] < cutoff]
+            # 2. 超出配额：从最旧的开始删
+            if self.max_bytes > 0:
+                sizes = {t['task_id']: self._workspace_bytes(t['task_id']) for t in tasks}
+                legacy = self._legacy_entries({t['task_id'] for t in tasks})
+                total = sum(sizes.values()) + sum(_tree_bytes(p) for p in legacy)
+                total -= sum(sizes[i] for t in expired for i in members(t))
+                chosen = {t['task_id'] for t in expired}
+                for t in groups:
+                    if total <= self.max_bytes:
+                        break
+                    if t['task_id'] not in chosen:
+                        expired.append(t)
+                        total -= sum(sizes[i] for i in members(t))
+            for t in expired:
+                ids = members(t)
+                try:
+                    report['freed_bytes'] += self._remove_group(ids)
+                    report['removed_tasks'] += len(ids)
+                except Exception:  # noqa: BLE001 - 这一组留到下一轮
+                    logger.exception('删除任务 %s 失败', t['task_id'])
+
+            # 3. 没有任务记录的工作区（记录已被 TaskStore.prune 或手动删除）
+            with self._store.transaction(immediate=False) as conn:
+                known = {r[0] for r in conn.execute('SELECT task_id FROM tasks')}
+                has_cache = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'result_cache'"
+                ).fetchone()
+                cached = {r[0] for r in conn.execute(
+                    'SELECT task_id FROM result_cache WHERE task_id IS NOT NULL')} if has_cache else set()
+            workspaces = self._outdir / WORKSPACES_DIR
+            if workspaces.is_dir():
+                for path in workspaces.iterdir():
+                    # 结果缓存还指着的工作区保留，直到缓存条目被淘汰
+                    if path.name in known or path.name in cached \
+                            or start - _mtime(path) < self.scratch_max_age:
+                        continue
+                    report['freed_bytes'] += _tree_bytes(path)
+                    shutil.rmtree(path, ignore_errors=True)
+                    report['orphans'] += 1
+
+            # 4. outputs/ 根目录下的旧版平铺产物
+            if self.max_age_days > 0:
+                cutoff = start - self.max_age_days * 86400
+                for path in self._legacy_entries(known):
+                    if _mtime(path) < cutoff:
+                        report['freed_bytes'] += _tree_bytes(path)
+                        if path.is_dir():
+                            shutil.rmtree(path, ignore_errors=True)
+                        else:
+                            path.unlink(missing_ok=True)
+                        report['legacy'] += 1
+
+            # 5. 视频链路的中间目录（成功时链路自己会清，这里收拾失败留下的）
+            for path in self._scratch_dirs():
+                if start - _mtime(path) >= self.scratch_max_age:
+                    report['freed_bytes'] += _tree_bytes(path)
+                    shutil.rmtree(path, ignore_errors=True)
+                    report['scratch'] += 1
+
+            report['freed_bytes'] += self._sweep_derived()
+
+        report['finished_at'] = time.time()
+        report['seconds'] = round(report['finished_at'] - start, 3)
+        self.last_report = report
+        if report['removed_tasks'] or report['orphans'] or report['legacy'] or report['scratch']:
+            logger.info('删除 %d 个任务、%d 个孤立工作区、%d 个旧版产物、%d 个中间目录，释放 %.1f MB',
+                        report['removed_tasks'], report['orphans'], report['legacy'], report['scratch'],
+                        report['freed_bytes'] / (1 << 20))
+        return report
+
+    # ---- 后台线程 ----
+
+    def _loop(self, interval: float) -> None:
+        while not self._stop.is_set():
+            try:
+                self.collect()
+            except Exception:  # noqa: BLE001 - 下一轮再试
+                logger.exception('产物回收失败')
+            self._stop.wait(interval)
+
+    def start(self, interval: float = GC_INTERVAL) -> None:
+        """在后台线程里每隔 `interval` 秒跑一轮 GC（启动后先跑一轮）。"""
+        threading.Thread(target=self._loop, args=(interval,), name='sjt-gc', daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
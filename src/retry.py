@@ -6,13 +6,18 @@ config.yaml 的 `retry:` 段控制。
 """
 from __future__ import annotations
 
-import time
-from typing import Callable, TypeVar
+import asyncio
+import logging
+from typing import Awaitable, Callable, TypeVar
 
+from . import deadline, metrics
+from .cancel import CancelToken, check, sleep
 from .config import CONFIG
 
 _RETRY_CFG = CONFIG.get('retry', {}) or {}
 
+logger = logging.getLogger(__name__)
+
 STEP_ATTEMPTS = int(_RETRY_CFG.get('step_attempts', 3))
 TASK_ATTEMPTS = int(_RETRY_CFG.get('task_attempts', 2))
 RETRY_DELAY = float(_RETRY_CFG.get('delay', 2))
@@ -28,6 +33,7 @@ def retry_call(
     backoff: float = RETRY_BACKOFF,
     label: str = '',
     exceptions: tuple[type[BaseException], ...] = (Exception,),
+    cancel: CancelToken | None = None,
 ) -> T:
     """执行 `fn`，失败则重试，最终仍失败时抛出最后一次的异常。
 
@@ -45,22 +51,82 @@ def retry_call(
         日志里显示的步骤名。
     exceptions : tuple
         触发重试的异常类型。
+    cancel : CancelToken, optional
+        取消令牌；每次尝试前与重试等待期间检查，被取消时抛出 `TaskCancelled`。
+
+    每次尝试的成败按 `label` 记进 `sjt_retry_attempts_total` 指标。任务时限
+    （见 src/deadline.py）已过或等完这一轮就来不及再试时不再重试；
+    `DeadlineExceeded` 本身从不重试。
+    """
+    attempts = max(1, int(attempts))
+    wait = delay
+    last_exc: BaseException | None = None
+
+    for i in range(1, attempts + 1):
+        check(cancel)
+        deadline.check()
+        try:
+            result = fn()
+        except exceptions as e:  # noqa: PERF203
+            last_exc = e
+            if not _should_retry(e, i, attempts, wait, label, fn):
+                break
+            if wait > 0:
+                sleep(wait, cancel)
+            wait *= backoff
+        else:
+            metrics.inc('sjt_retry_attempts_total', label=metrics.label_of(label), result='ok')
+            return result
+
+    assert last_exc is not None
+    raise last_exc
+
+
+async def retry_async(
+    fn: Callable[[], Awaitable[T]],
+    attempts: int = STEP_ATTEMPTS,
+    delay: float = RETRY_DELAY,
+    backoff: float = RETRY_BACKOFF,
+    label: str = '',
+    exceptions: tuple[type[BaseException], ...] = (Exception,),
+) -> T:
+    """`retry_call` 的协程版本：`fn` 返回 awaitable，重试间隔用 `asyncio.sleep`。
+
+    取消走 asyncio 的任务取消（见 `cancel.cancel_scope`），所以没有 `cancel` 参数。
     """
     attempts = max(1, int(attempts))
     wait = delay
     last_exc: BaseException | None = None
 
     for i in range(1, attempts + 1):
+        deadline.check()
         try:
-            return fn()
+            result = await fn()
         except exceptions as e:  # noqa: PERF203
             last_exc = e
-            if i == attempts:
+            if not _should_retry(e, i, attempts, wait, label, fn):
                 break
-            print(f"[retry] {label or fn!r} 第 {i}/{attempts} 次失败：{e}；{wait:.0f}s 后重试")
             if wait > 0:
-                time.sleep(wait)
+                await asyncio.sleep(wait)
             wait *= backoff
+        else:
+            metrics.inc('sjt_retry_attempts_total', label=metrics.label_of(label), result='ok')
+            return result
 
     assert last_exc is not None
     raise last_exc
+
+
+def _should_retry(e: BaseException, i: int, attempts: int, wait: float, label: str, fn) -> bool:
+    """记下第 `i` 次失败；返回是否再试一次（`DeadlineExceeded` 直接抛出）。"""
+    metrics.inc('sjt_retry_attempts_total', label=metrics.label_of(label), result='failed')
+    if isinstance(e, deadline.DeadlineExceeded):
+        raise e
+    label = label or repr(fn)
+    if i == attempts:
+        return False
+    if not deadline.can_retry(wait):
+        logger.warning('%s 第 %d/%d 次失败：%s；剩余时间不够再试一次', label, i, attempts, e)
+        return False
+    logger.warning('%s 第 %d/%d 次失败：%s；%.0fs 后重试', label, i, attempts, e, wait)
+    return True
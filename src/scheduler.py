@@ -0,0 +1,275 @@
+"""按模态分池的后台任务调度器。
+
+生成任务很重：图像任务要加载 insightface、持有多张 1024px 画板，视频任务会
+阻塞一个线程轮询出片接口十几分钟。过去每个请求各起一个线程、没有上限，并发
+一高就把机器拖垮。这里改成「排队 + 每种模态一个固定大小的工作线程池」，
+各模态的并发上限由 config.yaml 的 `scheduler.workers` 控制。
+
+队列不是简单的先进先出：一个几百题的批量任务会把网页上点的单题生成压在后面。
+每种模态的等待队列按优先级加权轮转（stride scheduling，权重见
+`scheduler.priorities`），同一优先级内再按提交方轮转。
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict, deque
+from typing import Callable
+
+from .config import CONFIG
+
+_SCHED_CFG = CONFIG.get('scheduler', {}) or {}
+
+DEFAULT_WORKERS = int(_SCHED_CFG.get('default_workers', 1))
+WORKER_LIMITS: dict[str, int] = {
+    kind: max(1, int(n))
+    for kind, n in (_SCHED_CFG.get('workers') or {}).items()
+}
+PRIORITY_WEIGHTS: dict[str, float] = {
+    name: max(1e-3, float(w))
+    for name, w in (_SCHED_CFG.get('priorities') or {'interactive': 4, 'bulk': 1}).items()
+}
+DEFAULT_PRIORITY = _SCHED_CFG.get('default_priority', 'bulk')
+if DEFAULT_PRIORITY not in PRIORITY_WEIGHTS:
+    PRIORITY_WEIGHTS[DEFAULT_PRIORITY] = 1.0
+
+
+class FairQueue:
+    """一种任务类型的等待队列：优先级之间加权公平，同一优先级内按提交方轮转。
+
+    每个优先级有一个 pass 值，出队时选 pass 最小的非空优先级，再把它的 pass
+    加上 1/权重；优先级从空变为非空时 pass 不低于当前虚拟时间，闲置期间不攒额度。
+
+    Parameters
+    ----------
+    weights : dict
+        优先级名 -> 权重。未列出的优先级按权重 1 处理。
+    """
+
+    def __init__(self, weights: dict[str, float] | None = None):
+        self._weights = dict(PRIORITY_WEIGHTS if weights is None else weights)
+        # 优先级 -> (提交方 -> 该提交方的任务)；提交方按轮转顺序排列
+        self._lanes: dict[str, OrderedDict[str, deque]] = {}
+        self._pass: dict[str, float] = {}
+        self._vtime = 0.0
+        self._len = 0
+        self._order: dict[str, int] | None = None
+
+    def __len__(self) -> int:
+        return self._len
+
+    def weight(self, priority: str) -> float:
+        return self._weights.get(priority, 1.0)
+
+    def push(self, entry: tuple, priority: str, client: str | None = None) -> None:
+        """入队；`entry` 的第一个元素必须是任务 id。"""
+        lanes = self._lanes.setdefault(priority, OrderedDict())
+        if not lanes:
+            self._pass[priority] = max(self._pass.get(priority, 0.0), self._vtime)
+        lanes.setdefault(client or '', deque()).append(entry)
+        self._len += 1
+        self._order = None
+
+    def pop(self) -> tuple:
+        entry, self._vtime = self._pop(self._lanes, self._pass)
+        self._len -= 1
+        self._order = None
+        return entry
+
+    def _pop(self, lanes_by_priority, passes) -> tuple[tuple, float]:
+        """出队一个任务，返回 `(entry, 出队时的虚拟时间)`。"""
+        priority = min(
+            (p for p, lanes in lanes_by_priority.items() if lanes),
+            key=lambda p: (passes[p], -self.weight(p)),
+        )
+        vtime = passes[priority]
+        passes[priority] += 1.0 / self.weight(priority)
+        lanes = lanes_by_priority[priority]
+        client, queue = next(iter(lanes.items()))
+        entry = queue.popleft()
+        if queue:
+            lanes.move_to_end(client)
+        else:
+            del lanes[client]
+        return entry, vtime
+
+    def locate(self, task_id: str) -> tuple[str, str] | None:
+        """任务所在的 `(priority, client)`；不在队列里时返回 None。"""
+        for priority, lanes in self._lanes.items():
+            for client, queue in lanes.items():
+                if any(entry[0] == task_id for entry in queue):
+                    return priority, client
+        return None
+
+    def remove(self, task_id: str) -> tuple | None:
+        """移出指定任务并返回其 entry；不在队列里时返回 None。"""
+        found = self.locate(task_id)
+        if found is None:
+            return None
+        priority, client = found
+        queue = self._lanes[priority][client]
+        entry = next(e for e in queue if e[0] == task_id)
+        queue.remove(entry)
+        if not queue:
+            del self._lanes[priority][client]
+        self._len -= 1
+        self._order = None
+        return entry
+
+    def position(self, task_id: str) -> int | None:
+        """按当前状态推演的出队顺序（从 1 开始）；之后的提交可能让位置变化。"""
+        if self._order is None:
+            lanes = {p: OrderedDict((c, deque(q)) for c, q in ls.items())
+                     for p, ls in self._lanes.items()}
+            passes = dict(self._pass)
+            self._order = {self._pop(lanes, passes)[0][0]: i for i in range(1, self._len + 1)}
+        return self._order.get(task_id)
+
+    def state(self) -> tuple[dict[str, float], float]:
+        """`(各优先级的 pass 值, 虚拟时间)`；跨进程的队列靠它把轮转进度存进数据库。"""
+        return dict(self._pass), self._vtime
+
+    def restore(self, passes: dict[str, float], vtime: float) -> None:
+        """恢复 `state()` 保存的轮转进度；应在入队之前调用。"""
+        self._pass.update(passes)
+        self._vtime = vtime
+        self._order = None
+
+    def counts(self) -> dict[str, int]:
+        """各优先级的排队数。"""
+        return {p: sum(len(q) for q in lanes.values())
+                for p, lanes in self._lanes.items() if lanes}
+
+
+class TaskScheduler:
+    """每种任务类型一条公平队列，配一组常驻工作线程按上限并发执行。
+
+    Parameters
+    ----------
+    runner : callable
+        `runner(task_id, fn)`，工作线程取到任务后调用；负责执行 `fn` 并记录结果，
+        不应抛出异常。
+    limits : dict
+        任务类型 -> 最大并发数。未列出的类型使用 `default_workers`。
+    default_workers : int
+        未配置类型的并发上限。
+    weights : dict
+        优先级 -> 权重，默认取 config.yaml 的 `scheduler.priorities`。
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[str, Callable], None],
+        limits: dict[str, int] | None = None,
+        default_workers: int = DEFAULT_WORKERS,
+        weights: dict[str, float] | None = None,
+    ):
+        self._runner = runner
+        self._limits = dict(WORKER_LIMITS if limits is None else limits)
+        self._default_workers = max(1, int(default_workers))
+        self._weights = dict(PRIORITY_WEIGHTS if weights is None else weights)
+        self._cond = threading.Condition()
+        self._queues: dict[str, FairQueue] = {}
+        self._running: dict[str, int] = {}
+
+    def limit(self, kind: str) -> int:
+        return self._limits.get(kind, self._default_workers)
+
+    @property
+    def priorities(self) -> tuple[str, ...]:
+        return tuple(self._weights)
+
+    def _ensure_pool(self, kind: str) -> None:
+        """首次遇到某类任务时才启动它的工作线程（调用方持有锁）。"""
+        if kind in self._queues:
+            return
+        self._queues[kind] = FairQueue(self._weights)
+        self._running[kind] = 0
+        for i in range(self.limit(kind)):
+            threading.Thread(
+                target=self._worker, args=(kind,), name=f'sjt-{kind}-{i}', daemon=True,
+            ).start()
+
+    def submit(
+        self,
+        kind: str,
+        task_id: str,
+        fn: Callable,
+        priority: str = DEFAULT_PRIORITY,
+        client: str | None = None,
+    ) -> int:
+        """把任务排进 `kind` 的队列，返回预计的出队位置（1 表示下一个就轮到它）。
+
+        `priority` 为优先级类别，`client` 为提交方标识（同一优先级内按它轮转）。
+        """
+        with self._cond:
+            self._ensure_pool(kind)
+            queue = self._queues[kind]
+            queue.push((task_id, fn), priority, client)
+            self._cond.notify_all()
+            return queue.position(task_id)
+
+    def preview(self, kind: str, priority: str = DEFAULT_PRIORITY, client: str | None = None) -> int:
+        """现在提交一个 `kind` 任务的话，它会排在第几位（不真正入队）。"""
+        probe = object()
+        with self._cond:
+            queue = self._queues.get(kind)
+            if queue is None:
+                return 1
+            queue.push((probe, None), priority, client)
+            try:
+                return queue.position(probe)
+            finally:
+                queue.remove(probe)
+
+    def reprioritize(self, task_id: str, priority: str, client: str | None = None) -> bool:
+        """把仍在排队的任务改到更高的优先级；已开始执行或本来就不低时返回 False。"""
+        with self._cond:
+            for queue in self._queues.values():
+                found = queue.locate(task_id)
+                if found is None:
+                    continue
+                if queue.weight(priority) <= queue.weight(found[0]):
+                    return False
+                queue.push(queue.remove(task_id), priority, client)
+                return True
+        return False
+
+    def remove(self, task_id: str) -> bool:
+        """把尚未开始的任务移出队列；已开始执行或不在队列里时返回 False。"""
+        with self._cond:
+            return any(q.remove(task_id) is not None for q in self._queues.values())
+
+    def position(self, task_id: str) -> int | None:
+        """任务在所属队列中的预计位置（从 1 开始）；已开始执行或不在队列里时返回 None。"""
+        with self._cond:
+            for queue in self._queues.values():
+                pos = queue.position(task_id)
+                if pos is not None:
+                    return pos
+        return None
+
+    def stats(self) -> dict[str, dict]:
+        """各类型的排队数（及各优先级的排队数）、运行数与并发上限。"""
+        with self._cond:
+            return {
+                kind: {
+                    'queued': len(queue),
+                    'queued_by_priority': queue.counts(),
+                    'running': self._running[kind],
+                    'limit': self.limit(kind),
+                }
+                for kind, queue in self._queues.items()
+            }
+
+    def _worker(self, kind: str) -> None:
+        while True:
+            with self._cond:
+                while not self._queues[kind]:
+                    self._cond.wait()
+                task_id, fn = self._queues[kind].pop()
+                self._running[kind] += 1
+            try:
+                self._runner(task_id, fn)
+            finally:
+                with self._cond:
+                    self._running[kind] -= 1
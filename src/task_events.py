@@ -0,0 +1,54 @@
+"""任务状态变化的进程内广播，供 Server-Sent Events 推送使用。
+
+页面过去靠定时轮询 `/api/task/<id>` 和 `/api/tasks` 获取进度，每个打开的标签页
+每隔几秒就要打一次接口。现在任务状态一变就发布一条事件，SSE 连接各自订阅，
+一个标签页只需保持一条长连接。
+"""
+from __future__ import annotations
+
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+# 单个订阅者最多积压的事件数；客户端读得太慢时丢弃最旧的事件
+MAX_PENDING = 256
+
+
+class TaskEvents:
+    """简单的发布/订阅：每个订阅者一条有界队列。"""
+
+    def __init__(self, max_pending: int = MAX_PENDING):
+        self._max_pending = max_pending
+        self._lock = threading.Lock()
+        self._subscribers: set[queue.Queue] = set()
+
+    def publish(self, event: dict) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            while True:
+                try:
+                    q.put_nowait(event)
+                    break
+                except queue.Full:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    @contextmanager
+    def subscribe(self) -> Iterator[queue.Queue]:
+        """订阅全部任务事件；退出上下文时自动取消订阅。"""
+        q: queue.Queue = queue.Queue(maxsize=self._max_pending)
+        with self._lock:
+            self._subscribers.add(q)
+        try:
+            yield q
+        finally:
+            with self._lock:
+                self._subscribers.discard(q)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
@@ -0,0 +1,271 @@
+"""按任务收集的结构化日志。
+
+诊断信息过去都是裸 `print`（重试、出片轮询、视频智能体的工具调用、任务失败的
+traceback），几个任务同时跑时在控制台上交错成一团，分不清哪行属于哪个任务。
+现在统一走标准库 `logging`：
+
+- 任务执行期间（`TaskRunner.run` 里）用上下文变量 `bind` 住当前任务，其间打出的
+  每条日志都带上任务 ID、当前阶段（取自任务的 `StageRecorder`）和第几次尝试；
+  `asyncio.to_thread`、共享事件循环上的协程都会继承上下文变量，并发派发的 LLM
+  调用也能对上号。
+- 控制台输出的每行前面都有 `[任务 ID 阶段]`。
+- 带任务的日志另存一份：每个任务是一个有界的环形缓冲（最多 `logs.max_records`
+  条，满了丢最旧的），`TaskLogs` 定期把它并进任务库的 `task_logs` 表，网页进程
+  与工作进程的日志都能从 `GET /api/task/<id>/logs` 取到。
+"""
+from __future__ import annotations
+
+import contextvars
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator
+
+from .config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+_LOGS_CFG = CONFIG.get('logs', {}) or {}
+
+LOG_LEVEL = str(_LOGS_CFG.get('level', 'INFO')).upper()
+# 每个任务最多保留的日志条数
+MAX_RECORDS = int(_LOGS_CFG.get('max_records', 500))
+# 各进程把缓冲里的日志写进任务库的间隔（秒）
+FLUSH_INTERVAL = float(_LOGS_CFG.get('flush_interval', 2))
+# 清理已删除任务的日志的间隔（秒）
+SWEEP_INTERVAL = 600
+
+CONSOLE_FORMAT = '%(asctime)s %(levelname)s %(name)s [%(task_id)s %(stage)s] %(message)s'
+
+
+class _Binding:
+    def __init__(self, task_id: str, recorder=None):
+        self.task_id = task_id
+        self.recorder = recorder
+
+    @property
+    def stage(self) -> str | None:
+        current = getattr(self.recorder, 'current', None)
+        if current and current.get('status') == 'running':
+            return current['name']
+        return None
+
+    @property
+    def attempt(self) -> int | None:
+        return getattr(self.recorder, 'attempt', None)
+
+
+_current: contextvars.ContextVar[_Binding | None] = contextvars.ContextVar('sjt_task', default=None)
+
+
+@contextmanager
+def bind(task_id: str, recorder=None) -> Iterator[None]:
+    """在这段代码（及其派生的协程/`to_thread` 调用）里打出的日志都归到任务 `task_id`。
+
+    `recorder` 为任务的 `StageRecorder`，用来给日志标上当前阶段与尝试次数。
+    """
+    token = _current.set(_Binding(task_id, recorder))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def current_task_id() -> str | None:
+    binding = _current.get()
+    return binding.task_id if binding else None
+
+
+class TaskContextFilter(logging.Filter):
+    """给每条日志补上 `task_id` 与 `stage` 属性（不在任务里时为 `-`），供格式串使用。"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        binding = _current.get()
+        record.task_id = binding.task_id if binding else '-'
+        record.stage = (binding.stage if binding else None) or '-'
+        return True
+
+
+class TaskLogBuffer(logging.Handler):
+    """把带任务的日志存进各任务的环形缓冲，等 `TaskLogs` 取走写库。"""
+
+    def __init__(self, max_records: int = MAX_RECORDS):
+        super().__init__()
+        self.max_records = max(1, max_records)
+        self._buffers: dict[str, deque] = {}
+        self._buffers_lock = threading.Lock()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        binding = _current.get()
+        if binding is None:
+            return
+        try:
+            message = record.getMessage()
+            if record.exc_info:
+                message += '\n' + ''.join(traceback.format_exception(*record.exc_info)).rstrip()
+            entry = {
+                'time': record.created,
+                'level': record.levelname,
+                'logger': record.name,
+                'stage': binding.stage,
+                'attempt': binding.attempt,
+                'message': message,
+            }
+        except Exception:  # noqa: BLE001
+            self.handleError(record)
+            return
+        with self._buffers_lock:
+            buffer = self._buffers.get(binding.task_id)
+            if buffer is None:
+                buffer = self._buffers[binding.task_id] = deque(maxlen=self.max_records)
+            buffer.append(entry)
+
+    def drain(self) -> dict[str, list[dict]]:
+        """取走全部缓冲。"""
+        with self._buffers_lock:
+            buffers, self._buffers = self._buffers, {}
+        return {task_id: list(buffer) for task_id, buffer in buffers.items()}
+
+    def restore(self, buffers: dict[str, list[dict]]) -> None:
+        """写库失败时把取走的日志放回去（排在之后新记的日志前面）。"""
+        with self._buffers_lock:
+            for task_id, entries in buffers.items():
+                newer = self._buffers.get(task_id, ())
+                self._buffers[task_id] = deque([*entries, *newer], maxlen=self.max_records)
+
+
+BUFFER = TaskLogBuffer()
+
+
+def setup_logging(level: str = LOG_LEVEL) -> None:
+    """配置根日志器：控制台输出带任务 ID 与阶段，带任务的日志同时进环形缓冲。可重复调用。"""
+    root = logging.getLogger()
+    root.setLevel(level)
+    if any(getattr(h, '_sjt_console', False) for h in root.handlers):
+        return
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    console.addFilter(TaskContextFilter())
+    console._sjt_console = True
+    root.addHandler(console)
+    root.addHandler(BUFFER)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS task_logs (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id TEXT NOT NULL,
+    time    REAL NOT NULL,
+    level   TEXT NOT NULL,
+    logger  TEXT NOT NULL,
+    stage   TEXT,
+    attempt INTEGER,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS task_logs_task ON task_logs (task_id, id);
+"""
+
+
+class TaskLogs:
+    """把各进程缓冲里的任务日志并进任务库的 `task_logs` 表，每个任务只留最新的若干条。
+
+    Parameters
+    ----------
+    store : TaskStore
+        任务库。
+    buffer : TaskLogBuffer
+        本进程的日志缓冲，默认为全局的 `BUFFER`。
+    """
+
+    def __init__(self, store, buffer: TaskLogBuffer = BUFFER):
+        self._store = store
+        self._buffer = buffer
+        self._stop = threading.Event()
+        with store.transaction() as conn:
+            for statement in _SCHEMA.split(';'):
+                conn.execute(statement)
+
+    def flush(self) -> None:
+        """把本进程缓冲里的日志写进表里，并裁掉各任务超出上限的旧日志。"""
+        buffers = self._buffer.drain()
+        if not buffers:
+            return
+        keep = self._buffer.max_records
+        try:
+            with self._store.transaction() as conn:
+                conn.executemany(
+                    'INSERT INTO task_logs (task_id, time, level, logger, stage, attempt, message)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    [(task_id, e['time'], e['level'], e['logger'], e['stage'], e['attempt'], e['message'])
+                     for task_id, entries in buffers.items() for e in entries],
+                )
+                for task_id in buffers:
+                    conn.execute(
+                        'DELETE FROM task_logs WHERE task_id = ? AND id <= (SELECT id FROM task_logs'
+                        ' WHERE task_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)', (task_id, task_id, keep))
+        except BaseException:
+            self._buffer.restore(buffers)
+            raise
+
+    def sweep(self) -> int:
+        """删掉任务记录已不存在的日志，返回删除的条数。"""
+        with self._store.transaction() as conn:
+            return conn.execute(
+                'DELETE FROM task_logs WHERE task_id NOT IN (SELECT task_id FROM tasks)').rowcount
+
+    def get(self, task_id: str, after: int | None = None, min_level: int = logging.NOTSET,
+            limit: int | None = None) -> list[dict]:
+        """任务的日志，按时间先后排列。
+
+        Parameters
+        ----------
+        task_id : str
+            任务 ID。
+        after : int, optional
+            只返回 `id` 大于它的日志（轮询时传上次拿到的最后一条的 `id`）。
+        min_level : int
+            最低级别，如 `logging.WARNING`。
+        limit : int, optional
+            最多返回的条数（取最新的）。
+        """
+        self.flush()
+        sql = 'SELECT id, time, level, logger, stage, attempt, message FROM task_logs WHERE task_id = ?'
+        params: list = [task_id]
+        if after is not None:
+            sql += ' AND id > ?'
+            params.append(after)
+        if min_level > logging.NOTSET:
+            levels = [name for name, no in logging.getLevelNamesMapping().items() if no >= min_level]
+            sql += f" AND level IN ({', '.join('?' for _ in levels)})"
+            params.extend(levels)
+        sql += ' ORDER BY id DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        with self._store.transaction(immediate=False) as conn:
+            rows = conn.execute(sql, params).fetchall()
+        keys = ('id', 'time', 'level', 'logger', 'stage', 'attempt', 'message')
+        return [dict(zip(keys, row)) for row in reversed(rows)]
+
+    def _loop(self, interval: float) -> None:
+        last_sweep = time.monotonic()
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+                if time.monotonic() - last_sweep >= SWEEP_INTERVAL:
+                    last_sweep = time.monotonic()
+                    self.sweep()
+            except Exception:  # noqa: BLE001 - 下次再写；这里不在 bind() 里，不会写回缓冲
+                logger.exception('任务日志写入任务库失败')
+
+    def start(self, interval: float = FLUSH_INTERVAL) -> None:
+        """在后台线程里每隔 `interval` 秒写一次。"""
+        threading.Thread(target=self._loop, args=(interval,), name='sjt-task-logs', daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.flush()
@@ -0,0 +1,222 @@
+"""任务执行：状态流转、整体重试、取消，以及批量任务的汇总。
+
+网页进程内的调度器（`queue.backend: local`）和独立的工作进程（worker.py，
+`queue.backend: sqlite`）用同一套逻辑跑任务，状态都写进 TaskStore。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable
+
+from . import deadline, metrics, task_logs
+from .cancel import CancelToken, TaskCancelled
+from .progress import StageRecorder
+from .result_cache import ResultCache
+from .retry import RETRY_BACKOFF, RETRY_DELAY, TASK_ATTEMPTS
+from .task_store import ACTIVE_STATUSES, TaskStore
+from .workspace import Workspace
+
+logger = logging.getLogger(__name__)
+
+
+class TaskContext:
+    """What a job gets from the task runner.
+
+    `on_progress` follows the stage-progress contract in `src/progress.py`;
+    every stage start/end (and Hailuo's percentage) lands in the task
+    record's `progress` field and is pushed to SSE subscribers. `cancel` is
+    the task's `CancelToken`; jobs hand it to the pipelines. `workspace` is
+    the task's own output directory (`src/workspace.py`), emptied before
+    every attempt; jobs write their artifacts there and list them with
+    `workspace.write_manifest()`.
+    """
+
+    def __init__(self, task_id, cancel=None, update=None, workspace=None, kind=None):
+        self.task_id = task_id
+        self.cancel = cancel or CancelToken()
+        self.workspace = workspace
+        self.on_progress = StageRecorder(
+            (lambda progress: update(task_id, progress=progress)) if update else None, kind=kind)
+
+
+def _batch_entry(child):
+    params = child.get('params') or {}
+    entry = {
+        'task_id': child['task_id'],
+        'modality': child['kind'],
+        'trait_id': params.get('trait_id'),
+        'item_id': params.get('item_id'),
+        'status': child['status'],
+    }
+    if child['status'] == 'done':
+        entry['result'] = child.get('result')
+    elif child.get('error'):
+        entry['error'] = child['error']
+    return entry
+
+
+class TaskRunner:
+    """跑任务并维护任务记录。
+
+    Parameters
+    ----------
+    store : TaskStore
+        任务记录。
+    outdir : str or Path
+        输出根目录：各任务的工作区（`tasks/<task_id>/`）与批量任务的合并清单都在这里。
+    attempts : int
+        整题最多尝试的次数。
+    publish : callable, optional
+        `publish(task_id)`，每次记录变化后调用（网页进程用它推送 SSE）。
+    on_start : callable, optional
+        `on_start(task)`，任务开始执行时调用（网页进程用它刷新排队位置）。
+    cache : ResultCache, optional
+        成功任务的结果记入该缓存（以任务记录里的 `params` 为请求）。
+    """
+
+    def __init__(
+        self,
+        store: TaskStore,
+        outdir='outputs',
+        attempts: int = TASK_ATTEMPTS,
+        publish: Callable[[str], None] | None = None,
+        on_start: Callable[[dict], None] | None = None,
+        cache: ResultCache | None = None,
+    ):
+        self._store = store
+        self._outdir = Path(outdir)
+        self._attempts = max(1, int(attempts))
+        self._publish = publish
+        self._on_start = on_start
+        self._cache = cache
+
+    def update(self, task_id, when_status=None, **fields) -> bool:
+        """Update a task record and push the change to subscribers."""
+        if not self._store.update(task_id, when_status=when_status, **fields):
+            return False
+        if self._publish is not None:
+            self._publish(task_id)
+        return True
+
+    def run(self, task_id, fn, token: CancelToken | None = None) -> None:
+        """跑一个生成任务；失败自动重来，全部尝试都失败才算错误。
+
+        生成链路上每一步都依赖 LLM，偶发的格式/网关问题重跑一次基本就能过，
+        没必要让用户自己点第二次。`fn` 接收一个 `TaskContext`。被取消（TaskCancelled）
+        不算失败，不重试，任务以 `cancelled` 结束。所有尝试共用一个按模态配置的
+        总时限（`deadlines.task_minutes`，见 src/deadline.py），超时或剩余时间不够
+        再试一次时以 `error` 结束。
+        """
+        attempts = self._attempts
+        wait = RETRY_DELAY
+        token = token or CancelToken()
+        task = self._store.get(task_id, with_result=False) or {}
+        label = task.get('label', task_id)
+        ctx = TaskContext(task_id, token, self.update, Workspace(self._outdir, task_id),
+                          kind=task.get('kind'))
+        budget = deadline.TASK_BUDGETS.get(task.get('kind'))
+        started, outcome = None, None
+        with task_logs.bind(task_id, ctx.on_progress), deadline.scope(budget):
+            try:
+                token.raise_if_cancelled()
+                started = time.time()
+                self.update(task_id, status='running', started_at=started)
+                logger.info('开始执行 %s', label)
+                if task and self._on_start is not None:
+                    self._on_start(task)
+                for attempt in range(1, attempts + 1):
+                    ctx.on_progress.attempt = attempt
+                    ctx.workspace.create()
+                    try:
+                        result = fn(ctx)
+                        self.update(task_id, status='done', result=result, finished_at=time.time())
+                        outcome = 'done'
+                        logger.info('%s 完成，用时 %.1fs', label, time.time() - started)
+                        self._remember(task, result)
+                        return
+                    except Exception as e:
+                        if attempt == attempts or not deadline.can_retry(wait):
+                            logger.exception('%s 第 %d/%d 次失败，放弃', label, attempt, attempts)
+                            self.update(task_id, status='error', error=str(e), finished_at=time.time())
+                            outcome = 'error'
+                            return
+                        logger.exception('%s 第 %d/%d 次失败：%s；%.0fs 后重试', label, attempt, attempts, e, wait)
+                        self.update(task_id, attempt=attempt + 1)
+                        token.sleep(wait)
+                        wait *= RETRY_BACKOFF
+            except TaskCancelled:
+                logger.info('%s 已取消', label)
+                self.update(task_id, status='cancelled', error=token.reason, finished_at=time.time())
+                outcome = 'cancelled'
+            finally:
+                if started is not None and outcome is not None:
+                    metrics.observe('sjt_task_duration_seconds', time.time() - started,
+                                    kind=task.get('kind', 'unknown'), status=outcome)
+                if task.get('parent_id'):
+                    self.refresh_batch(task['parent_id'])
+
+    def _remember(self, task, result) -> None:
+        if self._cache is None or not task.get('params'):
+            return
+        try:
+            self._cache.put(task['kind'], task['params'], result, task['task_id'])
+        except Exception:  # noqa: BLE001 - 缓存写不进去不影响任务本身
+            logger.exception('结果写入缓存失败')
+
+    def refresh_batch(self, batch_id) -> None:
+        """Recompute a batch's aggregate progress/result from its children.
+
+        Children may finish in different worker processes at the same time, so
+        every write is conditional on the batch still being active: a late
+        partial refresh can never overwrite the final manifest.
+        """
+        batch = self._store.get(batch_id, with_result=False)
+        if batch is None or batch['status'] not in ACTIVE_STATUSES:
+            return
+        children = sorted(self._store.list(parent_id=batch_id, with_result=True),
+                          key=lambda t: t['created_at'])
+        counts = Counter(c['status'] for c in children)
+        finished = sum(n for status, n in counts.items() if status not in ACTIVE_STATUSES)
+        total = len(children)
+        progress = {
+            'stage': '批量生成',
+            'index': finished,
+            'total': total,
+            'percent': round(100 * finished / max(1, total), 1),
+            'counts': dict(counts),
+        }
+        manifest = {
+            'batch_id': batch_id,
+            'created_at': batch['created_at'],
+            'request': batch.get('params'),
+            'counts': dict(counts),
+            'items': [_batch_entry(c) for c in children],
+        }
+        if finished < total:
+            manifest['partial'] = True
+            self.update(batch_id, when_status=ACTIVE_STATUSES, progress=progress, result=manifest)
+            return
+
+        manifest['finished_at'] = time.time()
+        with open(self._outdir / f"batch_{batch_id}.json", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2, default=str)
+        manifest['manifest_file'] = f"batch_{batch_id}.json"
+        if counts.get('done', 0):
+            status, error = 'done', None
+        elif counts.get('cancelled', 0):
+            status, error = 'cancelled', '批量任务已取消'
+        else:
+            status, error = 'error', '所有子任务均失败'
+        self.update(
+            batch_id,
+            when_status=ACTIVE_STATUSES,
+            status=status,
+            error=error,
+            progress=progress,
+            result=manifest,
+            finished_at=manifest['finished_at'],
+        )
@@ -0,0 +1,391 @@
+"""基于 SQLite 的持久化任务登记表。
+
+任务记录过去只放在进程内的字典里，服务一重启（或崩溃）所有排队、运行中以及
+已完成的任务都会丢失——其中不乏花了十几分钟付费出片的视频任务。这里把任务
+记录落到 SQLite（WAL 模式，读写互不阻塞），结果按 config.yaml 的 `tasks:`
+段配置的保留策略清理，而不是简单地只留最近 50 条。
+"""
+from __future__ import annotations
+
+import json
+import os
+import os.path as op
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from .config import CONFIG
+
+_TASKS_CFG = CONFIG.get('tasks', {}) or {}
+
+TASK_DB_PATH = _TASKS_CFG.get('db_path', 'data/tasks.sqlite3')
+# 旧版默认放在 outputs/ 下（会被 /outputs/ 对外提供下载），新库不存在时搬过来
+_LEGACY_DB_PATH = 'outputs/tasks.sqlite3'
+# 已结束任务保留的天数与条数上限；<= 0 表示不按该条件清理
+RESULT_MAX_AGE_DAYS = float(_TASKS_CFG.get('max_age_days', 30))
+RESULT_MAX_FINISHED = int(_TASKS_CFG.get('max_finished', 1000))
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+_COLUMNS = (
+    'task_id', 'kind', 'label', 'status', 'result', 'error',
+    'created_at', 'started_at', 'finished_at', 'attempt', 'attempts', 'progress',
+    'params', 'parent_id', 'dedupe_key', 'priority', 'client',
+    'updated_at', 'worker', 'heartbeat_at', 'cancel_requested', 'pinned', 'requesters',
+)
+_JSON_COLUMNS = ('result', 'progress', 'params', 'requesters')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id     TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    label       TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    result      TEXT,
+    error       TEXT,
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL,
+    attempt     INTEGER NOT NULL DEFAULT 1,
+    attempts    INTEGER NOT NULL DEFAULT 1,
+    progress    TEXT,
+    params      TEXT,
+    parent_id   TEXT,
+    dedupe_key  TEXT,
+    priority    TEXT,
+    client      TEXT,
+    updated_at  REAL,
+    worker      TEXT,
+    heartbeat_at REAL,
+    cancel_requested TEXT,
+    pinned      INTEGER NOT NULL DEFAULT 0,
+    requesters  TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, created_at);
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key         TEXT PRIMARY KEY,
+    task_id     TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    created_at  REAL NOT NULL
+);
+"""
+
+# 后加的列：旧库启动时用 ALTER TABLE 补上
+_ADDED_COLUMNS = {
+    'progress': 'TEXT',
+    'params': 'TEXT',
+    'parent_id': 'TEXT',
+    'dedupe_key': 'TEXT',
+    'priority': 'TEXT',
+    'client': 'TEXT',
+    'updated_at': 'REAL',
+    'worker': 'TEXT',
+    'heartbeat_at': 'REAL',
+    'cancel_requested': 'TEXT',
+    'pinned': 'INTEGER NOT NULL DEFAULT 0',
+    'requesters': 'TEXT',
+}
+
+
+def _adopt_legacy(path: str) -> None:
+    """默认库还不存在而旧版位置 `outputs/tasks.sqlite3` 有库时，连同 -wal/-shm 一起挪过来。"""
+    legacy = op.abspath(_LEGACY_DB_PATH)
+    if path != op.abspath(TASK_DB_PATH) or path == legacy or op.exists(path) or not op.exists(legacy):
+        return
+    for suffix in ('-wal', '-shm', ''):
+        if op.exists(legacy + suffix):
+            shutil.move(legacy + suffix, path + suffix)  # 两个目录可能挂在不同的卷上
+
+
+class TaskStore:
+    """任务记录的增删改查；所有方法线程安全。
+
+    Parameters
+    ----------
+    path : str
+        SQLite 文件路径，父目录不存在时自动创建。
+    max_age_days : float
+        已结束任务的最长保留天数。
+    max_finished : int
+        最多保留的已结束任务条数（按创建时间保留最新的）。
+    """
+
+    def __init__(
+        self,
+        path: str = TASK_DB_PATH,
+        max_age_days: float = RESULT_MAX_AGE_DAYS,
+        max_finished: int = RESULT_MAX_FINISHED,
+    ):
+        self.path = op.abspath(path)
+        self.max_age_days = max_age_days
+        self.max_finished = max_finished
+        os.makedirs(op.dirname(self.path), exist_ok=True)
+        _adopt_legacy(self.path)
+        self._lock = threading.Lock()
+        # 多个工作进程共用同一个库时写锁会有短暂争用，等久一点再报 database is locked
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                                     timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        existing = {row['name'] for row in self._conn.execute('PRAGMA table_info(tasks)')}
+        for column, decl in _ADDED_COLUMNS.items():
+            if column not in existing:
+                self._conn.execute(f'ALTER TABLE tasks ADD COLUMN {column} {decl}')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS tasks_parent ON tasks (parent_id)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS tasks_dedupe ON tasks (dedupe_key, status)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS tasks_updated ON tasks (updated_at)')
+
+    @contextmanager
+    def transaction(self, immediate: bool = True) -> Iterator[sqlite3.Connection]:
+        """在一个事务里直接操作底层连接。
+
+        `immediate=True` 时开独占写事务（BEGIN IMMEDIATE），同时对其他线程和其他进程
+        互斥；只读的多条查询用 `immediate=False` 拿到一致的快照即可。
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    @staticmethod
+    def _encode(fields: dict) -> dict:
+        out = {}
+        for key, value in fields.items():
+            if key not in _COLUMNS:
+                raise KeyError(f'unknown task field: {key}')
+            if key in _JSON_COLUMNS and value is not None:
+                value = json.dumps(value, ensure_ascii=False, default=str)
+            out[key] = value
+        return out
+
+    @staticmethod
+    def _decode(row: sqlite3.Row) -> dict:
+        task = dict(row)
+        for key in _JSON_COLUMNS:
+            if task.get(key) is not None:
+                task[key] = json.loads(task[key])
+        return task
+
+    def create(self, task: dict) -> None:
+        fields = self._encode({'updated_at': time.time(), **task})
+        cols = ', '.join(fields)
+        marks = ', '.join('?' for _ in fields)
+        with self._lock:
+            self._conn.execute(f'INSERT INTO tasks ({cols}) VALUES ({marks})', tuple(fields.values()))
+
+    def update(self, task_id: str, when_status=None, **fields) -> bool:
+        """更新部分字段，任务不存在时返回 False。
+
+        给了 `when_status`（状态元组）时只在任务当前处于这些状态时才更新，
+        用来在多个进程之间做「排队中 → 已取消」这类不可抢的状态转换。
+        """
+        if not fields:
+            return self.get(task_id, with_result=False) is not None
+        fields = self._encode({**fields, 'updated_at': time.time()})
+        assigns = ', '.join(f'{k} = ?' for k in fields)
+        sql, params = f'UPDATE tasks SET {assigns} WHERE task_id = ?', [*fields.values(), task_id]
+        if when_status:
+            sql += f" AND status IN ({', '.join('?' for _ in when_status)})"
+            params.extend(when_status)
+        with self._lock:
+            cur = self._conn.execute(sql, params)
+        return cur.rowcount > 0
+
+    def get(self, task_id: str, with_result: bool = True) -> dict | None:
+        cols = ', '.join(c for c in _COLUMNS if with_result or c != 'result')
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT {cols} FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+        return self._decode(row) if row is not None else None
+
+    def list(
+        self,
+        statuses=None,
+        with_result: bool = False,
+        parent_id: str | None = None,
+        top_level: bool = False,
+    ) -> list[dict]:
+        """按创建时间倒序列出任务。
+
+        Parameters
+        ----------
+        statuses : iterable of str, optional
+            只列出这些状态的任务；为空时不过滤。
+        with_result : bool
+            是否带上结果（列表视图通常不需要）。
+        parent_id : str, optional
+            只列出该批量任务的子任务。
+        top_level : bool
+            只列出不属于任何批量任务的任务。
+        """
+        cols = ', '.join(c for c in _COLUMNS if with_result or c != 'result')
+        where, params = [], []
+        if statuses:
+            statuses = tuple(statuses)
+            where.append(f"status IN ({', '.join('?' for _ in statuses)})")
+            params.extend(statuses)
+        if parent_id is not None:
+            where.append('parent_id = ?')
+            params.append(parent_id)
+        elif top_level:
+            where.append('parent_id IS NULL')
+        sql = f'SELECT {cols} FROM tasks'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY created_at DESC'
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._decode(r) for r in rows]
+
+    def changed_since(self, since: float) -> list[dict]:
+        """`updated_at` 晚于 `since` 的任务（不带结果），按更新时间排序。"""
+        cols = ', '.join(c for c in _COLUMNS if c != 'result')
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT {cols} FROM tasks WHERE updated_at > ? ORDER BY updated_at',
+                (since,)).fetchall()
+        return [self._decode(r) for r in rows]
+
+    def find_active(self, dedupe_key: str) -> dict | None:
+        """找一个指纹相同、仍在排队或运行的任务。"""
+        marks = ', '.join('?' for _ in ACTIVE_STATUSES)
+        cols = ', '.join(c for c in _COLUMNS if c != 'result')
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT {cols} FROM tasks WHERE dedupe_key = ? AND status IN ({marks})'
+                f' ORDER BY created_at LIMIT 1',
+                (dedupe_key, *ACTIVE_STATUSES),
+            ).fetchone()
+        return self._decode(row) if row is not None else None
+
+    def attach(self, task_id: str, requester: str) -> list[str]:
+        """相同提交合并到这个任务时，把 `requester` 记为它的又一个请求方，返回还在等的请求方。
+
+        `requesters` 列存 请求方 -> 是否还在等；撤回过的请求方再次提交时重新算作在等。
+        """
+        with self.transaction() as conn:
+            row = conn.execute('SELECT requesters, client FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+            if row is None:
+                return []
+            if row['requesters'] is not None:
+                requesters = json.loads(row['requesters'])
+            else:
+                requesters = {row['client']: True} if row['client'] else {}
+            requesters[requester] = True
+            conn.execute('UPDATE tasks SET requesters = ?, updated_at = ? WHERE task_id = ?',
+                         (json.dumps(requesters, ensure_ascii=False), time.time(), task_id))
+        return [r for r, waiting in requesters.items() if waiting]
+
+    def withdraw(self, task_id: str, requester: str | None) -> list[str]:
+        """`requester` 不再等这个任务，返回还在等的其他请求方；返回空列表时才可以真正取消。
+
+        不是请求方的调用者（如别处打开的管理页面）只能取消从没合并过的任务；
+        没记请求方的旧任务总是返回空列表。
+        """
+        with self.transaction() as conn:
+            row = conn.execute('SELECT requesters FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+            if row is None or row['requesters'] is None:
+                return []
+            requesters = json.loads(row['requesters'])
+            if requester in requesters:
+                requesters[requester] = False
+                conn.execute('UPDATE tasks SET requesters = ?, updated_at = ? WHERE task_id = ?',
+                             (json.dumps(requesters, ensure_ascii=False), time.time(), task_id))
+            elif len(requesters) <= 1:
+                return []
+        return [r for r, waiting in requesters.items() if waiting]
+
+    def recent_durations(self, kind: str, limit: int = 50) -> list[float]:
+        """`kind` 类型最近 `limit` 个成功任务的运行耗时（秒），新的在前。"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT finished_at - started_at FROM tasks WHERE kind = ? AND status = 'done'"
+                "  AND started_at IS NOT NULL AND finished_at IS NOT NULL"
+                " ORDER BY finished_at DESC LIMIT ?",
+                (kind, limit),
+            ).fetchall()
+        return [max(0.0, row[0]) for row in rows]
+
+    def remember_key(self, key: str, task_id: str, fingerprint: str) -> None:
+        """记录幂等键对应的任务；同一个键只记第一次。"""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO idempotency_keys (key, task_id, fingerprint, created_at)'
+                ' VALUES (?, ?, ?, ?)',
+                (key, task_id, fingerprint, time.time()),
+            )
+
+    def lookup_key(self, key: str) -> tuple[str, str] | None:
+        """返回幂等键对应的 (task_id, fingerprint)；任务已被清理时视为不存在。"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT k.task_id, k.fingerprint FROM idempotency_keys k'
+                ' JOIN tasks t ON t.task_id = k.task_id WHERE k.key = ?',
+                (key,),
+            ).fetchone()
+        return (row['task_id'], row['fingerprint']) if row is not None else None
+
+    def delete(self, task_id: str) -> bool:
+        """删除任务及其子任务。"""
+        with self._lock:
+            cur = self._conn.execute(
+                'DELETE FROM tasks WHERE task_id = ? OR parent_id = ?', (task_id, task_id))
+        return cur.rowcount > 0
+
+    def mark_interrupted(self, reason: str = '服务重启，任务被中断') -> int:
+        """把上次进程退出时仍在排队/运行的任务标记为 interrupted，返回条数。"""
+        marks = ', '.join('?' for _ in ACTIVE_STATUSES)
+        with self._lock:
+            cur = self._conn.execute(
+                f"UPDATE tasks SET status = 'interrupted', error = ?, finished_at = ?, updated_at = ? "
+                f"WHERE status IN ({marks})",
+                (reason, time.time(), time.time(), *ACTIVE_STATUSES),
+            )
+        return cur.rowcount
+
+    def prune(self) -> int:
+        """按保留策略删除已结束的旧任务，返回删除条数。
+
+        只按顶层任务计算；批量任务被清理时其子任务一并删除。置顶（`pinned`）的任务
+        不清理。这里只删记录，工作区里的产物由 `src/retention.py` 随后回收。
+        """
+        marks = ', '.join('?' for _ in ACTIVE_STATUSES)
+        # 子任务被置顶时整个批量任务都保留
+        unpinned = ('pinned = 0 AND task_id NOT IN'
+                    ' (SELECT parent_id FROM tasks WHERE pinned = 1 AND parent_id IS NOT NULL)')
+        removed = 0
+        with self._lock:
+            if self.max_age_days > 0:
+                cutoff = time.time() - self.max_age_days * 86400
+                cur = self._conn.execute(
+                    f'DELETE FROM tasks WHERE parent_id IS NULL AND {unpinned}'
+                    f'  AND status NOT IN ({marks}) AND created_at < ?',
+                    (*ACTIVE_STATUSES, cutoff),
+                )
+                removed += cur.rowcount
+            if self.max_finished > 0:
+                cur = self._conn.execute(
+                    f'DELETE FROM tasks WHERE task_id IN ('
+                    f'  SELECT task_id FROM tasks WHERE parent_id IS NULL AND {unpinned}'
+                    f'    AND status NOT IN ({marks})'
+                    f'  ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+                    (*ACTIVE_STATUSES, self.max_finished),
+                )
+                removed += cur.rowcount
+            if removed:
+                cur = self._conn.execute(
+                    'DELETE FROM tasks WHERE parent_id IS NOT NULL'
+                    '  AND parent_id NOT IN (SELECT task_id FROM tasks)')
+                removed += cur.rowcount
+            self._conn.execute(
+                'DELETE FROM idempotency_keys WHERE task_id NOT IN (SELECT task_id FROM tasks)')
+        return removed
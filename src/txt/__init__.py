@@ -1,5 +1,27 @@
-from .datasets.load_data import DataLoader
-from .run import SJTRunner
-from .workflow import SJTAgent
+import importlib
+from typing import TYPE_CHECKING
+
 from dotenv import load_dotenv
-load_dotenv()
\ No newline at end of file
+load_dotenv()
+
+if TYPE_CHECKING:
+    from .datasets.load_data import DataLoader
+    from .run import SJTRunner
+    from .workflow import SJTAgent
+
+# DataLoader 依赖 pandas，SJTAgent/SJTRunner 依赖 lmitf，都在首次访问时才导入
+_LAZY = {
+    'DataLoader': '.datasets.load_data',
+    'SJTRunner': '.run',
+    'SJTAgent': '.workflow',
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
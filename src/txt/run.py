@@ -1,5 +1,6 @@
 import asyncio
 from .workflow.main import SJTAgent
+from .. import async_runtime
 from ..config import CONFIG
 from typing import Optional
 from tqdm.auto import tqdm
@@ -337,14 +338,8 @@ class SJTRunner:
                 progress_callback=progress_callback,
             )
 
-        try:
-            loop = asyncio.get_running_loop()
-        except RuntimeError:
-            res = asyncio.run(_run())
-        else:
-            import nest_asyncio
-            nest_asyncio.apply()
-            res = loop.run_until_complete(_run())
+        # 在进程共享的事件循环上跑（见 src/async_runtime.py），Jupyter 里也不用 nest_asyncio
+        res = async_runtime.run(_run())
         if save_results:
             self.save_result(
                 all_items=res,
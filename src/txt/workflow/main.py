@@ -4,6 +4,19 @@ import os.path as op
 import asyncio
 from tqdm import tqdm
 
+from ... import async_runtime
+from ...cancel import CancelToken, cancel_scope
+from ...metrics import instrument_llm
+from ...progress import ProgressCallback, emit, stage
+
+# 阶段名（进度回调里的 stage），顺序即执行顺序
+STAGES = (
+    'Decoding trait',
+    'Polishing trait',
+    'Building situation cues',
+    'Building situations and options',
+)
+
 
 class SJTAgent:
     def __init__(
@@ -31,11 +44,11 @@ class SJTAgent:
         td_prompt = op.join(current_dir, "prompts", "trait_decoder.py")
         tp_prompt = op.join(current_dir, "prompts", "trait_polisher.py")
 
-        self.ba = TemplateLLM(ba_prompt)
-        self.sb_a = TemplateLLM(sb_prompt_a)
-        self.sb_b = TemplateLLM(sb_prompt_b)
-        self.td = TemplateLLM(td_prompt)
-        self.tp = TemplateLLM(tp_prompt)
+        self.ba = instrument_llm(TemplateLLM(ba_prompt), 'ba')
+        self.sb_a = instrument_llm(TemplateLLM(sb_prompt_a), 'sb_a')
+        self.sb_b = instrument_llm(TemplateLLM(sb_prompt_b), 'sb_b')
+        self.td = instrument_llm(TemplateLLM(td_prompt), 'td')
+        self.tp = instrument_llm(TemplateLLM(tp_prompt), 'tp')
 
     async def _generate_items(
         self, 
@@ -46,44 +59,64 @@ class SJTAgent:
         item, 
         n_item,
         model = 'gpt-4o',
+        on_progress: ProgressCallback | None = None,
+        cancel: CancelToken | None = None,
+        ):
+        # 取消时连同下面派生的 asyncio 任务一起停掉
+        async with cancel_scope(cancel):
+            return await self._generate_items_impl(
+                trait_name, trait_description, low_score, high_score, item, n_item,
+                model=model, on_progress=on_progress)
+
+    async def _generate_items_impl(
+        self,
+        trait_name,
+        trait_description,
+        low_score,
+        high_score,
+        item,
+        n_item,
+        model = 'gpt-4o',
+        on_progress: ProgressCallback | None = None,
         ):
         final_item = {}
         final_item['source'] = item
+        n_stages = len(STAGES)
+
+        # 异步客户端直接 await，不占线程池（见 src/async_llm.py）
+        with stage(on_progress, STAGES[0], 0, n_stages):
+            res_td = await self.td.acall(
+                trait_name=trait_name,
+                target_population=self.target_population,
+                trait_description=trait_description,
+                low_score=low_score,
+                high_score=high_score,
+                item=item,
+                response_format="json",
+                model=model
+            )
+        with stage(on_progress, STAGES[1], 1, n_stages):
+            res_tp = await self.tp.acall(
+                trait_name=trait_name,
+                target_population=self.target_population,
+                trait_description=trait_description,
+                low_score=res_td['low_score'],
+                high_score=res_td['high_score'],
+                response_format="json",
+                model=model
+            )
 
-        # 放线程池，避免阻塞事件循环
-        res_td = await asyncio.to_thread(
-            self.td.call,
-            trait_name=trait_name,
-            target_population=self.target_population,
-            trait_description=trait_description,
-            low_score=low_score,
-            high_score=high_score,
-            item=item,
-            response_format="json",
-            model=model
-        )
-        res_tp = await asyncio.to_thread(
-            self.tp.call,
-            trait_name=trait_name,
-            target_population=self.target_population,
-            trait_description=trait_description,
-            low_score=res_td['low_score'],
-            high_score=res_td['high_score'],
-            response_format="json",
-            model=model
-        )
-
-        cues = await asyncio.to_thread(
-            self.sb_a.call,
-            trait_name=trait_name,
-            target_population=self.target_population,
-            situation_theme=self.situation_theme,
-            n_cue=n_item,
-            low_score=res_tp['low_score'],
-            high_score=res_tp['high_score'],
-            response_format="json",
-            model=model
-        )
+        with stage(on_progress, STAGES[2], 2, n_stages):
+            cues = await self.sb_a.acall(
+                trait_name=trait_name,
+                target_population=self.target_population,
+                situation_theme=self.situation_theme,
+                n_cue=n_item,
+                low_score=res_tp['low_score'],
+                high_score=res_tp['high_score'],
+                response_format="json",
+                model=model
+            )
         self.res_td = res_td
         self.res_tp = res_tp
         self.res_sb_a = cues
@@ -94,8 +127,7 @@ class SJTAgent:
         async def process_cue(cue):
             async with sem:
                 try:
-                    res_sb_b = await asyncio.to_thread(
-                        self.sb_b.call,
+                    res_sb_b = await self.sb_b.acall(
                         trait_name=trait_name,
                         target_population=self.target_population,
                         cue=cue,
@@ -106,8 +138,7 @@ class SJTAgent:
                         model=model
                     )
 
-                    res_ba = await asyncio.to_thread(
-                        self.ba.call,
+                    res_ba = await self.ba.acall(
                         situation=res_sb_b["situation"][0],
                         trait_name=trait_name,
                         target_population=self.target_population,
@@ -127,20 +158,27 @@ class SJTAgent:
                         "cue": cue,
                     }
 
-        tasks = [process_cue(cue) for cue in cue_list]
+        tasks = [asyncio.create_task(process_cue(cue)) for cue in cue_list]
 
         results = []
-        if self.show_progress:
-            for fut in tqdm(
-                asyncio.as_completed(tasks),
-                total=len(tasks),
-                desc=f"Generating {trait_name}'s {n_item} sjts from source item",
-                leave=False
-            ):
-                results.append(await fut)
-        else:
-            for fut in asyncio.as_completed(tasks):
-                results.append(await fut)
+        try:
+            with stage(on_progress, STAGES[3], 3, n_stages):
+                pending = asyncio.as_completed(tasks)
+                if self.show_progress:
+                    pending = tqdm(
+                        pending,
+                        total=len(tasks),
+                        desc=f"Generating {trait_name}'s {n_item} sjts from source item",
+                        leave=False
+                    )
+                for fut in pending:
+                    results.append(await fut)
+                    emit(on_progress, percent=100 * len(results) / max(1, len(tasks)),
+                         done=len(results), count=len(tasks))
+        finally:
+            # 被取消（或中途出错）时不再派发剩下的线索
+            for task in tasks:
+                task.cancel()
 
         final_item['n_item'] = n_item
         final_item['trait_decoder'] = res_td
@@ -166,21 +204,21 @@ class SJTAgent:
         model = 'gpt-4o',
         outdir=None,
         out_basename=None,
+        on_progress: ProgressCallback | None = None,
+        cancel: CancelToken | None = None,
         ):
-        try:
-            loop = asyncio.get_running_loop()
-        except RuntimeError:
-            result = asyncio.run(self._generate_items(
-                trait_name,
-                trait_description,
-                low_score,
-                high_score,
-                item, n_item, model=model))
-        else:
-            import nest_asyncio
+        """生成题目。
 
-            nest_asyncio.apply()
-            result = loop.run_until_complete(self._generate_items(trait_name, trait_description, low_score, high_score, item, n_item, model=model))
+        `on_progress` 为阶段进度回调（见 src/progress.py，阶段名见 STAGES）；
+        `cancel` 为取消令牌，被取消时尚未完成的 LLM 调用任务随即取消并抛出 TaskCancelled。
+        """
+        # 调度到进程共享的事件循环上（见 src/async_runtime.py），不再每个任务新建一个
+        result = async_runtime.run(self._generate_items(
+            trait_name,
+            trait_description,
+            low_score,
+            high_score,
+            item, n_item, model=model, on_progress=on_progress, cancel=cancel))
         if outdir is not None:
             import json
             if out_basename is not None:
@@ -4,12 +4,11 @@ from .agents.Tools import (
     reflect_video_prompt)
 from .agents.vioce_autospeed import generate_narration
 from .agents.Hailuo import run_hailuo_pipeline
-from .test.merge_two_files import AVMerger
 from .agents.prompts import PROMPT_CUE, PROMPT_STORYBOARD, PROMPT_VIDEO
 
 import os
 import json
-import time
+import logging
 import uuid
 from langgraph.errors import GraphRecursionError
 from langgraph.prebuilt import create_react_agent
@@ -17,9 +16,14 @@ from langgraph_swarm import create_handoff_tool, create_swarm
 from langgraph.checkpoint.memory import InMemorySaver
 from langchain_openai import ChatOpenAI
 
+from ..cancel import CancelToken, check, sleep
 from ..config import CONFIG
+from ..deadline import call_timeout
+from ..progress import ProgressCallback, stage
 from ..retry import RETRY_DELAY
 
+logger = logging.getLogger(__name__)
+
 _VIDEO_CFG = CONFIG.get('video', {})
 VID_AGENT_MODEL = _VIDEO_CFG.get('agent_model', 'gpt-4o')
 VID_DURATION = int(_VIDEO_CFG.get('duration', 10))
@@ -29,6 +33,14 @@ VID_RESOLUTION = _VIDEO_CFG.get('resolution', '768P')
 VID_RECURSION_LIMIT = int(_VIDEO_CFG.get('recursion_limit', 60))
 VID_AGENT_ATTEMPTS = int(_VIDEO_CFG.get('agent_attempts', 2))
 
+# 阶段名（进度回调里的 stage），顺序即执行顺序
+STAGES = (
+    'Designing video prompt (multi-agent)',
+    'Generating video (Hailuo)',
+    'Synthesizing narration',
+    'Merging audio and video',
+)
+
 
 def _extract_video_prompt(messages):
     """从消息流中取出视频提示词；拿不到就退回用 handoff 里的 storyboard 现算一个。"""
@@ -71,8 +83,23 @@ def _extract_video_prompt(messages):
     return None
 
 
-def _run_swarm(app, config, question_content, character_seed, trait=None):
-    """跑一次多智能体流程并取回视频提示词；撞到步数上限时从检查点里捞已有成果。"""
+def _build_swarm(model_name):
+    """搭一套 Cue → Storyboard → Video 的 swarm。每次尝试前重新搭，让 agent 的 LLM
+    请求超时不超过任务剩余时间（`deadline.call_timeout()`）。"""
+    model = ChatOpenAI(model=model_name, temperature=0.4, timeout=call_timeout())
+
+    cue_retrieval_agent = create_react_agent(model, [get_cues, reflect_cues, create_handoff_tool(agent_name="Storyboard")], prompt=PROMPT_CUE, name="Cue")
+    storyboard_reason_agent = create_react_agent(model, [generate_storyboard, reflect_storyboard, create_handoff_tool(agent_name="Video")], prompt=PROMPT_STORYBOARD, name="Storyboard")
+    video_prompt_agent = create_react_agent(model, [generate_video_prompt, reflect_video_prompt], prompt=PROMPT_VIDEO, name="Video")
+
+    return create_swarm([cue_retrieval_agent, storyboard_reason_agent, video_prompt_agent], default_active_agent="Cue")
+
+
+def _run_swarm(app, config, question_content, character_seed, trait=None, cancel=None):
+    """跑一次多智能体流程并取回视频提示词；撞到步数上限时从检查点里捞已有成果。
+
+    逐步 stream 而不是一次 invoke，这样每走一步都能检查 `cancel`。
+    """
     # 反思工具会先自行推断待测特质，推断结果与题干不符时就反复重来（步数的主要消耗），
     # 所以把特质直接写进输入，让反思有明确的对齐标准。
     stem = f"题目：{question_content}\n特质：{trait}" if trait else question_content
@@ -83,11 +110,13 @@ def _run_swarm(app, config, question_content, character_seed, trait=None):
         ]
     }
     try:
-        turn = app.invoke(inputs, config)
+        turn = {}
+        for turn in app.stream(inputs, config, stream_mode="values"):
+            check(cancel)
         return _extract_video_prompt(turn.get("messages", []))
     except GraphRecursionError as e:
         # 步数用尽不代表没有产出：分镜/提示词往往已经生成，只是 agent 没能正常收尾。
-        print(f"[vid] 多智能体流程达到步数上限（{config.get('recursion_limit')}），尝试从中间结果恢复：{e}")
+        logger.warning("多智能体流程达到步数上限（%s），尝试从中间结果恢复：%s", config.get('recursion_limit'), e)
         try:
             state = app.get_state(config)
             messages = (state.values or {}).get("messages", [])
@@ -108,6 +137,8 @@ class VidSJTAgent:
         model_name=VID_AGENT_MODEL,
         outdir=None,
         out_basename=None,
+        on_progress: ProgressCallback | None = None,
+        cancel: CancelToken | None = None,
     ):
         return api_generate_video_sjt(
             trait=self.trait,
@@ -117,7 +148,9 @@ class VidSJTAgent:
             character_seed_json=character_seed_json,
             duration=duration,
             resolution=resolution,
-            model_name=model_name
+            model_name=model_name,
+            on_progress=on_progress,
+            cancel=cancel,
     )
 
 def api_generate_video_sjt(
@@ -128,10 +161,17 @@ def api_generate_video_sjt(
         out_basename=None,
         duration=VID_DURATION,
         resolution=VID_RESOLUTION,
-        model_name=VID_AGENT_MODEL
+        model_name=VID_AGENT_MODEL,
+        on_progress: ProgressCallback | None = None,
+        cancel: CancelToken | None = None,
         ):
     """
     核心API：生成视频SJT
+
+    `on_progress` 为阶段进度回调（见 src/progress.py，阶段名见 STAGES），
+    出片阶段会附带 Hailuo 返回的进度百分比。
+    `cancel` 为取消令牌：多智能体每走一步、出片每轮询一次、各阶段之间都会检查，
+    被取消时抛出 TaskCancelled。
     
     Returns:
         dict: {
@@ -173,54 +213,51 @@ def api_generate_video_sjt(
         # 如果解析失败，使用默认值
         character_seed = {"age": 23, "gender": "女", "group": "大学生", "nationality": "中国", "occupation": "默认"}
 
-    # 3. 初始化 LangGraph 多智能体系统
-    model = ChatOpenAI(model=model_name, temperature=0.4)
-
-    cue_retrieval_agent = create_react_agent(model, [get_cues, reflect_cues, create_handoff_tool(agent_name="Storyboard")], prompt=PROMPT_CUE, name="Cue")
-    storyboard_reason_agent = create_react_agent(model, [generate_storyboard, reflect_storyboard, create_handoff_tool(agent_name="Video")], prompt=PROMPT_STORYBOARD, name="Storyboard")
-    video_prompt_agent = create_react_agent(model, [generate_video_prompt, reflect_video_prompt], prompt=PROMPT_VIDEO, name="Video")
-
-    workflow = create_swarm([cue_retrieval_agent, storyboard_reason_agent, video_prompt_agent], default_active_agent="Cue")
-
-    # 4. 执行工作流（失败或空产出时整段重跑，每次都用干净的检查点与 thread_id）
+    # 3. 执行 LangGraph 多智能体工作流（失败或空产出时整段重跑，每次都用干净的检查点与 thread_id）
+    n_stages = len(STAGES)
     video_prompts = None
     last_exc = None
-    for attempt in range(1, max(1, VID_AGENT_ATTEMPTS) + 1):
-        app = workflow.compile(checkpointer=InMemorySaver())
-        config = {
-            "configurable": {"thread_id": uuid.uuid4().hex},
-            "recursion_limit": VID_RECURSION_LIMIT,
-        }
-        try:
-            video_prompts = _run_swarm(app, config, question_content, character_seed, trait=trait)
-        except Exception as e:  # noqa: BLE001 - 网络/网关抖动等，重跑一次通常就好
-            last_exc = e
-            print(f"[vid] 多智能体流程第 {attempt} 次失败：{e}")
+    with stage(on_progress, STAGES[0], 0, n_stages):
+        for attempt in range(1, max(1, VID_AGENT_ATTEMPTS) + 1):
+            check(cancel)
+            app = _build_swarm(model_name).compile(checkpointer=InMemorySaver())
+            config = {
+                "configurable": {"thread_id": uuid.uuid4().hex},
+                "recursion_limit": VID_RECURSION_LIMIT,
+            }
+            try:
+                video_prompts = _run_swarm(app, config, question_content, character_seed, trait=trait, cancel=cancel)
+            except Exception as e:  # noqa: BLE001 - 网络/网关抖动等，重跑一次通常就好
+                last_exc = e
+                logger.warning("多智能体流程第 %d 次失败：%s", attempt, e)
 
-        if video_prompts:
-            break
-        if attempt < VID_AGENT_ATTEMPTS:
-            print(f"[vid] 未拿到视频提示词，{RETRY_DELAY:.0f}s 后重跑多智能体流程（第 {attempt + 1} 次）")
-            time.sleep(RETRY_DELAY)
+            if video_prompts:
+                break
+            if attempt < VID_AGENT_ATTEMPTS:
+                logger.warning("未拿到视频提示词，%.0fs 后重跑多智能体流程（第 %d 次）", RETRY_DELAY, attempt + 1)
+                sleep(RETRY_DELAY, cancel)
 
-    if not video_prompts:
-        raise ValueError(f"未能生成有效的视频提示词{f'（最后一次错误：{last_exc}）' if last_exc else ''}")
+        if not video_prompts:
+            raise ValueError(f"未能生成有效的视频提示词{f'（最后一次错误：{last_exc}）' if last_exc else ''}")
 
     # 6. 生成视频 (Hailuo)
-    hailuo_results = run_hailuo_pipeline(
-        video_prompts,
-        duration=duration,
-        resolution=resolution,
-        auto_download=True,
-        trait=trait
-    )
-    
-    if not isinstance(hailuo_results, dict):
-        # 创建失败 / 轮询超时 / 下载失败，具体原因已打印在日志里
-        raise RuntimeError("视频生成失败：出片接口未返回结果（详见日志）")
-    saved_dir = hailuo_results.get("saved_dir")
-    if not saved_dir:
-        raise RuntimeError("视频生成失败，未返回保存目录")
+    with stage(on_progress, STAGES[1], 1, n_stages):
+        hailuo_results = run_hailuo_pipeline(
+            video_prompts,
+            duration=duration,
+            resolution=resolution,
+            auto_download=True,
+            trait=trait,
+            on_progress=on_progress,
+            cancel=cancel,
+        )
+
+        if not isinstance(hailuo_results, dict):
+            # 创建失败 / 轮询超时 / 下载失败，具体原因已打印在日志里
+            raise RuntimeError("视频生成失败：出片接口未返回结果（详见日志）")
+        saved_dir = hailuo_results.get("saved_dir")
+        if not saved_dir:
+            raise RuntimeError("视频生成失败，未返回保存目录")
 
     # 7. 生成音频 (TTS)
     audio_output_dir = saved_dir
@@ -228,17 +265,22 @@ def api_generate_video_sjt(
     narration_text = question_content
     speed = 1.5 if len(narration_text) > 54 else 1.0
 
-    generate_narration(
-        text=narration_text,
-        target_duration=float(duration),
-        output_dir=audio_output_dir,
-        speed=speed
-    )
+    check(cancel)
+    with stage(on_progress, STAGES[2], 2, n_stages):
+        generate_narration(
+            text=narration_text,
+            target_duration=float(duration),
+            output_dir=audio_output_dir,
+            speed=speed
+        )
 
     # 8. 合并音视频
-    merger = AVMerger(video_folder=saved_dir, audio_folder=saved_dir, output_folder=saved_dir)
-    env_name = saved_dir.split(os.sep)[-1] if saved_dir else "env"
-    merger.merge(num_files=1, only_first_pair=True, output_basename=env_name)
+    check(cancel)
+    with stage(on_progress, STAGES[3], 3, n_stages):
+        from .test.merge_two_files import AVMerger  # moviepy 导入很慢，到合并这一步才加载
+        merger = AVMerger(video_folder=saved_dir, audio_folder=saved_dir, output_folder=saved_dir)
+        env_name = saved_dir.split(os.sep)[-1] if saved_dir else "env"
+        merger.merge(num_files=1, only_first_pair=True, output_basename=env_name)
 
     # 查找最终生成的合并文件
     final_video_path = None
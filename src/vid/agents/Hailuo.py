@@ -1,15 +1,21 @@
+import logging
 import os
 import requests
-import time
 from typing import Optional, Dict, Any
 from datetime import datetime
 
 from dotenv import load_dotenv
 
+from ...cancel import CancelToken, check, sleep
 from ...config import CONFIG
+from ...deadline import DeadlineExceeded, call_timeout
+from ...metrics import inc
+from ...progress import ProgressCallback, emit, parse_percent
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # DMXAPI 已迁移到 OpenAI 风格的视频接口：
 #   创建: POST {base_url}/videos
 #   查询: GET  {base_url}/videos/{task_id}   -> status/progress, 完成后 metadata.url 为下载链接
@@ -42,20 +48,25 @@ def create_video_task(
         "duration": duration if duration is not None else VIDEO_DURATION,
         "resolution": resolution or VIDEO_RESOLUTION,
     }
-    resp = requests.post(VIDEO_CREATE_URL, headers=headers, json=payload)
+    resp = requests.post(VIDEO_CREATE_URL, headers=headers, json=payload, timeout=call_timeout())
     if resp.status_code != 200:
-        print("创建失败:", resp.status_code, resp.text)
+        logger.warning("创建失败: %s %s", resp.status_code, resp.text)
         return None
     resp_json = resp.json()
     task_id = resp_json.get("task_id") or resp_json.get("id")
-    print("创建成功 task_id:", task_id)
+    logger.info("创建成功 task_id: %s", task_id)
     return task_id
 
 
 def query_video_task(task_id: str) -> Optional[Dict[str, Any]]:
-    resp = requests.get(VIDEO_QUERY_URL.format(task_id), headers=headers)
+    try:
+        resp = requests.get(VIDEO_QUERY_URL.format(task_id), headers=headers, timeout=call_timeout())
+    except requests.RequestException as e:
+        # 单次查询超时/断连不算失败，下一轮再查
+        logger.warning("查询失败: %s", e)
+        return None
     if resp.status_code != 200:
-        print("查询失败:", resp.status_code, resp.text)
+        logger.warning("查询失败: %s %s", resp.status_code, resp.text)
         return None
     return resp.json()
 
@@ -72,13 +83,13 @@ def download_video(task_id: str, info: Dict[str, Any], output_dir: str) -> Optio
         or info.get("url")
     )
     if download_url:
-        resp = requests.get(download_url)
+        resp = requests.get(download_url, timeout=call_timeout())
     else:
-        resp = requests.get(VIDEO_CONTENT_URL.format(task_id), headers=headers)
+        resp = requests.get(VIDEO_CONTENT_URL.format(task_id), headers=headers, timeout=call_timeout())
     resp.raise_for_status()
     with open(filepath, "wb") as f:
         f.write(resp.content)
-    print(f"视频已成功保存至 {filepath}")
+    logger.info("视频已成功保存至 %s", filepath)
     return filepath
 
 
@@ -147,30 +158,42 @@ def run_hailuo_pipeline(
     auto_download: bool = True,
     output_dir: str = "results/video",
     trait: str | None = None,
+    on_progress: ProgressCallback | None = None,
+    cancel: CancelToken | None = None,
 ) -> Optional[Dict[str, Any]]:
-    """一键执行：创建→轮询→下载（可选）。返回最终查询结果（含保存路径）。"""
+    """一键执行：创建→轮询→下载（可选）。返回最终查询结果（含保存路径）。
+
+    `on_progress` 为进度回调（见 src/progress.py）：每次轮询上报一次当前阶段的
+    出片进度百分比与接口状态。`cancel` 为取消令牌，轮询间隔内被取消时立即抛出
+    TaskCancelled（远端的出片任务不会被撤回）。
+    """
     task_id = create_video_task(prompt, model=model, duration=duration, resolution=resolution)
     if not task_id:
         return None
 
     info: Optional[Dict[str, Any]] = None
     for i in range(max_polls):
+        check(cancel)
         info = query_video_task(task_id)
         if not info:
-            time.sleep(poll_interval)
+            inc('sjt_hailuo_polls_total', status='no_response')
+            sleep(poll_interval, cancel)
             continue
         status = (info.get("status") or "").lower()
+        inc('sjt_hailuo_polls_total', status=status or 'unknown')
         progress = info.get("progress")
-        print(f"轮询 {i+1}/{max_polls}: status={status}, progress={progress}")
+        logger.info("轮询 %d/%d: status=%s, progress=%s", i + 1, max_polls, status, progress)
+        emit(on_progress, percent=parse_percent(progress), poll=i + 1,
+             remote_status=status, remote_task_id=task_id)
         if status == "completed":
             break
         if status in ("failed", "cancelled", "error"):
-            print("视频生成失败:", info)
+            logger.warning("视频生成失败: %s", info)
             return None
-        time.sleep(poll_interval)
+        sleep(poll_interval, cancel)
 
     if not info or (info.get("status") or "").lower() != "completed":
-        print("轮询超时，任务未完成。task_id:", task_id)
+        logger.warning("轮询超时，任务未完成。task_id: %s", task_id)
         return None
 
     if auto_download:
@@ -191,7 +214,9 @@ def run_hailuo_pipeline(
             if filepath:
                 info["saved_video_path"] = filepath
                 info["saved_dir"] = output_dir
+        except DeadlineExceeded:
+            raise
         except Exception as e:
-            print("视频下载失败:", e)
+            logger.exception("视频下载失败: %s", e)
 
     return info
@@ -1,23 +1,40 @@
 from dotenv import load_dotenv
 import hashlib
 import json
+import logging
 from langchain_openai import ChatOpenAI
 import os
 from datetime import datetime
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
 from .prompts import generate_video_prompt as VIDEO_PROMPT_SYSTEM_TEXT
 from ...config import CONFIG
+from ...deadline import call_timeout
+from ...llm_cache import cached_chat_model
+from ...metrics import llm_call
 import re
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # LLM（供 cues 提取与反思工具使用）
-tool_model = ChatOpenAI(model=CONFIG.get('video', {}).get('agent_model', 'gpt-4o'), temperature=0.4)
+_tool_model = None
+
+
+def tool_model(template: str | None = None) -> ChatOpenAI:
+    """首次调用工具时才创建客户端，导入本模块不连带建连接、不要求 API 密钥已就绪。
+
+    `template` 为工具名；打开了 LLM 响应缓存（config.yaml 的 `llm_cache`）时按它计数。
+    """
+    global _tool_model
+    if _tool_model is None:
+        _tool_model = ChatOpenAI(model=CONFIG.get('video', {}).get('agent_model', 'gpt-4o'), temperature=0.4)
+    return cached_chat_model(_tool_model, template)
 
 def get_cues(text: str) -> str:
     """使用 LLM 作为工具，从输入中提取线索（cues）。返回 JSON（见系统提示）。"""
     try:
-        print(f"[TOOL get_cues:llm]")
+        logger.info("[TOOL get_cues:llm]")
         system_prompt = (
             "你是一名人格情境判断测验的分析专家。"
             "核心任务：基于输入的人格情境判断测文本，提取关键线索（cue）包括环境、事件、冲突、人物状态等，不得遗漏"
@@ -72,7 +89,7 @@ def get_cues(text: str) -> str:
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": text},
         ]
-        resp = tool_model.invoke(messages)
+        resp = llm_call('get_cues', tool_model('get_cues').invoke, messages, timeout=call_timeout())
         content = getattr(resp, "content", None)
         if not content:
             return "(cues 提取失败: 空响应)"
@@ -106,7 +123,7 @@ def get_cues(text: str) -> str:
 def generate_storyboard(cues_data: str) -> str:
     """基于 cues 数据生成分镜脚本。输入 cues JSON，输出分镜 JSON。"""
     try:
-        print("[TOOL generate_storyboard:llm]")
+        logger.info("[TOOL generate_storyboard:llm]")
         system_prompt = """
         你是一名人格情境判断测验（PSJT）的专家，熟悉五大人格理论和特质激活理论。你的核心任务是：根据输入的原始情境题目和线索（cues）以及客观特质信号，生成一段连续的分镜描述。
         该提示词将用于直接指导 AI 视频生成，必须融合所有关键视觉元素，并锚定10秒时长。
@@ -149,7 +166,7 @@ def generate_storyboard(cues_data: str) -> str:
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": merged_input},
         ]
-        resp = tool_model.invoke(messages)  # type: ignore
+        resp = llm_call('generate_storyboard', tool_model('generate_storyboard').invoke, messages, timeout=call_timeout())  # type: ignore
         content = getattr(resp, "content", None)
         if not content:
             return "(分镜生成失败: 空响应)"
@@ -211,10 +228,10 @@ def generate_video_prompt(storyboard_data: str) -> str:
     cache_key = hashlib.sha1(str(storyboard_data).encode("utf-8")).hexdigest()
     cached = _VIDEO_PROMPT_CACHE.get(cache_key)
     if cached:
-        print("[TOOL generate_video_prompt:cache]")
+        logger.info("[TOOL generate_video_prompt:cache]")
         return cached
     try:
-        print("[TOOL generate_video_prompt:llm]")
+        logger.info("[TOOL generate_video_prompt:llm]")
         system_prompt = VIDEO_PROMPT_SYSTEM_TEXT
         # 仅向模型提供 core_video_prompt
         core_prompt = None
@@ -254,7 +271,7 @@ def generate_video_prompt(storyboard_data: str) -> str:
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": effective_input},
         ]
-        resp = tool_model.invoke(messages)  # type: ignore
+        resp = llm_call('generate_video_prompt', tool_model('generate_video_prompt').invoke, messages, timeout=call_timeout())  # type: ignore
         content = getattr(resp, "content", None)
         if not content:
             return "(视频提示词生成失败: 空响应)"
@@ -270,7 +287,7 @@ def reflect_cues(cues_text: str) -> str:
     """对 cues 与检索结果进行评分与改进建议，必要时返回 revised_cues（JSON）。
     """
     try:
-        print("[TOOL reflect_cues:llm]")
+        logger.info("[TOOL reflect_cues:llm]")
         system_prompt = (
             "你是一名 PSJT 构念一致性评审专家，你熟悉大五人格理论**。"
             "你的任务是确保输入的 cues JSON 在视频化过程中保持构念的信效度。\n\n"
@@ -302,7 +319,7 @@ def reflect_cues(cues_text: str) -> str:
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": cues_text},
         ]
-        resp = tool_model.invoke(messages)  # type: ignore
+        resp = llm_call('reflect_cues', tool_model('reflect_cues').invoke, messages, timeout=call_timeout())  # type: ignore
         content = getattr(resp, "content", None)
         if not content:
             return "(cues 反思失败: 空响应)"
@@ -314,7 +331,7 @@ def reflect_cues(cues_text: str) -> str:
 def reflect_storyboard(storyboard_data: str) -> str:
     """对分镜脚本进行评分与改进建议，必要时返回 revised_storyboard。"""
     try:
-        print("[TOOL reflect_storyboard:llm]")
+        logger.info("[TOOL reflect_storyboard:llm]")
         system_prompt = (
             "你是PSJT 构念一致性评审专家,你熟悉大五人格理论**\n"
             "你的任务是根据知识和source_text还有cues，确保输入的 storyboard JSON 在视频化过程中保持构念的信效度"
@@ -352,7 +369,7 @@ def reflect_storyboard(storyboard_data: str) -> str:
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": storyboard_data},
         ]
-        resp = tool_model.invoke(messages)
+        resp = llm_call('reflect_storyboard', tool_model('reflect_storyboard').invoke, messages, timeout=call_timeout())
         content = getattr(resp, "content", None)
         if not content:
             return "(分镜反思失败: 空响应)"
@@ -364,7 +381,7 @@ def reflect_storyboard(storyboard_data: str) -> str:
 def reflect_video_prompt(video_prompt_data: str) -> str:
     """对视频提示词进行评分与改进建议，必要时返回 revised_video_prompt。同时将高质量prompt保存到JSON文件。"""
     try:
-        print("[TOOL reflect_video_prompt:llm]")
+        logger.info("[TOOL reflect_video_prompt:llm]")
         system_prompt = (
             "你是PSJT 构念一致性评审专家,你熟悉大五人格理论**你的任务：\n"
             "你的任务是确保输入的 video_prompt JSON 保持构念的信效度。\n\n"
@@ -400,7 +417,7 @@ def reflect_video_prompt(video_prompt_data: str) -> str:
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": video_prompt_data},
         ]
-        resp = tool_model.invoke(messages)  # type: ignore
+        resp = llm_call('reflect_video_prompt', tool_model('reflect_video_prompt').invoke, messages, timeout=call_timeout())  # type: ignore
         content = getattr(resp, "content", None)
         if not content:
             return "(视频提示词反思失败: 空响应)"
@@ -1,16 +1,23 @@
 #%%
 import requests
 import json
+import logging
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
 try:
     from ...config import CONFIG
+    from ...deadline import call_timeout
 except ImportError:
     # 允许作为独立脚本直接运行（python vioce_autospeed.py）
     CONFIG = {}
 
+    def call_timeout(limit: float = 180) -> float:
+        return limit
+
+logger = logging.getLogger(__name__)
+
 _TTS_CFG = CONFIG.get('tts', {})
 _BASE_URL = str(CONFIG.get('base_url', 'https://www.dmxapi.cn/v1')).rstrip('/')
 DMX_TTS_URL = f"{_BASE_URL}/audio/speech"
@@ -36,6 +43,7 @@ def synthesize_voice(text: str, output_path: str = "results/audio/output.mp3", v
             DMX_TTS_URL,
             headers={"Authorization": f"Bearer {DMX_API_KEY}"},
             json=payload,
+            timeout=call_timeout(),
         )
         response.raise_for_status()
 
@@ -45,12 +53,12 @@ def synthesize_voice(text: str, output_path: str = "results/audio/output.mp3", v
             os.makedirs(out_dir, exist_ok=True)
             with open(output_path, "wb") as f:
                 f.write(response.content)
-            print(f"语音合成成功，已保存为 {output_path}")
+            logger.info("语音合成成功，已保存为 %s", output_path)
             return output_path
         else:
             raise RuntimeError(f"错误响应: {response.text}")
     except Exception as e:
-        print(f"请求出错: {e}")
+        logger.warning("语音合成请求出错: %s", e)
         return ""
 def generate_narration(
     text: str,
@@ -80,7 +88,7 @@ def generate_narration(
 
         return synthesize_voice(text=text_to_synthesize, output_path=audio_path, speed=speed_val)
     except Exception as e:
-        print(f"旁白生成失败: {e}")
+        logger.exception("旁白生成失败: %s", e)
         return ""
 
 
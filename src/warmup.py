@@ -0,0 +1,130 @@
+"""启动预热：在后台提前加载各生成链路的重组件。
+
+各链路的依赖是在第一次用到时才导入的（见 `src/__init__.py`），代价是冷启动后的
+头几个任务要自己付模型加载、字体加载和提示词模板解析的时间——insightface 的
+buffalo_l 光 `FaceAnalysis.prepare` 就要好几秒。在 config.yaml 的 `warmup:` 段
+打开后，进程启动时在后台把选定的组件预先加载好；网页进程的 `/readyz` 在预热
+完成前返回 503，负载均衡据此只把流量导到已经热好的实例上。
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Callable, Iterable
+
+from .config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+_WARM_CFG = CONFIG.get('warmup', {}) or {}
+
+
+def _warm_text() -> None:
+    from .async_runtime import get_runtime
+    from .txt import SJTAgent
+
+    get_runtime()
+
+    # 构造一次即解析全部提示词模板，并导入 lmitf/openai 客户端
+    SJTAgent(show_progress=False)
+
+
+def _warm_image() -> None:
+    from PIL import ImageFont
+
+    from . import ImgAgent, ref_viz  # noqa: F401 - 导入即加载流水线与提示词模板
+    from .img.annotator.annotator import FONT_PATH
+    from .img.make_ins import DEFAULT_FONT_PATH
+
+    for image in ref_viz.values():
+        image.load()
+    for path in {FONT_PATH, DEFAULT_FONT_PATH}:
+        ImageFont.truetype(path, 32)
+
+
+def _warm_faces() -> None:
+    from .img.annotator.face_labeler import load_model
+
+    load_model()
+
+
+def _warm_video() -> None:
+    from . import VidAgent  # noqa: F401 - langgraph / langchain_openai
+    from .vid.test.merge_two_files import AVMerger  # noqa: F401 - moviepy
+
+
+# 组件名 -> (所属模态, 预热函数)；按这个顺序依次预热
+COMPONENTS: dict[str, tuple[str, Callable[[], None]]] = {
+    'text': ('text', _warm_text),
+    'image': ('image', _warm_image),
+    'faces': ('image', _warm_faces),
+    'video': ('video', _warm_video),
+}
+
+WARMUP_ENABLED = bool(_WARM_CFG.get('enabled', False))
+WARMUP_COMPONENTS: list[str] = list(_WARM_CFG.get('components') or COMPONENTS)
+
+
+def components_for(kinds: Iterable[str], names: Iterable[str] | None = None) -> list[str]:
+    """`names`（默认取配置）中属于 `kinds` 这几种模态的组件。"""
+    kinds = set(kinds)
+    # 未知的组件名原样保留，交给 Warmup 报错
+    return [n for n in (WARMUP_COMPONENTS if names is None else names)
+            if n not in COMPONENTS or COMPONENTS[n][0] in kinds]
+
+
+class Warmup:
+    """依次预热一组组件，并记录各组件的状态。
+
+    Parameters
+    ----------
+    components : list of str
+        要预热的组件名，见 `COMPONENTS`。为空时视为已就绪。
+    """
+
+    def __init__(self, components: Iterable[str] = ()):
+        names = list(components)
+        unknown = [n for n in names if n not in COMPONENTS]
+        if unknown:
+            raise ValueError(f'未知的预热组件：{unknown}（可选：{list(COMPONENTS)}）')
+        self._lock = threading.Lock()
+        self._state: dict[str, dict] = {n: {'status': 'pending'} for n in names}
+
+    def _set(self, name: str, **fields) -> None:
+        with self._lock:
+            self._state[name].update(fields)
+
+    def run(self) -> bool:
+        """在当前线程里依次预热；某个组件失败不影响后面的，返回是否全部成功。"""
+        for name in list(self._state):
+            start = time.time()
+            self._set(name, status='running', started_at=start)
+            try:
+                COMPONENTS[name][1]()
+            except Exception as e:  # noqa: BLE001 - 记下错误，由 /readyz 报告
+                logger.exception('预热 %s 失败', name)
+                self._set(name, status='error', error=str(e), seconds=round(time.time() - start, 3))
+            else:
+                self._set(name, status='ready', seconds=round(time.time() - start, 3))
+                logger.info('%s 就绪，用时 %.1fs', name, time.time() - start)
+        return self.ready
+
+    def start(self) -> None:
+        """在后台线程里预热，立即返回。"""
+        if self._state:
+            threading.Thread(target=self.run, name='sjt-warmup', daemon=True).start()
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return all(s['status'] == 'ready' for s in self._state.values())
+
+    def status(self) -> dict:
+        """`{'ready': bool, 'components': {名称: 状态}}`，状态为 pending / running / ready / error。"""
+        with self._lock:
+            components = {n: dict(s) for n, s in self._state.items()}
+        return {
+            'ready': all(s['status'] == 'ready' for s in components.values()),
+            'components': components,
+        }
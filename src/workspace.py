@@ -0,0 +1,115 @@
+"""每个任务独立的输出目录（工作区）与产物清单 `manifest.json`。
+
+过去所有任务都写进平铺的 `outputs/`，视频任务再按扩展名逐个探测、三次 glob
+`{basename}_*.mp4` 来找自己的产物：目录越大越慢，两个同 basename 的任务（同一
+trait/item 重新生成）还会互相覆盖、把对方的文件算成自己的。现在每个任务写进
+`outputs/tasks/<task_id>/`，结束时写一份清单，列出工作区里的每个产物（相对
+`outputs/` 的路径、类型、大小、sha256）；接口返回的文件列表都取自清单。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+WORKSPACES_DIR = 'tasks'
+MANIFEST_NAME = 'manifest.json'
+
+# 扩展名 -> 产物类型
+ARTIFACT_KINDS = {
+    '.png': 'image',
+    '.jpg': 'image',
+    '.jpeg': 'image',
+    '.webp': 'image',
+    '.mp4': 'video',
+    '.avi': 'video',
+    '.mov': 'video',
+    '.webm': 'video',
+    '.wav': 'audio',
+    '.mp3': 'audio',
+    '.json': 'data',
+    '.pkl': 'data',
+}
+
+
+def _sha256(path: Path) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+def workspace_dir(outdir, task_id: str) -> Path:
+    """任务 `task_id` 的工作区目录（不保证存在）。"""
+    return Path(outdir) / WORKSPACES_DIR / task_id
+
+
+def load_manifest(outdir, task_id: str) -> dict | None:
+    """读任务的产物清单；任务没有工作区或还没写清单时返回 None。"""
+    try:
+        with open(workspace_dir(outdir, task_id) / MANIFEST_NAME, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+class Workspace:
+    """一个任务的输出目录。
+
+    Parameters
+    ----------
+    outdir : str or Path
+        输出根目录（`/outputs/` 对应的目录）；清单里的路径都相对于它。
+    task_id : str
+        任务 ID，工作区即 `outdir/tasks/<task_id>/`。
+    """
+
+    def __init__(self, outdir, task_id: str):
+        self.outdir = Path(outdir)
+        self.task_id = task_id
+        self.path = workspace_dir(outdir, task_id)
+
+    def create(self) -> Path:
+        """清空并重建工作区，返回目录；整题重试时上一次尝试的残留不会混进清单。"""
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.path.mkdir(parents=True, exist_ok=True)
+        return self.path
+
+    def rel(self, name) -> str:
+        """工作区里的文件 `name` 相对输出根目录的路径（即 `/outputs/` 下的 URL 路径）。"""
+        return (self.path / name).relative_to(self.outdir).as_posix()
+
+    def write_manifest(self, **meta) -> dict:
+        """扫描工作区，写出 `manifest.json` 并返回其内容。
+
+        `meta`（如 `kind`、`spec`）原样记进清单。清单按路径排序，每个产物为
+        `{'path', 'kind', 'size', 'sha256'}`。
+        """
+        artifacts = []
+        for path in sorted(self.path.rglob('*')):
+            if not path.is_file() or path.name == MANIFEST_NAME or path.name.endswith('.tmp'):
+                continue
+            artifacts.append({
+                'path': path.relative_to(self.outdir).as_posix(),
+                'kind': ARTIFACT_KINDS.get(path.suffix.lower(), 'other'),
+                'size': path.stat().st_size,
+                'sha256': _sha256(path),
+            })
+        manifest = {
+            'task_id': self.task_id,
+            **meta,
+            'workspace': self.path.relative_to(self.outdir).as_posix(),
+            'created_at': time.time(),
+            'artifacts': artifacts,
+        }
+        tmp = self.path / f'{MANIFEST_NAME}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2, default=str)
+        os.replace(tmp, self.path / MANIFEST_NAME)
+        return manifest
+
+
+def artifact_paths(manifest: dict, kind: str) -> list[str]:
+    """清单里 `kind` 类型产物的路径（相对输出根目录）。"""
+    return [a['path'] for a in manifest['artifacts'] if a['kind'] == kind]
@@ -64,7 +64,9 @@ const utils = {
 //
 // Generation runs on the server as a background task. The page only holds a
 // task id (kept in localStorage), so navigating away, reloading, or coming back
-// later never kills the job — we just resume polling where we left off.
+// later never kills the job — we just resume following it where we left off.
+// Progress is pushed over Server-Sent Events; polling is only the fallback for
+// browsers/proxies where the stream is unavailable.
 const SJTTasks = {
     POLL_INTERVAL: 2000,
 
@@ -84,14 +86,64 @@ const SJTTasks = {
         try { localStorage.removeItem(this.storageKey(kind)); } catch (e) {}
     },
 
+    // Stable per-browser id: the server round-robins queued work between
+    // clients, so one tab's bulk jobs cannot crowd out everyone else's.
+    clientId: function() {
+        try {
+            let id = localStorage.getItem('sjt_client_id');
+            if (!id) {
+                id = Math.random().toString(36).slice(2) + Date.now().toString(36);
+                localStorage.setItem('sjt_client_id', id);
+            }
+            return id;
+        } catch (e) {
+            return '';
+        }
+    },
+
+    // One-line progress summary: queue position, current stage, retries.
+    describe: function(task) {
+        const estimate = task.estimate;
+        if (task.status === 'queued') {
+            const queued = task.queue_position ? `排队第 ${task.queue_position} 位` : '排队中';
+            return estimate ? `${queued}，${SJTTasks.eta(estimate.start_in)}开始` : queued;
+        }
+        const parts = [];
+        const progress = task.progress;
+        if (progress && progress.counts) {
+            // Batch parent: index counts finished children.
+            parts.push(`已完成 ${progress.index}/${progress.total}`);
+        } else if (progress && progress.stage) {
+            let stage = progress.stage;
+            if (progress.total) stage += `（${progress.index + 1}/${progress.total}）`;
+            if (progress.percent != null && progress.percent < 100) stage += ` ${Math.round(progress.percent)}%`;
+            parts.push(stage);
+        }
+        if (task.attempt > 1) parts.push(`重试 ${task.attempt}/${task.attempts}`);
+        if (estimate && estimate.finish_in > 0) parts.push(`${SJTTasks.eta(estimate.finish_in)}完成`);
+        return parts.join('，');
+    },
+
+    // Rough wording for an estimate in seconds (from the server's admission control).
+    eta: function(seconds) {
+        if (seconds < 60) return '预计马上';
+        return `预计 ${Math.round(seconds / 60)} 分钟后`;
+    },
+
+    isActive: function(task) {
+        // Queued tasks are waiting for a free worker; both count as in progress.
+        return task.status === 'queued' || task.status === 'running';
+    },
+
     // handlers: { onRunning, onDone, onError, onIdle }
     attach: function(options) {
         const kind = options.kind;
         const endpoint = options.endpoint;
         const handlers = options;
         let timer = null;
+        let source = null;
         // True while we are following a task that was started before this page
-        // was loaded, so the "resumed" wording stays put across polls.
+        // was loaded, so the "resumed" wording stays put across updates.
         let resumed = false;
 
         function stopPolling() {
@@ -99,13 +151,40 @@ const SJTTasks = {
                 clearInterval(timer);
                 timer = null;
             }
+            if (source) {
+                source.close();
+                source = null;
+            }
         }
 
         function finish(taskId) {
             stopPolling();
             SJTTasks.forget(kind);
-            // Let the server drop it so it stops showing in the running list.
-            fetch(`/api/task/${taskId}`, { method: 'DELETE' }).catch(() => {});
+            // The record is left on the server: identical submissions from
+            // other tabs/users may be attached to the same task, and finished
+            // tasks are cleaned up by the server's retention policy.
+        }
+
+        function idle() {
+            // Server restarted or the task was already consumed.
+            stopPolling();
+            SJTTasks.forget(kind);
+            if (handlers.onIdle) handlers.onIdle();
+        }
+
+        function handle(taskId, task) {
+            if (SJTTasks.isActive(task)) {
+                if (handlers.onRunning) handlers.onRunning(task, resumed);
+                return;
+            }
+
+            finish(taskId);
+
+            if (task.status === 'done') {
+                if (handlers.onDone) handlers.onDone(task.result, task);
+            } else {
+                if (handlers.onError) handlers.onError(task.error || '生成失败', task);
+            }
         }
 
         async function check(taskId) {
@@ -119,34 +198,46 @@ const SJTTasks = {
             }
 
             if (response.status === 404) {
-                // Server restarted or the task was already consumed.
-                stopPolling();
-                SJTTasks.forget(kind);
-                if (handlers.onIdle) handlers.onIdle();
+                idle();
                 return;
             }
 
-            const task = await response.json();
-
-            if (task.status === 'running') {
-                if (handlers.onRunning) handlers.onRunning(task, resumed);
-                return;
-            }
-
-            finish(taskId);
+            handle(taskId, await response.json());
+        }
 
-            if (task.status === 'done') {
-                if (handlers.onDone) handlers.onDone(task.result, task);
-            } else {
-                if (handlers.onError) handlers.onError(task.error || '生成失败', task);
-            }
+        function poll(taskId) {
+            check(taskId);
+            timer = setInterval(() => check(taskId), SJTTasks.POLL_INTERVAL);
         }
 
         function watch(taskId, isResume) {
             stopPolling();
             resumed = isResume;
-            check(taskId);
-            timer = setInterval(() => check(taskId), SJTTasks.POLL_INTERVAL);
+
+            if (!window.EventSource) {
+                poll(taskId);
+                return;
+            }
+
+            const stream = new EventSource(`/api/task/${taskId}/events`);
+            source = stream;
+            stream.addEventListener('task', (event) => handle(taskId, JSON.parse(event.data)));
+            stream.addEventListener('end', () => {
+                // The stream closes after the final state; if that never reached
+                // us (e.g. the task was deleted), settle it with one plain fetch.
+                if (source === stream) {
+                    stopPolling();
+                    check(taskId);
+                }
+            });
+            stream.onerror = () => {
+                // CONNECTING means the browser is already reconnecting; CLOSED
+                // means the stream is unavailable (404, no SSE support upstream).
+                if (source === stream && stream.readyState === EventSource.CLOSED) {
+                    source = null;
+                    poll(taskId);
+                }
+            };
         }
 
         return {
@@ -158,9 +249,16 @@ const SJTTasks = {
             },
 
             start: async function(payload) {
+                const headers = {
+                    'Content-Type': 'application/json',
+                    // Clicked in the page: jump ahead of batch/API work.
+                    'X-Priority': 'interactive'
+                };
+                const clientId = SJTTasks.clientId();
+                if (clientId) headers['X-Client-Id'] = clientId;
                 const response = await fetch(endpoint, {
                     method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
+                    headers: headers,
                     body: JSON.stringify(payload)
                 });
                 const data = await response.json();
@@ -174,6 +272,14 @@ const SJTTasks = {
                 return data.task_id;
             },
 
+            // Ask the server to stop the task. The stream then reports the
+            // final `cancelled` state like any other ending (via onError).
+            cancel: async function() {
+                const taskId = SJTTasks.recall(kind);
+                if (!taskId) return;
+                await fetch(`/api/task/${taskId}`, { method: 'DELETE' });
+            },
+
             stopPolling: stopPolling
         };
     }
@@ -184,31 +290,70 @@ document.addEventListener('DOMContentLoaded', function() {
     const banner = document.getElementById('running-tasks-banner');
     if (!banner) return;
 
+    const active = new Map();
+
+    function render() {
+        const tasks = Array.from(active.values())
+            .sort((a, b) => b.created_at - a.created_at);
+
+        if (tasks.length === 0) {
+            banner.style.display = 'none';
+            return;
+        }
+
+        // 失败会自动重跑、并发满了会排队，都标出来免得用户以为卡住了
+        const names = tasks.map(t => {
+            const detail = SJTTasks.describe(t);
+            return detail ? `${t.label}（${detail}）` : t.label;
+        }).join('、');
+        banner.innerHTML = `<span class="running-tasks-dot"></span>
+            <span>${tasks.length} 个任务正在后台生成：${names}（可自由切换页面，结果不会丢失）</span>`;
+        banner.style.display = 'flex';
+    }
+
+    function reset(tasks) {
+        active.clear();
+        tasks.forEach(t => active.set(t.task_id, t));
+        render();
+    }
+
     async function refresh() {
         try {
-            const response = await fetch('/api/tasks?status=running');
+            const response = await fetch('/api/tasks?status=queued,running');
             const data = await response.json();
-            const tasks = data.tasks || [];
-
-            if (tasks.length === 0) {
-                banner.style.display = 'none';
-                return;
-            }
-
-            // 失败会自动重跑，标出来免得用户以为卡住了
-            const names = tasks.map(t => (
-                t.attempt > 1 ? `${t.label}（重试 ${t.attempt}/${t.attempts}）` : t.label
-            )).join('、');
-            banner.innerHTML = `<span class="running-tasks-dot"></span>
-                <span>${tasks.length} 个任务正在后台生成：${names}（可自由切换页面，结果不会丢失）</span>`;
-            banner.style.display = 'flex';
+            reset(data.tasks || []);
         } catch (error) {
             banner.style.display = 'none';
         }
     }
 
-    refresh();
-    setInterval(refresh, 5000);
+    function poll() {
+        refresh();
+        setInterval(refresh, 5000);
+    }
+
+    if (!window.EventSource) {
+        poll();
+        return;
+    }
+
+    const stream = new EventSource('/api/tasks/events?status=queued,running');
+    // Sent on every (re)connect, so a dropped stream resyncs by itself.
+    stream.addEventListener('snapshot', (event) => reset(JSON.parse(event.data).tasks || []));
+    stream.addEventListener('task', (event) => {
+        const task = JSON.parse(event.data);
+        // Batch children are summarised by their parent.
+        if (task.parent_id) return;
+        if (SJTTasks.isActive(task)) {
+            active.set(task.task_id, task);
+        } else {
+            active.delete(task.task_id);
+        }
+        render();
+    });
+    stream.onerror = () => {
+        if (stream.readyState === EventSource.CLOSED) poll();
+    };
 });
 
 // Highlight active navigation link
@@ -0,0 +1,172 @@
+"""生成工作进程：从共享任务库认领任务并执行。
+
+需要在 config.yaml 里设 `queue.backend: sqlite`：网页进程（app.py）只负责排队，
+任务由一个或多个工作进程来跑，图像/视频的吞吐不再受限于一个解释器。也可以在
+多台机器上各跑几个（任务库与 outputs/ 需放在各机器都能访问的存储上）::
+
+    uv run python worker.py                          # 认领所有模态，并发数取 scheduler.workers
+    uv run python worker.py --kinds image,video      # 只跑图像和视频
+    uv run python worker.py --workers image=1,video=3
+"""
+import argparse
+import logging
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+from src.cancel import CancelToken  # noqa: E402 - .env 需先于各模型客户端加载
+from src.job_queue import (HEARTBEAT_INTERVAL, POLL_INTERVAL, QUEUE_BACKEND,  # noqa: E402
+                           SQLiteJobQueue, new_worker_id)
+from src.jobs import JOB_BUILDERS, build_job, outdir  # noqa: E402
+from src.metrics import MetricsStore  # noqa: E402
+from src.result_cache import ResultCache  # noqa: E402
+from src.scheduler import DEFAULT_WORKERS, WORKER_LIMITS  # noqa: E402
+from src.task_logs import TaskLogs, bind, setup_logging  # noqa: E402
+from src.task_runner import TaskRunner  # noqa: E402
+from src.task_store import TaskStore  # noqa: E402
+from src.warmup import WARMUP_ENABLED, Warmup, components_for  # noqa: E402
+
+logger = logging.getLogger('worker')
+
+
+class Worker:
+    """按 `capacity`（模态 -> 并发数）开工作线程，循环认领并执行任务。"""
+
+    def __init__(self, queue, runner, capacity, worker_id=None):
+        self.queue = queue
+        self.runner = runner
+        self.capacity = dict(capacity)
+        self.worker_id = worker_id or new_worker_id()
+        self._lock = threading.Lock()
+        self._tokens = {}  # 正在执行的任务 -> CancelToken
+        self._stop = threading.Event()
+
+    def _execute(self, task):
+        task_id = task['task_id']
+        token = CancelToken()
+        with self._lock:
+            self._tokens[task_id] = token
+        try:
+            try:
+                _, job, _ = build_job(task['kind'], task.get('params') or {})
+            except Exception as e:  # noqa: BLE001 - 参数在排队期间失效（如数据包被替换）
+                with bind(task_id):
+                    logger.exception('无法构造任务 %s', task['label'])
+                self.runner.update(task_id, status='error', error=f'无法构造任务：{e}',
+                                   finished_at=time.time())
+                if task.get('parent_id'):
+                    self.runner.refresh_batch(task['parent_id'])
+                return
+            self.runner.run(task_id, job, token)
+        finally:
+            with self._lock:
+                self._tokens.pop(task_id, None)
+
+    def _slot(self, kind):
+        while not self._stop.is_set():
+            try:
+                task = self.queue.claim(kind, self.worker_id)
+            except Exception:  # noqa: BLE001 - 库被锁住等，稍后再试
+                logger.exception('认领 %s 任务失败', kind)
+                task = None
+            if task is None:
+                self._stop.wait(POLL_INTERVAL)
+                continue
+            logger.info('%s 认领 %s（%s）', self.worker_id, task['label'], task['task_id'])
+            self._execute(task)
+
+    def _beat(self):
+        with self._lock:
+            running = list(self._tokens)
+        for task_id, reason in self.queue.heartbeat(self.worker_id, self.capacity, running).items():
+            with self._lock:
+                token = self._tokens.get(task_id)
+            if token is not None:
+                token.cancel(reason)
+
+    def _heartbeat(self):
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                self._beat()
+            except Exception:  # noqa: BLE001
+                logger.exception('心跳失败')
+
+    def run(self):
+        self._beat()
+        threads = [threading.Thread(target=self._heartbeat, name='sjt-heartbeat', daemon=True)]
+        for kind, n in self.capacity.items():
+            for i in range(n):
+                threads.append(threading.Thread(
+                    target=self._slot, args=(kind,), name=f'sjt-{kind}-{i}', daemon=True))
+        for thread in threads:
+            thread.start()
+        logger.info('%s 已启动，并发：%s', self.worker_id, self.capacity)
+        try:
+            while any(t.is_alive() for t in threads[1:]):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            logger.info('%s 正在退出，取消进行中的任务...', self.worker_id)
+        finally:
+            self._stop.set()
+            with self._lock:
+                tokens = list(self._tokens.values())
+            for token in tokens:
+                token.cancel('工作进程退出，任务被取消')
+            for thread in threads[1:]:
+                thread.join(timeout=30)
+            self.queue.unregister(self.worker_id)
+
+
+def _parse_workers(spec):
+    capacity = {}
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        kind, _, n = part.partition('=')
+        capacity[kind.strip()] = int(n)
+    return capacity
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run generation jobs from the shared task queue.')
+    parser.add_argument('--kinds', default=','.join(JOB_BUILDERS),
+                        help='comma-separated modalities to run (default: all)')
+    parser.add_argument('--workers', default='',
+                        help='per-modality concurrency, e.g. image=1,video=3 '
+                             '(default: scheduler.workers in config.yaml)')
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    if QUEUE_BACKEND != 'sqlite':
+        # 本地后端下网页进程自己跑任务，工作进程再来认领就会重复执行
+        sys.exit("worker.py 需要 config.yaml 中 queue.backend: sqlite")
+
+    kinds = [k.strip() for k in args.kinds.split(',') if k.strip()]
+    unknown = [k for k in kinds if k not in JOB_BUILDERS]
+    if unknown:
+        parser.error(f'unknown kinds: {unknown}')
+    overrides = _parse_workers(args.workers)
+    capacity = {k: max(1, overrides.get(k, WORKER_LIMITS.get(k, DEFAULT_WORKERS))) for k in kinds}
+
+    if WARMUP_ENABLED:
+        # 先热好再认领，头几个任务不用自己付模型加载的时间
+        Warmup(components_for(kinds)).run()
+    store = TaskStore()
+    runner = TaskRunner(store, outdir, cache=ResultCache(store, outdir))
+    # 本进程的阶段耗时、重试、LLM 调用等指标定期并入任务库，由网页进程的 /metrics 输出
+    metrics_store = MetricsStore(store)
+    metrics_store.start()
+    # 任务日志同样定期写进任务库，由网页进程的 /api/task/<id>/logs 返回
+    task_logs = TaskLogs(store)
+    task_logs.start()
+    try:
+        Worker(SQLiteJobQueue(store), runner, capacity).run()
+    finally:
+        metrics_store.stop()
+        task_logs.stop()
+
+
+if __name__ == '__main__':
+    main()